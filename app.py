@@ -4,26 +4,33 @@ from datetime import datetime
 from helper import (
     generate_sql_cached,
     run_sql_cached,
-    generate_plotly_code_cached,
-    generate_plot_cached,
-    should_generate_chart_cached,
-    generate_summary_cached
+    is_sql_valid_cached,
+    start_chart,
+    chart_result,
+    stream_summary_cached
 )
+from result_window import window_caption, has_next_page
+from chat_history import ChatHistory
+from sql_backends import SQL_BACKEND, BACKENDS
 
 # --- Session Setup ---
+# Caches are shared by all sessions and expire per namespace (see cache_policy), so a
+# new session must not clear them
 if 'session_id' not in st.session_state:
     st.session_state['session_id'] = datetime.now().timestamp()
-    st.cache_data.clear()
 
 # Initialize State Variables
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "history" not in st.session_state:
+    st.session_state.history = ChatHistory(st.session_state['session_id'])
+history = st.session_state.history
 if "active_df" not in st.session_state:
     st.session_state.active_df = None  
 if "active_sql" not in st.session_state:
     st.session_state.active_sql = None
 if "active_question" not in st.session_state:
     st.session_state.active_question = None
+if "active_page" not in st.session_state:
+    st.session_state.active_page = 0
 
 # Config Flags
 if "show_sql" not in st.session_state: st.session_state["show_sql"] = True
@@ -31,6 +38,7 @@ if "show_table" not in st.session_state: st.session_state["show_table"] = True
 if "show_plotly_code" not in st.session_state: st.session_state["show_plotly_code"] = False
 if "show_chart" not in st.session_state: st.session_state["show_chart"] = True
 if "show_summary" not in st.session_state: st.session_state["show_summary"] = True
+if "sql_backend" not in st.session_state: st.session_state["sql_backend"] = SQL_BACKEND
 
 USER_AVATAR = "🧑‍💻"
 BOT_AVATAR = "🤖"
@@ -43,13 +51,18 @@ try:
 except FileNotFoundError:
     pass
 st.header("Statspeak")
+st.sidebar.selectbox("Query engine", list(BACKENDS), key="sql_backend",
+                     help="sqlserver runs queries on the database; local answers them from a periodically refreshed snapshot")
 
 st.chat_message("assistant", avatar=BOT_AVATAR).write(
     "Hi there! I'm your Virtual Assistant. I can assist you with your business inquiries."
 )
 
 # --- 1. DISPLAY HISTORY ---
-for message in st.session_state.messages:
+# Only the latest turns load their tables and charts; older ones stay collapsed until
+# asked for, so a rerun costs the same however long the conversation gets.
+recent = history.recent_indices()
+for index, message in enumerate(history.messages):
     avatar = USER_AVATAR if message["role"] == "user" else BOT_AVATAR
     with st.chat_message(message["role"], avatar=avatar):
         content = message["content"]
@@ -57,16 +70,22 @@ for message in st.session_state.messages:
             # 1. SQL
             if st.session_state["show_sql"] and content.get("sql"):
                 st.code(content["sql"], language="sql")
-            # 2. Table
-            if st.session_state["show_table"]:
-                df_hist = content.get("df")
-                if df_hist is not None:
-                    st.dataframe(df_hist)
-            # 3. Chart (Displayed BEFORE Summary)
-            if st.session_state["show_chart"]:
-                chart_hist = content.get("chart")
-                if chart_hist:
-                    st.plotly_chart(chart_hist)
+            if content.get("error"):
+                st.error(content["error"])
+            has_details = content.get("df_ref") or content.get("chart_ref")
+            if has_details and (index in recent or st.toggle("Show table and chart", key=f"history_details_{index}")):
+                # 2. Table
+                if st.session_state["show_table"]:
+                    df_hist = history.get_frame(message)
+                    if df_hist is not None:
+                        st.dataframe(df_hist)
+                        if content.get("caption"):
+                            st.caption(content["caption"])
+                # 3. Chart (Displayed BEFORE Summary)
+                if st.session_state["show_chart"]:
+                    chart_hist = history.get_figure(message)
+                    if chart_hist:
+                        st.plotly_chart(chart_hist, key=f"history_chart_{index}")
             # 4. Summary (Displayed LAST)
             if st.session_state["show_summary"]:
                 summary_hist = content.get("summary")
@@ -79,6 +98,24 @@ for message in st.session_state.messages:
 # This runs if we have a DataFrame waiting for user input
 if st.session_state.active_df is not None:
     with st.chat_message("assistant", avatar=BOT_AVATAR):
+        # Page through large results without loading them all
+        page = st.session_state.active_page
+        prev_col, next_col, _ = st.columns([1, 1, 6])
+        new_page = None
+        if page > 0 and prev_col.button("Previous page"):
+            new_page = page - 1
+        if isinstance(st.session_state.active_df, pd.DataFrame) and has_next_page(st.session_state.active_df) and next_col.button("Next page"):
+            new_page = page + 1
+        if new_page is not None:
+            page_df = run_sql_cached(sql=st.session_state.active_sql, page=new_page, backend=st.session_state["sql_backend"])
+            if not isinstance(page_df, str):
+                st.session_state.active_df = page_df
+                st.session_state.active_page = new_page
+                last_msg_index = history.last_assistant_index()
+                if last_msg_index is not None:
+                    history.set_frame(last_msg_index, page_df, caption=window_caption(page_df))
+                st.rerun()
+
         st.write("Data retrieved. Would you like to visualize this?")
         
         col1, col2 = st.columns([1, 4])
@@ -106,27 +143,33 @@ if st.session_state.active_df is not None:
                         sql = st.session_state.active_sql
                         orig_q = st.session_state.active_question
 
-                        code = generate_plotly_code_cached(
-                            chart_query=chart_query,
-                            question=orig_q,
-                            sql=sql,
-                            df=df
-                        )
-                        fig = generate_plot_cached(code=code, df=df)
-                        summary = generate_summary_cached(question=orig_q, df=df) if st.session_state["show_summary"] else None
-
-                        # Show chart and summary immediately
-                        if fig:
-                            st.plotly_chart(fig)
-                        if summary:
-                            st.write(summary)
+                        # The summary does not depend on the chart: build the chart in the
+                        # background while the summary streams in, and show each as soon as it is ready
+                        chart_slot = st.empty()
+                        summary_slot = st.empty()
+                        chart_future = start_chart(chart_query, orig_q, sql, df)
+                        fig, summary, chart_shown = None, None, False
+
+                        if st.session_state["show_summary"]:
+                            summary = ""
+                            for chunk in stream_summary_cached(question=orig_q, df=df):
+                                summary += chunk
+                                summary_slot.markdown(summary)
+                                if not chart_shown and chart_future.done():
+                                    fig, chart_shown = chart_result(chart_future), True
+                                    if fig:
+                                        chart_slot.plotly_chart(fig)
+                        if not chart_shown:
+                            fig = chart_result(chart_future)
+                            if fig:
+                                chart_slot.plotly_chart(fig)
 
                         # Update history for future display
-                        last_msg_index = len(st.session_state.messages) - 1
-                        if last_msg_index >= 0:
-                            st.session_state.messages[last_msg_index]["content"]["chart"] = fig
+                        last_msg_index = history.last_assistant_index()
+                        if last_msg_index is not None:
+                            history.set_chart(last_msg_index, fig)
                             if summary:
-                                st.session_state.messages[last_msg_index]["content"]["summary"] = summary
+                                history.set_summary(last_msg_index, summary)
 
                         # Now clear state and rerun if you want to reset UI
                         st.session_state.active_df = None
@@ -139,13 +182,13 @@ if st.session_state.active_df is not None:
                     df = st.session_state.active_df
                     orig_q = st.session_state.active_question
                     
-                    last_msg_index = len(st.session_state.messages) - 1
-                    if last_msg_index >= 0:
+                    last_msg_index = history.last_assistant_index()
+                    if last_msg_index is not None:
                         # Generate Summary (Since they skipped the chart)
                         if st.session_state["show_summary"]:
-                            summary = generate_summary_cached(question=orig_q, df=df)
+                            summary = st.write_stream(stream_summary_cached(question=orig_q, df=df))
                             if summary:
-                                st.session_state.messages[last_msg_index]["content"]["summary"] = summary
+                                history.set_summary(last_msg_index, summary)
                     
                     # Clear State & Refresh
                     st.session_state.active_df = None
@@ -156,37 +199,47 @@ if my_question := st.chat_input("Ask me a question"):
     # Clear old active state if user starts over
     st.session_state.active_df = None 
     
-    st.session_state.messages.append({"role": "user", "content": my_question})
+    history.add_user(my_question)
     with st.chat_message("user", avatar=USER_AVATAR):
         st.write(my_question)
 
     with st.chat_message("assistant", avatar=BOT_AVATAR):
         with st.spinner("Analyzing..."):
-            temp_response = {}
             try:
                 # 1. Generate SQL
                 sql = generate_sql_cached(question=my_question)
-                if sql:
-                    temp_response["sql"] = sql
+                if sql and not is_sql_valid_cached(sql=sql):
+                    # Validation (and its repair round) failed: report it instead of querying the database
+                    error = sql if sql.startswith("Error") else "Error in generated SQL. Please try again."
+                    st.error(error)
+                    history.add_assistant(df=error)
+                elif sql:
                     if st.session_state["show_sql"]:
                         st.code(sql, language="sql")
 
                     # 2. Run SQL
-                    df = run_sql_cached(sql=sql)
-                    if df is not None:
-                        temp_response["df"] = df
+                    df = run_sql_cached(sql=sql, backend=st.session_state["sql_backend"])
+                    if isinstance(df, str):
+                        # run_sql reports database errors as text
+                        st.error(df)
+                        history.add_assistant(sql=sql, df=df)
+                    elif df is not None:
+                        caption = window_caption(df) if isinstance(df, pd.DataFrame) else None
                         if st.session_state["show_table"]:
                             st.dataframe(df)
+                            if caption:
+                                st.caption(caption)
 
                         # NOTE: WE DO NOT GENERATE SUMMARY HERE ANYMORE
                         
-                        # Save partial response to history
-                        st.session_state.messages.append({"role": "assistant", "content": temp_response})
+                        # Save partial response to history (the frame itself goes to the history store)
+                        history.add_assistant(sql=sql, df=df, caption=caption)
                         
                         # Set Active State to trigger Interaction Block
                         st.session_state.active_df = df
                         st.session_state.active_sql = sql
                         st.session_state.active_question = my_question
+                        st.session_state.active_page = 0
                         
                         st.rerun() 
                     else:
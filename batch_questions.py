@@ -0,0 +1,181 @@
+"""
+Batch mode: generate and run SQL for a file of questions.
+
+    python batch_questions.py questions.txt -o answers.parquet
+
+The questions file is plain text (one question per line), a JSON list of strings
+or of {"question": ...} objects, or a CSV with a `question` column. Each question
+goes through retrieval -> prompt building -> LLM (with the app's validation and
+repair) -> run_sql; every stage has its own concurrency limit and retries with
+exponential backoff. Validation and repair run once: only the retrieval, LLM
+and database calls are retried. run_sql returns the first page of each result;
+`total_rows` and `is_partial` record how much of it `result_json` holds.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from result_window import is_partial
+
+# --- Configuration ---
+STAGE_CONCURRENCY = {
+    "retrieval": 8,
+    "llm": 4,
+    "sql": 4,
+}
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 1.0  # seconds, doubled after every failed attempt
+
+
+class PermanentError(Exception):
+    """
+    A failure that retrying cannot fix, e.g. SQL that fails validation.
+    """
+
+
+def with_retry(fn, *args, attempts=MAX_ATTEMPTS, backoff=BACKOFF_BASE, **kwargs):
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn(*args, **kwargs)
+        except PermanentError:
+            raise
+        except Exception:
+            if attempt == attempts:
+                raise
+            time.sleep(backoff * 2 ** (attempt - 1) * (1 + random.random() * 0.25))
+
+
+def load_questions(file_path: str) -> list:
+    if file_path.endswith(".csv"):
+        return pd.read_csv(file_path)["question"].dropna().astype(str).tolist()
+    with open(file_path, 'r') as f:
+        if file_path.endswith(".json"):
+            items = json.load(f)
+            return [item["question"] if isinstance(item, dict) else str(item) for item in items]
+        return [line.strip() for line in f if line.strip()]
+
+
+class BatchRunner:
+    """
+    Runs the question pipeline for many questions at once. Stages share one
+    thread pool; a semaphore per stage caps how many questions are in that stage.
+    """
+    def __init__(self, concurrency=None, attempts=MAX_ATTEMPTS, backoff=BACKOFF_BASE, execute=True):
+        self.concurrency = dict(STAGE_CONCURRENCY, **(concurrency or {}))
+        self.attempts = attempts
+        self.backoff = backoff
+        self.execute = execute
+        self._limits = {stage: threading.BoundedSemaphore(n) for stage, n in self.concurrency.items()}
+        self._question_sql_list = None
+        self._llm = None
+
+    def _stage(self, stage, timings, fn, *args):
+        with self._limits[stage]:
+            start = time.perf_counter()
+            try:
+                return with_retry(fn, *args, attempts=self.attempts, backoff=self.backoff)
+            finally:
+                timings[f"{stage}_s"] = timings.get(f"{stage}_s", 0.0) + time.perf_counter() - start
+
+    def _run_query(self, sql):
+        from sql_generation import run_sql
+        df = run_sql(sql)
+        if isinstance(df, str):
+            # run_sql reports errors as strings; only database errors are worth retrying
+            if df.startswith("SQL validation error"):
+                raise PermanentError(df)
+            raise RuntimeError(df)
+        return df
+
+    def _finish_sql(self, question, columns, text):
+        from sql_generation import sql_from_response
+        sql = sql_from_response(question, columns, self._question_sql_list, text, self._llm)
+        if sql.startswith("Error"):
+            # Retrying would repeat the intermediate-query and repair LLM calls for the same reply
+            raise PermanentError(sql)
+        return sql
+
+    def answer(self, question: str) -> dict:
+        from open_search import get_columns
+        from sql_generation import build_sql_prompt
+        timings = {}
+        row = {"question": question, "sql": None, "status": "ok", "error": None, "rows": None, "total_rows": None,
+               "is_partial": None, "result_json": None}
+        start = time.perf_counter()
+        try:
+            columns = self._stage("retrieval", timings, get_columns, question)
+
+            prompt_start = time.perf_counter()
+            prompt = build_sql_prompt(question, columns, self._question_sql_list)
+            timings["prompt_s"] = time.perf_counter() - prompt_start
+
+            text = self._stage("llm", timings, self._llm.submit_prompt, prompt)
+            # Same intermediate-query, extraction and validation steps as generate_sql
+            row["sql"] = self._stage("llm", timings, self._finish_sql, question, columns, text)
+
+            if self.execute:
+                df = self._stage("sql", timings, self._run_query, row["sql"])
+                row["rows"] = len(df)
+                row["total_rows"] = df.attrs.get("total_rows")
+                row["is_partial"] = is_partial(df)
+                row["result_json"] = df.to_json(orient="split", date_format="iso")
+        except Exception as e:
+            row["status"] = "error"
+            row["error"] = str(e)
+        timings["total_s"] = time.perf_counter() - start
+        row.update(timings)
+        return row
+
+    def run(self, questions: list) -> pd.DataFrame:
+        from llm_response_generator import LLMResponseGenerator
+        # None: prompts use the cached prefix that already holds the sample SQLs
+        self._question_sql_list = None
+        self._llm = LLMResponseGenerator()
+        workers = sum(self.concurrency.values())
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+            rows = list(pool.map(self.answer, questions))
+        columns = ["question", "sql", "status", "error", "rows", "total_rows", "is_partial", "result_json",
+                   "retrieval_s", "prompt_s", "llm_s", "sql_s", "total_s"]
+        return pd.DataFrame(rows).reindex(columns=columns)
+
+
+def write_results(results: pd.DataFrame, output_path: str):
+    if output_path.endswith(".feather"):
+        results.to_feather(output_path)
+    else:
+        results.to_parquet(output_path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and run SQL for a file of questions.")
+    parser.add_argument("questions", help="Questions file (.txt, .json or .csv)")
+    parser.add_argument("-o", "--output", default="batch_answers.parquet", help="Output .parquet or .feather file")
+    parser.add_argument("--retrieval-concurrency", type=int, default=STAGE_CONCURRENCY["retrieval"])
+    parser.add_argument("--llm-concurrency", type=int, default=STAGE_CONCURRENCY["llm"])
+    parser.add_argument("--sql-concurrency", type=int, default=STAGE_CONCURRENCY["sql"])
+    parser.add_argument("--attempts", type=int, default=MAX_ATTEMPTS, help="Attempts per stage before giving up")
+    parser.add_argument("--no-execute", action="store_true", help="Only generate SQL, do not run it")
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.questions)
+    runner = BatchRunner(
+        concurrency={
+            "retrieval": args.retrieval_concurrency,
+            "llm": args.llm_concurrency,
+            "sql": args.sql_concurrency,
+        },
+        attempts=args.attempts,
+        execute=not args.no_execute,
+    )
+    start = time.perf_counter()
+    results = runner.run(questions)
+    write_results(results, args.output)
+    failed = int((results["status"] != "ok").sum())
+    print(f"Answered {len(results) - failed}/{len(results)} questions in {time.perf_counter() - start:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
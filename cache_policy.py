@@ -0,0 +1,115 @@
+import functools
+import threading
+import pandas as pd
+import streamlit as st
+from result_cache import dataframe_fingerprint
+
+# --- Configuration ---
+# Per-namespace lifetime (seconds) and size limit of the st.cache_data caches.
+# Plots and summaries of query results expire quickly so numbers stay fresh;
+# generated SQL and chart code only depend on the question and schema.
+# sql_results are also dropped when the table version moves (see result_cache); the
+# TTL is a backstop for changes the version probe misses.
+CACHE_POLICIES = {
+    "sql_gen": {"ttl": 24 * 60 * 60, "max_entries": 1000},
+    "sql_results": {"ttl": 60 * 60, "max_entries": 200},
+    "plot_code": {"ttl": 24 * 60 * 60, "max_entries": 500},
+    "plots": {"ttl": 15 * 60, "max_entries": 200},
+    "summaries": {"ttl": 15 * 60, "max_entries": 200},
+}
+
+_registry = {namespace: [] for namespace in CACHE_POLICIES}  # namespace -> cached functions
+_clear_hooks = {namespace: [] for namespace in CACHE_POLICIES}
+_stats = {namespace: {"calls": 0, "misses": 0} for namespace in CACHE_POLICIES}
+_external = {namespace: [] for namespace in CACHE_POLICIES}  # namespace -> counter callables
+_lock = threading.Lock()
+
+
+def cached(namespace, show_spinner=False, on_clear=None):
+    """
+    st.cache_data with the TTL and size limit of `namespace`, plus hit/miss counting
+    and registration so the namespace can be invalidated on its own.
+    `on_clear` is called whenever the namespace is invalidated (e.g. to clear a
+    companion cache that lives outside Streamlit).
+    """
+    policy = CACHE_POLICIES[namespace]
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def counted(*args, **kwargs):
+            # Only runs when st.cache_data misses
+            with _lock:
+                _stats[namespace]["misses"] += 1
+            return fn(*args, **kwargs)
+
+        # DataFrame arguments are keyed on their fingerprint instead of hashing every row
+        cached_fn = st.cache_data(
+            ttl=policy["ttl"],
+            max_entries=policy["max_entries"],
+            show_spinner=show_spinner,
+            hash_funcs={pd.DataFrame: dataframe_fingerprint},
+        )(counted)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _lock:
+                _stats[namespace]["calls"] += 1
+            return cached_fn(*args, **kwargs)
+
+        wrapper.clear = cached_fn.clear
+        with _lock:
+            _registry[namespace].append(wrapper)
+            if on_clear is not None and on_clear not in _clear_hooks[namespace]:
+                _clear_hooks[namespace].append(on_clear)
+        return wrapper
+    return decorator
+
+
+def register_external(namespace, clear, counters):
+    """
+    Adds a cache that is not built on st.cache_data to `namespace`. `clear` empties
+    it on invalidate(); `counters()` returns its (hits, misses) for stats().
+    """
+    with _lock:
+        _clear_hooks[namespace].append(clear)
+        _external[namespace].append(counters)
+
+
+def invalidate(*namespaces):
+    """
+    Clears the given namespaces, or every namespace if none are given.
+    """
+    for namespace in namespaces or tuple(CACHE_POLICIES):
+        with _lock:
+            functions = list(_registry[namespace])
+            hooks = list(_clear_hooks[namespace])
+        for fn in functions:
+            fn.clear()
+        for hook in hooks:
+            hook()
+
+
+def stats():
+    """
+    Returns one row per namespace with its policy and hit/miss counts since startup.
+    """
+    rows = []
+    with _lock:
+        for namespace, policy in CACHE_POLICIES.items():
+            calls = _stats[namespace]["calls"]
+            misses = _stats[namespace]["misses"]
+            for counters in _external[namespace]:
+                hits, external_misses = counters()
+                calls += hits + external_misses
+                misses += external_misses
+            rows.append({
+                "namespace": namespace,
+                "functions": len(_registry[namespace]) + len(_external[namespace]),
+                "ttl_seconds": policy["ttl"],
+                "max_entries": policy["max_entries"],
+                "calls": calls,
+                "hits": calls - misses,
+                "misses": misses,
+                "hit_rate": (calls - misses) / calls if calls else 0.0,
+            })
+    return rows
@@ -0,0 +1,176 @@
+import functools
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuration ---
+MAX_ENTRIES = 500
+MAX_FAILURES = 2  # an entry that failed this often without ever succeeding is dropped and regenerated
+COMPILED_CACHE_SIZE = 256  # compiled code objects kept per process (including sandbox workers)
+
+
+@functools.lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def compile_chart_code(code: str):
+    """
+    compile()s chart code once per process; raises SyntaxError for invalid code.
+    """
+    return compile(code, "<chart_code>", "exec")
+
+
+def code_hash(code: str) -> str:
+    return hashlib.sha1(code.encode('utf-8')).hexdigest()
+
+
+def normalise_chart_query(chart_query: str) -> str:
+    return re.sub(r"\s+", " ", (chart_query or "").lower()).strip().rstrip(".!?")
+
+
+def result_schema(df) -> tuple:
+    """
+    Column names and dtypes of a result; chart code written for one result
+    runs unchanged on any other result with the same schema.
+    """
+    return tuple((str(column), str(dtype)) for column, dtype in df.dtypes.items())
+
+
+class ChartCodeCache:
+    """
+    Generated chart code keyed on the normalised chart request and the result
+    schema, not the data, so a refreshed result with the same columns reuses
+    the code. Entries are validated by compiling them, evicted least-recently-used,
+    and track how often their code ran successfully or failed.
+    """
+    def __init__(self, max_entries=MAX_ENTRIES, max_failures=MAX_FAILURES):
+        self.max_entries = max_entries
+        self.max_failures = max_failures
+        self._entries = OrderedDict()  # (query, schema) -> entry
+        self._by_hash = {}  # code hash -> key
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def _drop(self, key):
+        # Caller must hold the lock
+        entry = self._entries.pop(key)
+        if self._by_hash.get(entry["hash"]) == key:
+            del self._by_hash[entry["hash"]]
+
+    def get(self, chart_query: str, df):
+        key = (normalise_chart_query(chart_query), result_schema(df))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, chart_query: str, df, code: str):
+        """
+        Stores `code` for the request if it compiles. Returns the entry, or None if it was rejected.
+        """
+        try:
+            compiled = compile_chart_code(code)
+        except (SyntaxError, ValueError) as e:
+            print(f"Generated chart code does not compile: {e}")
+            with self._lock:
+                self.rejected += 1
+            return None
+        key = (normalise_chart_query(chart_query), result_schema(df))
+        entry = {
+            "query": key[0],
+            "columns": len(key[1]),
+            "code": code,
+            "compiled": compiled,
+            "hash": code_hash(code),
+            "successes": 0,
+            "failures": 0,
+            "last_error": None,
+            "created": time.time(),
+        }
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._by_hash[entry["hash"]] = key
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+        return entry
+
+    def get_or_generate(self, chart_query: str, df, generate):
+        """
+        Returns the cached code for the request, or calls generate() and caches
+        the code it returns if it compiles.
+        """
+        entry = self.get(chart_query, df)
+        if entry is not None:
+            return entry["code"]
+        code = generate()
+        self.put(chart_query, df, code)
+        return code
+
+    def compiled(self, code: str):
+        """
+        Compiled form of `code`: the cached code object if it came from this cache.
+        """
+        with self._lock:
+            key = self._by_hash.get(code_hash(code))
+            entry = self._entries.get(key) if key is not None else None
+        return entry["compiled"] if entry is not None else compile_chart_code(code)
+
+    def record(self, code: str, ok: bool, error: str = None):
+        """
+        Records the outcome of running `code`. Code that keeps failing and has
+        never worked is dropped so the next request generates it again.
+        """
+        with self._lock:
+            key = self._by_hash.get(code_hash(code))
+            entry = self._entries.get(key) if key is not None else None
+            if entry is None:
+                return
+            if ok:
+                entry["successes"] += 1
+                return
+            entry["failures"] += 1
+            entry["last_error"] = error
+            if entry["successes"] == 0 and entry["failures"] >= self.max_failures:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_hash.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected,
+                "successes": sum(e["successes"] for e in self._entries.values()),
+                "failures": sum(e["failures"] for e in self._entries.values()),
+            }
+
+    def entry_stats(self):
+        with self._lock:
+            return [
+                {key: entry[key] for key in ("query", "columns", "successes", "failures", "last_error")}
+                for entry in reversed(self._entries.values())
+            ]
+
+
+_chart_code_cache = None
+_chart_code_cache_lock = threading.Lock()
+
+def get_chart_code_cache():
+    global _chart_code_cache
+    with _chart_code_cache_lock:
+        if _chart_code_cache is None:
+            from cache_policy import CACHE_POLICIES
+            _chart_code_cache = ChartCodeCache(max_entries=CACHE_POLICIES["plot_code"]["max_entries"])
+        return _chart_code_cache
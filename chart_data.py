@@ -0,0 +1,258 @@
+import base64
+import warnings
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# --- Configuration ---
+MAX_POINTS = 2000  # line/scatter points per figure after downsampling (LTTB)
+MIN_POINTS_PER_TRACE = 200
+WEBGL_THRESHOLD = 1000  # scatter traces with more points are drawn with scattergl
+TOP_N = 15  # bar/pie categories kept before the rest are folded into "Other"
+MAX_BARS = 100  # categorical bar charts with more categories than this are reduced to TOP_N + "Other"
+HISTOGRAM_BINS = 50
+HISTOGRAM_THRESHOLD = 5000  # histograms over more values are pre-binned on the server
+
+OTHER_LABEL = "Other"
+
+
+# --- NumPy reductions ---
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `n_out` points of the series
+    (x sorted ascending) that best preserve its visual shape.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_end = max(next_end, next_start + 1)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # Twice the triangle area between the last chosen point, each candidate and the next bucket's mean
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.nanargmax(area)) if np.isfinite(area).any() else start
+        selected[i + 1] = a
+    return selected
+
+
+def top_n_other(labels, values, n: int = TOP_N, keep=None):
+    """
+    Sums `values` per label and keeps the `n` largest labels, folding the rest into "Other".
+    Pass `keep` to fix the kept labels instead, e.g. when they were chosen across several traces.
+    """
+    totals = pd.Series(np.asarray(values, dtype=np.float64)).groupby(np.asarray(labels, dtype=object), sort=False).sum()
+    if keep is None:
+        if len(totals) <= n:
+            return totals.index.to_numpy(), totals.to_numpy()
+        keep = totals.nlargest(n).index
+    top = totals.reindex([label for label in keep if label in totals.index])
+    if len(top) == len(totals):
+        return top.index.to_numpy(), top.to_numpy()
+    rest = totals.drop(top.index).sum()
+    return np.append(top.index.to_numpy(), OTHER_LABEL), np.append(top.to_numpy(), rest)
+
+
+def histogram_bins(values, bins: int = HISTOGRAM_BINS):
+    """
+    Returns (bin centres, counts, bin widths) for the finite values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    counts, edges = np.histogram(values[np.isfinite(values)], bins=bins)
+    return (edges[:-1] + edges[1:]) / 2, counts, np.diff(edges)
+
+
+# --- DataFrame reductions (before building a figure) ---
+def _numeric_axis(series: pd.Series) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.astype('int64').to_numpy(dtype=np.float64)
+    return series.to_numpy(dtype=np.float64)
+
+
+def downsample_series(df: pd.DataFrame, x: str, y: str, max_points: int = MAX_POINTS) -> pd.DataFrame:
+    """
+    Rows of `df` chosen by LTTB on (x, y), in x order. x may be numeric or datetime;
+    pass x=None to use the row order.
+    """
+    if len(df) <= max_points:
+        return df
+    ordered = df.sort_values(x) if x is not None else df
+    xs = _numeric_axis(ordered[x]) if x is not None else np.arange(len(ordered), dtype=np.float64)
+    keep = lttb_indices(xs, ordered[y].to_numpy(dtype=np.float64), max_points)
+    return ordered.iloc[keep]
+
+
+def bucket_categories(df: pd.DataFrame, category: str, value: str = None, n: int = TOP_N) -> pd.DataFrame:
+    """
+    Per-category totals of `value` (or row counts) for the top `n` categories plus "Other".
+    """
+    values = df[value] if value is not None else np.ones(len(df))
+    labels, totals = top_n_other(df[category].astype(str), values, n)
+    return pd.DataFrame({category: labels, value or "count": totals})
+
+
+# --- figure reductions (for charts built by generated code) ---
+def _as_array(value):
+    if value is None:
+        return None
+    if isinstance(value, dict) and "bdata" in value:
+        # Plotly JSON typed array
+        array = np.frombuffer(base64.b64decode(value["bdata"]), dtype=value.get("dtype", "f8"))
+        shape = value.get("shape")
+        if shape:
+            array = array.reshape([int(s) for s in str(shape).split(",")])
+        return array
+    return np.asarray(value)
+
+
+def _axis_as_numbers(values: np.ndarray):
+    if values.dtype.kind in "iuf":
+        return values.astype(np.float64)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    try:
+        return pd.to_datetime(values).to_numpy().astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    except (ValueError, TypeError):
+        return None
+
+
+def _is_categorical(labels: np.ndarray) -> bool:
+    # Labels that are neither numbers nor dates (date strings included)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return _axis_as_numbers(labels) is None
+
+
+def _subset_trace(trace: dict, keep: np.ndarray, n: int) -> dict:
+    # Apply the same row selection to every per-point array of the trace
+    for key in ("x", "y", "text", "hovertext", "customdata", "ids"):
+        array = _as_array(trace.get(key))
+        if array is not None and array.ndim >= 1 and len(array) == n:
+            trace[key] = array[keep]
+    marker = dict(trace.get("marker") or {})
+    for key in ("color", "size", "symbol"):
+        array = _as_array(marker.get(key)) if not isinstance(marker.get(key), (str, int, float)) else None
+        if array is not None and array.ndim >= 1 and len(array) == n:
+            marker[key] = array[keep]
+    if marker:
+        trace["marker"] = marker
+    return trace
+
+
+def _reduce_scatter(trace: dict, max_points: int, webgl: bool = False):
+    x, y = _as_array(trace.get("x")), _as_array(trace.get("y"))
+    if y is None or y.ndim != 1:
+        return None
+    n = len(y)
+    if n > max_points and y.dtype.kind in "iuf":
+        xs = _axis_as_numbers(x) if x is not None else np.arange(n, dtype=np.float64)
+        if xs is not None and len(xs) == n:
+            order = np.argsort(xs, kind="stable")
+            keep = order[lttb_indices(xs[order], y[order].astype(np.float64), max_points)]
+            trace = _subset_trace(trace, keep, n)
+            n = len(keep)
+    if webgl or n > WEBGL_THRESHOLD:
+        try:
+            return go.Scattergl(trace)
+        except ValueError:
+            # Some scatter options (e.g. spline lines) have no WebGL equivalent
+            pass
+    return go.Scatter(trace)
+
+
+def _reduce_categories(trace: dict, label_key: str, value_key: str, limit: int, keep=None):
+    labels, values = _as_array(trace.get(label_key)), _as_array(trace.get(value_key))
+    if labels is None or (keep is None and len(labels) <= limit):
+        return None
+    if values is None:
+        values = np.ones(len(labels))
+    if values.dtype.kind not in "iuf" or len(values) != len(labels):
+        return None
+    trace[label_key], trace[value_key] = top_n_other(labels, values, keep=keep)
+    for key in ("text", "hovertext", "customdata", "ids"):
+        trace.pop(key, None)
+    return trace
+
+
+def _bar_keys(trace: dict):
+    return ("y", "x") if trace.get("orientation") == "h" else ("x", "y")
+
+
+def _shared_top_bars(traces: list, limit: int = MAX_BARS, n: int = TOP_N):
+    """
+    The `n` categories kept by every bar trace of a figure, chosen on their
+    totals across all of them so stacked or grouped bars stay aligned. None if
+    the bars need no reducing: `limit` categories or fewer, or a numeric or
+    date axis, where folding bars into "Other" would misplace them.
+    """
+    all_labels, all_values = [], []
+    for trace in traces:
+        label_key, value_key = _bar_keys(trace)
+        labels, values = _as_array(trace.get(label_key)), _as_array(trace.get(value_key))
+        if labels is None:
+            continue
+        if values is None:
+            values = np.ones(len(labels))
+        if values.dtype.kind not in "iuf" or len(values) != len(labels) or not _is_categorical(labels):
+            return None
+        all_labels.append(labels.astype(object))
+        all_values.append(values.astype(np.float64))
+    if not all_labels:
+        return None
+    totals = pd.Series(np.concatenate(all_values)).groupby(np.concatenate(all_labels), sort=False).sum()
+    if len(totals) <= limit:
+        return None
+    return totals.nlargest(n).index.tolist()
+
+
+def reduce_figure(fig: go.Figure, max_points: int = MAX_POINTS) -> go.Figure:
+    """
+    Shrinks the traces of an already built figure before it is sent to the browser:
+    LTTB for line/scatter, top-N + "Other" for pie and categorical bar, server-side binning for
+    large histograms, and scattergl for large scatter traces.
+    """
+    traces = []
+    changed = False
+    # The point budget is shared by all line/scatter traces (e.g. one per colour group)
+    series = sum(1 for trace in fig.data if trace.type in ("scatter", "scattergl"))
+    per_trace = max(max_points // max(series, 1), MIN_POINTS_PER_TRACE)
+    top_bars = _shared_top_bars([trace.to_plotly_json() for trace in fig.data if trace.type == "bar"])
+    for original in fig.data:
+        trace = original.to_plotly_json()
+        kind = trace.pop("type", "scatter")
+        reduced = None
+        if kind in ("scatter", "scattergl"):
+            # plotly express already switches to scattergl above 1000 points, but still sends them all
+            reduced = _reduce_scatter(trace, per_trace, webgl=kind == "scattergl")
+        elif kind == "bar" and top_bars is not None:
+            label_key, value_key = _bar_keys(trace)
+            bucketed = _reduce_categories(trace, label_key, value_key, MAX_BARS, keep=top_bars)
+            reduced = go.Bar(bucketed) if bucketed is not None else None
+        elif kind == "pie":
+            bucketed = _reduce_categories(trace, "labels", "values", TOP_N)
+            reduced = go.Pie(bucketed) if bucketed is not None else None
+        elif kind == "histogram":
+            values = _as_array(trace.get("x") if trace.get("x") is not None else trace.get("y"))
+            if values is not None and len(values) > HISTOGRAM_THRESHOLD and values.dtype.kind in "iuf":
+                centres, counts, widths = histogram_bins(values)
+                reduced = go.Bar(x=centres, y=counts, width=widths, name=trace.get("name"),
+                                 marker=trace.get("marker"), showlegend=trace.get("showlegend"))
+        if reduced is None:
+            traces.append(original)
+        else:
+            traces.append(reduced)
+            changed = True
+    if changed:
+        fig.data = []
+        fig.add_traces(traces)
+    return fig
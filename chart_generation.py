@@ -2,9 +2,16 @@ import pandas as pd
 import plotly
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 import re
-import sqlparse
 from llm_response_generator import LLMResponseGenerator
+from result_profiler import profile_dataframe, TOKEN_BUDGET
+from chart_sandbox import get_chart_sandbox, chart_globals
+from chart_code_cache import get_chart_code_cache
+from chart_data import (reduce_figure, downsample_series, bucket_categories, MAX_BARS,
+                        WEBGL_THRESHOLD)
+
+SANDBOX_CHART_CODE = True  # run generated chart code in the limited process pool
 
 def should_generate_chart(df: pd.DataFrame) -> bool:
         if len(df) > 1 and df.select_dtypes(include=['number']).shape[1] > 0:
@@ -63,34 +70,57 @@ def extract_python_code(markdown_string: str) -> str:
 
         return python_code[0]
 
+def get_fallback_figure(df: pd.DataFrame) -> plotly.graph_objs.Figure:
+        # Inspect data types
+        numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
+        categorical_cols = df.select_dtypes(
+            include=["object", "category"]
+        ).columns.tolist()
+
+        # Decision-making for plot type; large results are reduced before the figure is built
+        if len(numeric_cols) >= 2:
+            # Use the first two numeric columns for a scatter plot
+            render_mode = "webgl" if len(df) > WEBGL_THRESHOLD else "auto"
+            fig = px.scatter(downsample_series(df, numeric_cols[0], numeric_cols[1]),
+                             x=numeric_cols[0], y=numeric_cols[1], render_mode=render_mode)
+        elif len(numeric_cols) == 1 and len(categorical_cols) >= 1:
+            # Use a bar plot if there's one numeric and one categorical column
+            bars = df if len(df) <= MAX_BARS else bucket_categories(df, categorical_cols[0], numeric_cols[0])
+            fig = px.bar(bars, x=categorical_cols[0], y=numeric_cols[0])
+        elif len(categorical_cols) >= 1 and df[categorical_cols[0]].nunique() < 10:
+            # Use a pie chart for categorical data with fewer unique values
+            fig = px.pie(bucket_categories(df, categorical_cols[0]), names=categorical_cols[0], values="count")
+        else:
+            # Default to a simple line plot if above conditions are not met
+            fig = reduce_figure(px.line(df))
+        return fig
+
 def get_plotly_figure(
-        plotly_code: str, df: pd.DataFrame, dark_mode: bool = True
+        plotly_code: str, df: pd.DataFrame, dark_mode: bool = True, sandbox: bool = SANDBOX_CHART_CODE
     ) -> plotly.graph_objs.Figure:
-        ldict = {"df": df, "px": px, "go": go}
-        try:
-            exec(plotly_code, globals(), ldict)
-
-            fig = ldict.get("fig", None)
-        except Exception as e:
-            # Inspect data types
-            numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
-            categorical_cols = df.select_dtypes(
-                include=["object", "category"]
-            ).columns.tolist()
-
-            # Decision-making for plot type
-            if len(numeric_cols) >= 2:
-                # Use the first two numeric columns for a scatter plot
-                fig = px.scatter(df, x=numeric_cols[0], y=numeric_cols[1])
-            elif len(numeric_cols) == 1 and len(categorical_cols) >= 1:
-                # Use a bar plot if there's one numeric and one categorical column
-                fig = px.bar(df, x=categorical_cols[0], y=numeric_cols[0])
-            elif len(categorical_cols) >= 1 and df[categorical_cols[0]].nunique() < 10:
-                # Use a pie chart for categorical data with fewer unique values
-                fig = px.pie(df, names=categorical_cols[0])
-            else:
-                # Default to a simple line plot if above conditions are not met
-                fig = px.line(df)
+        code_cache = get_chart_code_cache()
+        if sandbox:
+            # Generated code runs in a limited worker process; fall back to the heuristic chart if it fails
+            try:
+                figure_json = get_chart_sandbox().run(plotly_code, df)
+                fig = pio.from_json(figure_json) if figure_json is not None else None
+                code_cache.record(plotly_code, ok=fig is not None, error=None if fig is not None else "no fig")
+            except Exception as e:
+                print(f"Generated chart code failed in sandbox: {e}")
+                code_cache.record(plotly_code, ok=False, error=str(e))
+                fig = get_fallback_figure(df)
+        else:
+            ldict = {"df": df, "px": px, "go": go}
+            try:
+                exec(code_cache.compiled(plotly_code), chart_globals(), ldict)
+
+                fig = ldict.get("fig", None)
+                code_cache.record(plotly_code, ok=fig is not None, error=None if fig is not None else "no fig")
+                if fig is not None:
+                    fig = reduce_figure(fig)
+            except Exception as e:
+                code_cache.record(plotly_code, ok=False, error=f"{type(e).__name__}: {e}")
+                fig = get_fallback_figure(df)
 
         if fig is None:
             return None
@@ -100,16 +130,25 @@ def get_plotly_figure(
 
         return fig
 
-def generate_summary(question: str, df: pd.DataFrame) -> str:
-        message_log = [
+def get_summary_prompt(question: str, df: pd.DataFrame, token_budget: int = TOKEN_BUDGET) -> list:
+        # Large results are described by a bounded digest instead of every row
+        return [
             system_message(
-                f"You are a helpful data assistant. The user asked the question: '{question}'\n\nThe following is a pandas DataFrame with the results of the query: \n{df.to_markdown()}\n\n"
+                f"You are a helpful data assistant. The user asked the question: '{question}'\n\nThe following describes a pandas DataFrame with the results of the query: \n{profile_dataframe(df, token_budget)}\n\n"
             ),
             user_message(
                 "Briefly summarize the data based on the question that was asked. Do not respond with any additional explanation beyond the summary." +
                 "Respond in the English languague."
             ),
         ]
+
+def generate_summary(question: str, df: pd.DataFrame) -> str:
+        message_log = get_summary_prompt(question, df)
         llm = LLMResponseGenerator()
         summary = llm.submit_prompt(message_log)
-        return summary
\ No newline at end of file
+        return summary
+
+def stream_summary(question: str, df: pd.DataFrame):
+        # Yields the summary text chunk by chunk as the model writes it
+        llm = LLMResponseGenerator()
+        yield from llm.stream_prompt(get_summary_prompt(question, df))
@@ -0,0 +1,237 @@
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+# --- Configuration ---
+SANDBOX_WORKERS = 2
+CPU_TIME_LIMIT = 10  # CPU seconds one chart may use
+WALL_TIME_LIMIT = 20  # seconds the caller waits before giving up on a worker
+MEMORY_LIMIT = 2 * 1024 * 1024 * 1024  # bytes of address space per worker
+# Builtins generated chart code may use; no open, eval, exec, getattr or __import__
+SAFE_BUILTINS = (
+    "abs", "all", "any", "bool", "dict", "divmod", "enumerate", "filter", "float", "format", "frozenset",
+    "int", "isinstance", "iter", "len", "list", "map", "max", "min", "next", "pow", "print", "range",
+    "reversed", "round", "set", "slice", "sorted", "str", "sum", "tuple", "zip",
+    "Exception", "IndexError", "KeyError", "TypeError", "ValueError", "ZeroDivisionError",
+)
+# `import` statements in chart code only hand out these modules, which the workers have already loaded
+CHART_MODULES = ("pandas", "numpy", "math", "datetime", "plotly", "plotly.express", "plotly.graph_objects",
+                 "plotly.subplots", "plotly.colors")
+
+
+class ChartLimitExceeded(Exception):
+    pass
+
+
+# --- worker side ---
+def _on_cpu_limit(signum, frame):
+    raise ChartLimitExceeded("Chart code exceeded its CPU time limit")
+
+
+def _init_worker(memory_limit):
+    import signal
+    # Import the heavy libraries once per worker, not per chart
+    import pandas  # noqa: F401
+    import pyarrow  # noqa: F401
+    import plotly.express  # noqa: F401
+    import plotly.graph_objects  # noqa: F401
+    import chart_data  # noqa: F401
+    import chart_code_cache  # noqa: F401
+    try:
+        import resource
+    except ImportError:
+        # No rlimits on this platform (e.g. Windows); only the wall-clock timeout applies
+        return
+    # Linux ignores RLIMIT_RSS, so memory is bounded through the address space instead
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+
+def _set_cpu_deadline(seconds):
+    try:
+        import resource
+    except ImportError:
+        return
+    # RLIMIT_CPU counts the worker's whole life, so move the soft limit past what it has used so far
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = math.ceil(usage.ru_utime + usage.ru_stime)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _clear_cpu_deadline():
+    try:
+        import resource
+    except ImportError:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+def _ping():
+    return True
+
+
+def _chart_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Stands in for __import__: "import plotly.express as px" still works, anything else is refused
+    if level != 0 or name not in CHART_MODULES:
+        raise ImportError(f"Chart code may not import {name}")
+    import importlib
+    module = importlib.import_module(name)
+    return module if fromlist else importlib.import_module(name.split(".")[0])
+
+
+def chart_globals() -> dict:
+    """
+    Globals to exec generated chart code with: pd, np, px and go, and only
+    SAFE_BUILTINS plus an __import__ limited to CHART_MODULES.
+    """
+    import builtins
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+    safe = {name: getattr(builtins, name) for name in SAFE_BUILTINS}
+    safe["__import__"] = _chart_import
+    return {"__builtins__": safe, "pd": pd, "np": np, "px": px, "go": go}
+
+
+def _run_chart_code(plotly_code, shm_name, size, cpu_limit):
+    """
+    Runs generated Plotly code against the DataFrame in shared memory (Arrow IPC)
+    and returns ("ok", figure JSON), ("none", None) or ("error", message).
+    """
+    import pyarrow as pa
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from chart_data import reduce_figure
+    from chart_code_cache import compile_chart_code
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        reader = pa.ipc.open_stream(pa.py_buffer(bytes(shm.buf[:size])))
+        df = reader.read_all().to_pandas()
+    finally:
+        shm.close()
+
+    ldict = {"df": df, "px": px, "go": go}
+    _set_cpu_deadline(cpu_limit)
+    try:
+        # Each worker compiles a given chart code once and reuses it for later results
+        exec(compile_chart_code(plotly_code), chart_globals(), ldict)
+        fig = ldict.get("fig", None)
+        if fig is None:
+            return ("none", None)
+        # Downsample before serialising so only the reduced figure crosses the process boundary
+        return ("ok", reduce_figure(fig).to_json())
+    except ChartLimitExceeded as e:
+        return ("limit", str(e))
+    except MemoryError:
+        return ("limit", "Chart code exceeded its memory limit")
+    except Exception as e:
+        return ("error", f"{type(e).__name__}: {e}")
+    finally:
+        _clear_cpu_deadline()
+
+
+# --- caller side ---
+def _to_shared_memory(df):
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    buffer = sink.getvalue()
+    shm = shared_memory.SharedMemory(create=True, size=max(buffer.size, 1))
+    shm.buf[:buffer.size] = memoryview(buffer).cast("B")
+    return shm, buffer.size
+
+
+class ChartSandbox:
+    """
+    Pre-warmed process pool that runs LLM-generated chart code outside the
+    Streamlit process, with CPU-time, memory and wall-clock limits. The
+    DataFrame is handed over as Arrow IPC in shared memory, not pickled, and the
+    figure comes back as Plotly JSON.
+    """
+    def __init__(self, workers=SANDBOX_WORKERS, cpu_limit=CPU_TIME_LIMIT, wall_limit=WALL_TIME_LIMIT,
+                 memory_limit=MEMORY_LIMIT):
+        self.workers = workers
+        self.cpu_limit = cpu_limit
+        self.wall_limit = wall_limit
+        self.memory_limit = memory_limit
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a multi-threaded Streamlit server is not safe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit,),
+                )
+            return self._pool
+
+    def _reset_pool(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            # A worker stuck past the wall-clock limit cannot be interrupted; kill the pool
+            for process in list(getattr(pool, "_processes", {}).values()):
+                process.kill()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self):
+        pool = self._get_pool()
+        for _ in range(self.workers):
+            pool.submit(_ping)
+
+    def run(self, plotly_code, df):
+        """
+        Returns the figure JSON produced by `plotly_code`, or None if the code
+        produced no figure. Raises ChartLimitExceeded if a limit was hit and
+        RuntimeError if the code failed.
+        """
+        shm, size = _to_shared_memory(df)
+        try:
+            future = self._get_pool().submit(_run_chart_code, plotly_code, shm.name, size, self.cpu_limit)
+            try:
+                status, payload = future.result(timeout=self.wall_limit)
+            except FutureTimeoutError:
+                self._reset_pool()
+                raise ChartLimitExceeded("Chart code exceeded its time limit")
+            except BrokenProcessPool:
+                # The worker died (e.g. killed for memory); start a fresh pool next time
+                self._reset_pool()
+                raise ChartLimitExceeded("Chart worker crashed")
+        finally:
+            shm.close()
+            shm.unlink()
+
+        if status == "ok":
+            return payload
+        if status == "none":
+            return None
+        if status == "limit":
+            raise ChartLimitExceeded(payload)
+        raise RuntimeError(payload)
+
+
+_sandbox = None
+_sandbox_lock = threading.Lock()
+
+def get_chart_sandbox():
+    global _sandbox
+    with _sandbox_lock:
+        if _sandbox is None:
+            _sandbox = ChartSandbox()
+        return _sandbox
@@ -0,0 +1,318 @@
+import re
+import threading
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from chart_data import (reduce_figure, downsample_series, bucket_categories, histogram_bins, MAX_BARS,
+                        WEBGL_THRESHOLD)
+
+# --- Configuration ---
+# Keywords that name a chart type in the user's chart request. Checked in this order.
+CHART_KEYWORDS = {
+    "pie": ("pie", "donut", "doughnut", "share", "proportion", "percentage", "breakdown", "composition"),
+    "histogram": ("histogram", "distribution", "spread", "frequency"),
+    "scatter": ("scatter", "correlation", "relationship", "vs ", "versus", "against"),
+    "line": ("line", "trend", "over time", "timeline", "time series", "daily", "weekly", "monthly", "yearly"),
+    "bar": ("bar", "column chart", "compar", "ranking", "top ", "by "),
+}
+AGGREGATION_KEYWORDS = {
+    "mean": ("average", "avg", "mean"),
+    "count": ("count", "number of", "how many"),
+    "sum": ("total", "sum"),
+}
+# Requests that need more than one chart type / x / y / colour go to the LLM
+COMPLEX_KEYWORDS = ("subplot", "facet", "dual axis", "secondary axis", "annotat", "heatmap", "map",
+                    "animat", "3d", "sunburst", "treemap", "funnel", "box plot", "violin", "combined")
+# Descriptions used when no keyword names a chart type; matched by embedding similarity
+TEMPLATE_DESCRIPTIONS = {
+    "pie": "pie chart showing each category's share of the whole",
+    "histogram": "histogram showing how values of one number are distributed",
+    "scatter": "scatter plot of how two numbers relate to each other",
+    "line": "line chart showing how a value changes over time",
+    "bar": "bar chart comparing a value across categories",
+}
+EMBEDDING_MATCH = True
+EMBEDDING_THRESHOLD = 0.75  # cosine similarity needed to accept a template by embedding
+PIE_MAX_SLICES = 15
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+                "nine": 9, "ten": 10, "fifteen": 15, "twenty": 20, "fifty": 50, "hundred": 100}
+
+
+def _normalise_query(chart_query: str) -> str:
+    return " " + re.sub(r"[\s_]+", " ", chart_query.lower()).strip() + " "
+
+
+def _has_keyword(query: str, keywords) -> bool:
+    # Keywords match at the start of a word, so "line" does not match "online"
+    return any(re.search(r"(?<![a-z0-9])" + re.escape(keyword.strip()), query) for keyword in keywords)
+
+
+def _column_kinds(df: pd.DataFrame):
+    numeric, categorical, temporal = [], [], []
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            temporal.append(column)
+        elif pd.api.types.is_bool_dtype(series):
+            categorical.append(column)
+        elif pd.api.types.is_numeric_dtype(series):
+            numeric.append(column)
+        elif re.search(r"date|time|month|year|day|week", str(column), re.IGNORECASE):
+            # e.g. invoice_date read as text, or a 'YYYY-MM' month label; both sort in time order
+            temporal.append(column)
+        else:
+            categorical.append(column)
+    return numeric, categorical, temporal
+
+
+def _mentioned_columns(query: str, df: pd.DataFrame):
+    """
+    Columns named in the chart request, in the order they appear in it.
+    """
+    found = []
+    for column in df.columns:
+        name = re.sub(r"[\s_]+", " ", str(column).lower()).strip()
+        match = re.search(r"\b" + re.escape(name) + r"s?\b", query)
+        if match:
+            found.append((match.start(), column))
+    return [column for _, column in sorted(found, key=lambda item: item[0])]
+
+
+def _keyword_chart_type(query: str):
+    for chart_type, keywords in CHART_KEYWORDS.items():
+        if _has_keyword(query, keywords):
+            return chart_type
+    return None
+
+
+class _TemplateEmbeddings:
+    """
+    Embeds TEMPLATE_DESCRIPTIONS once, then matches chart requests against them.
+    """
+    def __init__(self, embed_fn=None):
+        self.embed_fn = embed_fn
+        self._types = None
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def _embedder(self):
+        if self.embed_fn is None:
+            from open_search import get_embedding_model
+            model = get_embedding_model()
+            self.embed_fn = model.embed_query
+        return self.embed_fn
+
+    def _load(self):
+        with self._lock:
+            if self._matrix is None:
+                embed = self._embedder()
+                self._types = list(TEMPLATE_DESCRIPTIONS)
+                vectors = np.asarray([embed(TEMPLATE_DESCRIPTIONS[t]) for t in self._types], dtype=np.float32)
+                self._matrix = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        return self._types, self._matrix
+
+    def match(self, chart_query: str, threshold: float = EMBEDDING_THRESHOLD):
+        types, matrix = self._load()
+        vector = np.asarray(self._embedder()(chart_query), dtype=np.float32)
+        scores = matrix @ (vector / np.linalg.norm(vector))
+        best = int(np.argmax(scores))
+        return types[best] if scores[best] >= threshold else None
+
+
+_template_embeddings = _TemplateEmbeddings()
+
+
+def classify_chart_type(chart_query: str, embed: bool = EMBEDDING_MATCH):
+    query = _normalise_query(chart_query)
+    chart_type = _keyword_chart_type(query)
+    if chart_type is None and embed:
+        try:
+            chart_type = _template_embeddings.match(chart_query)
+        except Exception as e:
+            print(f"Chart template embedding match failed: {e}")
+    return chart_type
+
+
+def _aggregation(query: str):
+    for aggregation, keywords in AGGREGATION_KEYWORDS.items():
+        if _has_keyword(query, keywords):
+            return aggregation
+    return None
+
+
+def _category_limit(query: str):
+    """
+    (n, ascending) for "top 5 malls", "bottom 3 ...", "10 highest ..." and the like, else (None, False).
+    """
+    number = r"(\d+|" + "|".join(NUMBER_WORDS) + r")"
+    match = re.search(rf"(?<![a-z0-9])(top|bottom|first|last|best|worst|highest|lowest|largest|smallest) {number}(?![a-z0-9])", query)
+    if match is None:
+        match = re.search(rf"(?<![a-z0-9]){number} (top|bottom|best|worst|highest|lowest|largest|smallest|biggest)(?![a-z0-9])", query)
+        if match is None:
+            return None, False
+        count, word = match.group(1), match.group(2)
+    else:
+        word, count = match.group(1), match.group(2)
+    n = int(count) if count.isdigit() else NUMBER_WORDS[count]
+    return n, word in ("bottom", "last", "worst", "lowest", "smallest")
+
+
+def _first(preferred, fallback):
+    return preferred[0] if preferred else (fallback[0] if fallback else None)
+
+
+def match_chart_template(chart_query: str, df: pd.DataFrame, embed: bool = EMBEDDING_MATCH):
+    """
+    Classifies the chart request and the result's dtypes into a chart spec
+    {"type", "x", "y", "color", "agg", "title", "limit", "ascending"} that
+    render_chart_spec can draw, or returns None if no template fits and the
+    chart should be generated by the LLM. "limit" keeps only the top (or with
+    "ascending", bottom) N categories of a bar or pie chart.
+    """
+    if df is None or df.empty or not chart_query or not chart_query.strip():
+        return None
+    query = _normalise_query(chart_query)
+    if _has_keyword(query, COMPLEX_KEYWORDS):
+        return None
+
+    numeric, categorical, temporal = _column_kinds(df)
+    mentioned = _mentioned_columns(query, df)
+    m_numeric = [c for c in mentioned if c in numeric]
+    m_categorical = [c for c in mentioned if c in categorical]
+    m_temporal = [c for c in mentioned if c in temporal]
+    limit, ascending = _category_limit(query)
+    spec = {"x": None, "y": None, "color": None, "agg": _aggregation(query), "title": chart_query.strip(),
+            "limit": limit, "ascending": ascending}
+
+    if df.shape == (1, 1) and numeric:
+        # A single value is shown as an Indicator, as the LLM prompt asks for
+        spec.update(type="indicator", y=numeric[0])
+        return spec
+
+    chart_type = classify_chart_type(chart_query, embed=embed)
+    if chart_type is None or (limit is not None and chart_type not in ("pie", "bar")):
+        return None
+    spec["type"] = chart_type
+
+    if chart_type in ("pie", "bar"):
+        # Pie slices need categories; bars may also run along a date column
+        candidates = (m_categorical + m_temporal + categorical + temporal if chart_type == "bar"
+                      else m_categorical + categorical)
+        x = candidates[0] if candidates else None
+        if x is None:
+            return None
+        spec["x"] = x
+        spec["y"] = _first(m_numeric, numeric)
+        if spec["y"] is None:
+            spec["agg"] = "count"
+        if chart_type == "bar":
+            spec["color"] = next((c for c in m_categorical if c != x), None)
+    elif chart_type == "line":
+        x = _first(m_temporal, temporal)
+        y = _first([c for c in m_numeric if c != x], [c for c in numeric if c != x])
+        if x is None or y is None:
+            return None
+        spec.update(x=x, y=y, color=m_categorical[0] if m_categorical else None)
+    elif chart_type == "histogram":
+        spec["x"] = _first(m_numeric, numeric)
+        if spec["x"] is None:
+            return None
+        spec["agg"] = None
+    elif chart_type == "scatter":
+        pair = (m_numeric + [c for c in numeric if c not in m_numeric])[:2]
+        if len(pair) < 2:
+            return None
+        spec.update(x=pair[0], y=pair[1], color=m_categorical[0] if m_categorical else None, agg=None)
+
+    # "... by payment method" must group by a column the result actually has
+    for phrase in re.findall(r"(?<![a-z0-9])(?:by|per|across) ([a-z0-9]+)", query):
+        if not any(re.sub(r"[\s_]+", " ", str(c).lower()).startswith(phrase) for c in (spec["x"], spec["color"]) if c):
+            return None
+
+    # Every mentioned column must be used, otherwise the request asked for more than the template draws
+    used = {spec["x"], spec["y"], spec["color"]}
+    if any(column not in used for column in mentioned):
+        return None
+    return spec
+
+
+def _aggregate(df: pd.DataFrame, keys, y, agg):
+    keys = [k for k in keys if k is not None]
+    if y is None or agg == "count":
+        return df.groupby(keys, observed=True, sort=False).size().reset_index(name=y or "count"), y or "count"
+    return df.groupby(keys, observed=True, sort=False)[y].agg(agg or "sum").reset_index(), y
+
+
+_PERIOD = re.compile(r"\d{4}(?:[-/]\d{1,2}(?:[-/]\d{1,2}(?:[ T][\d:.]+)?)?|[- ]?Q[1-4])?")
+
+
+def _is_period_axis(series: pd.Series) -> bool:
+    # Datetimes, or text such as '2023', '2023-01', '2023-01-31' or '2023-Q1' that sorts in time order
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return False
+    values = series.dropna().astype(str).str.strip()
+    return len(values) > 0 and bool(values.map(lambda v: _PERIOD.fullmatch(v) is not None).all())
+
+
+def _limit_categories(data: pd.DataFrame, x, y, n: int, ascending: bool) -> pd.DataFrame:
+    # Rows of the n categories with the largest (or smallest) total, over all colour groups
+    totals = data.groupby(x, observed=True, sort=False)[y].sum().sort_values(ascending=ascending, kind="stable")
+    return data[data[x].isin(totals.index[:n])]
+
+
+def render_chart_spec(spec: dict, df: pd.DataFrame, dark_mode: bool = True) -> go.Figure:
+    """
+    Draws a chart spec from match_chart_template locally, reducing large results
+    the same way as generated charts.
+    """
+    chart_type, x, y, color, agg, title = (spec["type"], spec["x"], spec["y"], spec["color"],
+                                           spec["agg"], spec["title"])
+    limit, ascending = spec.get("limit"), spec.get("ascending", False)
+    if chart_type == "indicator":
+        fig = go.Figure(go.Indicator(mode="number", value=float(df[y].iloc[0]), title={"text": str(y)}))
+    elif chart_type == "pie":
+        data, y = _aggregate(df, [x], y, agg)
+        if limit is not None:
+            data = _limit_categories(data, x, y, limit, ascending)
+        if len(data) > PIE_MAX_SLICES:
+            data = bucket_categories(data, x, y, PIE_MAX_SLICES)
+        fig = px.pie(data, names=x, values=y, title=title)
+    elif chart_type == "bar":
+        data, y = _aggregate(df, [x, color], y, agg)
+        if limit is not None:
+            data = _limit_categories(data, x, y, limit, ascending)
+        if _is_period_axis(data[x]):
+            # Dates and periods keep their time order, whatever "top N" picked
+            data = data.sort_values(x, kind="stable")
+        else:
+            if color is None and len(data) > MAX_BARS:
+                data = bucket_categories(data, x, y)
+            if x not in data.select_dtypes(include=["number"]).columns:
+                data = data.sort_values(y, ascending=ascending)
+        fig = px.bar(data, x=x, y=y, color=color, title=title)
+    elif chart_type == "line":
+        if agg is not None or df.duplicated([c for c in (x, color) if c is not None]).any():
+            data, y = _aggregate(df, [x, color], y, agg)
+        else:
+            data = df
+        data = data.sort_values(x)
+        if color is None:
+            data = downsample_series(data, x, y) if pd.api.types.is_datetime64_any_dtype(data[x]) else data
+        fig = px.line(data, x=x, y=y, color=color, title=title)
+    elif chart_type == "histogram":
+        centres, counts, widths = histogram_bins(df[x].to_numpy(dtype=np.float64))
+        fig = go.Figure(go.Bar(x=centres, y=counts, width=widths))
+        fig.update_layout(title=title, xaxis_title=str(x), yaxis_title="count")
+    elif chart_type == "scatter":
+        render_mode = "webgl" if len(df) > WEBGL_THRESHOLD else "auto"
+        fig = px.scatter(df, x=x, y=y, color=color, title=title, render_mode=render_mode)
+    else:
+        raise ValueError(f"Unknown chart template: {chart_type}")
+
+    fig = reduce_figure(fig)
+    if dark_mode:
+        fig.update_layout(template="plotly_dark")
+    return fig
@@ -0,0 +1,198 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# --- Configuration ---
+HISTORY_DIR = os.path.join(current_dir, "cache", "history")
+SESSION_MEMORY_BUDGET = 64 * 1024 * 1024  # bytes of frames/figures kept in memory per session
+RECENT_TURNS = 2  # assistant turns rendered in full; older ones render collapsed
+HISTORY_MAX_AGE = 24 * 60 * 60  # seconds; session directories untouched for longer are removed at startup
+
+
+def _size_of(obj) -> int:
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    return len(obj)
+
+
+def sweep_history(base_dir=HISTORY_DIR, max_age=HISTORY_MAX_AGE):
+    """
+    Removes the spill directories of sessions that have not touched them for
+    `max_age` seconds (Streamlit gives no hook for a session ending). Returns
+    the number removed.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(base_dir))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        print(f"Removed {removed} chat history directories older than {max_age}s from {base_dir}")
+    return removed
+
+
+_swept_dirs = set()
+_sweep_lock = threading.Lock()
+
+def _sweep_once(base_dir):
+    # Once per process and directory, when its first session starts
+    with _sweep_lock:
+        if base_dir in _swept_dirs:
+            return
+        _swept_dirs.add(base_dir)
+    sweep_history(base_dir)
+
+
+class ChatHistory:
+    """
+    Chat messages for one session. Messages only hold small values (text, SQL,
+    summaries) and references to result frames and figures. The heavy objects
+    live in an in-memory store bounded by `memory_budget`; the least recently
+    used are spilled to Parquet (frames) or JSON (figures) under
+    HISTORY_DIR/<session_id> and loaded back on demand. Directories left by
+    old sessions are swept when the first history of the process is created.
+    """
+    def __init__(self, session_id, memory_budget=SESSION_MEMORY_BUDGET, base_dir=HISTORY_DIR):
+        self.messages = []
+        self.memory_budget = memory_budget
+        self.directory = os.path.join(base_dir, str(session_id))
+        self._objects = OrderedDict()  # ref -> DataFrame or figure JSON
+        self._sizes = {}
+        self._memory_used = 0
+        _sweep_once(base_dir)
+
+    # --- object store ---
+    def _path(self, ref):
+        return os.path.join(self.directory, ref + (".parquet" if ref.startswith("df-") else ".json"))
+
+    def _spill(self, ref):
+        obj = self._objects.pop(ref)
+        self._memory_used -= self._sizes.pop(ref)
+        if os.path.exists(self._path(ref)):
+            # Already on disk from an earlier spill
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if isinstance(obj, pd.DataFrame):
+            obj.to_parquet(self._path(ref))
+        else:
+            with open(self._path(ref), 'w') as f:
+                f.write(obj)
+
+    def _keep(self, ref, obj):
+        self._objects[ref] = obj
+        self._sizes[ref] = _size_of(obj)
+        self._memory_used += self._sizes[ref]
+        while self._memory_used > self.memory_budget and len(self._objects) > 1:
+            self._spill(next(iter(self._objects)))
+
+    def _put(self, prefix, obj):
+        ref = f"{prefix}-{uuid.uuid4().hex}"
+        self._keep(ref, obj)
+        return ref
+
+    def _drop(self, ref):
+        if ref is None:
+            return
+        if ref in self._objects:
+            del self._objects[ref]
+            self._memory_used -= self._sizes.pop(ref)
+        if os.path.exists(self._path(ref)):
+            os.remove(self._path(ref))
+
+    def _get(self, ref):
+        if ref is None:
+            return None
+        if ref in self._objects:
+            self._objects.move_to_end(ref)
+            return self._objects[ref]
+        path = self._path(ref)
+        if not os.path.exists(path):
+            return None
+        if ref.startswith("df-"):
+            obj = pd.read_parquet(path)
+        else:
+            with open(path, 'r') as f:
+                obj = f.read()
+        # Reading does not update the directory's mtime, which sweep_history goes by
+        os.utime(self.directory)
+        self._keep(ref, obj)
+        return obj
+
+    def get_frame(self, message):
+        return self._get(message["content"].get("df_ref"))
+
+    def get_figure(self, message):
+        import plotly.io as pio
+        figure_json = self._get(message["content"].get("chart_ref"))
+        return pio.from_json(figure_json) if figure_json else None
+
+    # --- messages ---
+    def add_user(self, text):
+        self.messages.append({"role": "user", "content": text})
+
+    def add_assistant(self, sql=None, df=None, caption=None):
+        content = {"sql": sql, "df_ref": None, "caption": caption, "chart_ref": None, "summary": None}
+        if isinstance(df, pd.DataFrame):
+            content["df_ref"] = self._put("df", df)
+        elif df is not None:
+            # Error text from run_sql is small enough to keep inline
+            content["error"] = str(df)
+        self.messages.append({"role": "assistant", "content": content})
+        return len(self.messages) - 1
+
+    def set_frame(self, index, df, caption=None):
+        content = self.messages[index]["content"]
+        self._drop(content.get("df_ref"))
+        content["df_ref"] = self._put("df", df)
+        content["caption"] = caption
+
+    def set_chart(self, index, fig):
+        if fig is not None:
+            content = self.messages[index]["content"]
+            self._drop(content.get("chart_ref"))
+            content["chart_ref"] = self._put("fig", fig.to_json())
+
+    def set_summary(self, index, summary):
+        self.messages[index]["content"]["summary"] = summary
+
+    def last_assistant_index(self):
+        for i in range(len(self.messages) - 1, -1, -1):
+            if self.messages[i]["role"] == "assistant":
+                return i
+        return None
+
+    def recent_indices(self):
+        """
+        Indices of the last RECENT_TURNS assistant messages, which are rendered in full.
+        """
+        indices = set()
+        for i in range(len(self.messages) - 1, -1, -1):
+            if len(indices) >= RECENT_TURNS:
+                break
+            if self.messages[i]["role"] == "assistant":
+                indices.add(i)
+        return indices
+
+    def memory_used(self):
+        return self._memory_used
+
+    def clear(self):
+        self.messages = []
+        self._objects.clear()
+        self._sizes.clear()
+        self._memory_used = 0
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import deque
+
+# --- Configuration ---
+POOL_MAX_SIZE = 8
+POOL_IDLE_TIMEOUT = 300  # seconds a connection may sit unused before it is evicted
+POOL_CHECKOUT_TIMEOUT = 10  # seconds a session waits for a free connection
+POOL_HEALTH_CHECK_IDLE = 30  # seconds idle before a connection is health-checked on checkout
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    """
+    Thin wrapper handed out by the pool. close() returns the connection to the
+    pool instead of closing it; everything else is delegated to the real connection.
+    """
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._conn)
+
+    def discard(self):
+        # Drop a connection that is known to be broken
+        if not self._released:
+            self._released = True
+            self._pool.release(self._conn, broken=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of DB-API connections. Connections idle for more than
+    `health_check_idle` seconds are checked with `health_query` on checkout;
+    ones that failed a rollback on release or were discarded are closed.
+
+    `factory` is any zero-argument callable returning a DB-API connection
+    (pyodbc.connect for SQL Server, sqlite3.connect for local runs and tests).
+    """
+    def __init__(self, factory, max_size=POOL_MAX_SIZE, idle_timeout=POOL_IDLE_TIMEOUT,
+                 checkout_timeout=POOL_CHECKOUT_TIMEOUT, health_query="SELECT 1",
+                 health_check_idle=POOL_HEALTH_CHECK_IDLE):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_query = health_query
+        self.health_check_idle = health_check_idle
+        self._idle = deque()  # (connection, last_used)
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._metrics = {
+            "created": 0,
+            "reused": 0,
+            "evicted_idle": 0,
+            "health_checks": 0,
+            "failed_health_check": 0,
+            "checkout_timeouts": 0,
+            "total_wait_time": 0.0,
+        }
+
+    def _is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_query)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self):
+        # Caller must hold the lock. Oldest connections sit at the left.
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._close_quietly(conn)
+            self._metrics["evicted_idle"] += 1
+
+    def acquire(self, timeout=None):
+        """
+        Checks out a connection, waiting up to `timeout` seconds for one to free up.
+        Raises PoolTimeout if none becomes available in time.
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            while True:
+                self._evict_idle()
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    # A connection that came back without errors a moment ago is trusted as is
+                    check = time.monotonic() - last_used > self.health_check_idle
+                    self._in_use += 1
+                    break
+                if self._in_use < self.max_size:
+                    conn, check = None, False
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics["checkout_timeouts"] += 1
+                    raise PoolTimeout(f"No database connection available within {timeout}s")
+                self._cond.wait(remaining)
+
+        # Connect / health check outside the lock so other sessions are not blocked
+        try:
+            if check:
+                healthy = self._is_healthy(conn)
+                with self._cond:
+                    self._metrics["health_checks"] += 1
+                    if not healthy:
+                        self._metrics["failed_health_check"] += 1
+                if not healthy:
+                    self._close_quietly(conn)
+                    conn = None
+            if conn is None:
+                conn = self.factory()
+                with self._cond:
+                    self._metrics["created"] += 1
+            else:
+                with self._cond:
+                    self._metrics["reused"] += 1
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._metrics["total_wait_time"] += time.monotonic() - start
+        return PooledConnection(self, conn)
+
+    def release(self, conn, broken=False):
+        if not broken:
+            try:
+                # Leave no open transaction behind for the next borrower
+                conn.rollback()
+            except Exception:
+                broken = True
+        with self._cond:
+            self._in_use -= 1
+            if broken or len(self._idle) >= self.max_size:
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._close_quietly(conn)
+
+    def metrics(self):
+        with self._cond:
+            stats = dict(self._metrics)
+            stats["in_use"] = self._in_use
+            stats["idle"] = len(self._idle)
+            stats["max_size"] = self.max_size
+        return stats
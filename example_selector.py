@@ -0,0 +1,66 @@
+import re
+from result_profiler import estimate_tokens
+
+# --- Configuration ---
+EXAMPLES_PER_PROMPT = 5  # most similar sample questions added to a prompt
+CANDIDATE_POOL = 20  # nearest sample questions retrieved before deduplication and the budget
+EXAMPLE_TOKEN_BUDGET = 1200  # rough tokens the few-shot block may use in one prompt
+SELECT_ABOVE = 10  # libraries up to this size are added whole, as part of the static prompt prefix
+
+
+def _normalise_question(question: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", question.lower()).strip()
+
+
+def _normalise_sql(sql: str) -> str:
+    try:
+        from result_cache import normalise_sql
+        return normalise_sql(sql)
+    except Exception:
+        return re.sub(r"\s+", " ", sql).strip().rstrip(";").upper()
+
+
+def dedupe_examples(examples: list) -> list:
+    """
+    Drops examples whose question or SQL repeats an earlier one (ignoring case,
+    punctuation, whitespace and SQL formatting), keeping the first.
+    """
+    seen_questions, seen_sqls, unique = set(), set(), []
+    for example in examples:
+        if not example or "question" not in example or "sql" not in example:
+            continue
+        question, sql = _normalise_question(example["question"]), _normalise_sql(example["sql"])
+        if question in seen_questions or sql in seen_sqls:
+            continue
+        seen_questions.add(question)
+        seen_sqls.add(sql)
+        unique.append(example)
+    return unique
+
+
+def fit_token_budget(examples: list, token_budget: int = EXAMPLE_TOKEN_BUDGET) -> list:
+    """
+    Keeps examples in order until the next one would exceed the token budget.
+    """
+    kept, used = [], 0
+    for example in examples:
+        cost = estimate_tokens(f"\nQuestion: {example['question']}, Sql: {example['sql']}\n")
+        if used + cost > token_budget:
+            break
+        kept.append(example)
+        used += cost
+    return kept
+
+
+def select_examples(question: str, examples: list, version: str, kb_path: str,
+                    k: int = EXAMPLES_PER_PROMPT, token_budget: int = EXAMPLE_TOKEN_BUDGET) -> list:
+    """
+    The `k` sample questions most similar to `question`, most similar first,
+    without duplicates and within the token budget. Uses the same vector store
+    engine as get_columns, over an index of the sample questions.
+    """
+    from open_search import get_example_index
+    index = get_example_index(lambda: dedupe_examples(examples), version, kb_path)
+    documents = index.similarity_search(question, k=max(k, CANDIDATE_POOL))
+    candidates = [{"question": d.metadata["question"], "sql": d.metadata["sql"]} for d in documents]
+    return fit_token_budget(dedupe_examples(candidates)[:k], token_budget)
@@ -1,28 +1,171 @@
+import time
+_import_start = time.perf_counter()
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import startup
+from open_search import warm_up
 from sql_generation import generate_sql, run_sql
-from chart_generation import should_generate_chart, generate_plotly_code, get_plotly_figure, generate_summary
+from chart_generation import should_generate_chart, generate_plotly_code, get_plotly_figure, generate_summary, stream_summary
+from semantic_cache import get_sql_cache
+from cache_policy import cached, register_external
+from result_cache import get_result_cache
+from chart_sandbox import get_chart_sandbox
+from chart_code_cache import get_chart_code_cache
+from sql_validation import validate_sql, get_schema_catalogue
+from chart_templates import match_chart_template, render_chart_spec
+from result_window import is_partial, window_caption
+from result_profiler import partial_result_note
+from rollups import get_rollup_store, ROUTE_TO_ROLLUPS
+from sql_backends import SQL_BACKEND
+
+startup.record("helper import", time.perf_counter() - _import_start)
+print(startup.report())
+# Build or attach to the column index in the background, off the request path
+warm_up()
+# Start the chart worker processes now so the first chart does not pay for it
+get_chart_sandbox().warm_up()
+
+def _is_cacheable_sql(sql):
+    return not sql.startswith("Error")
 
-@st.cache_data(show_spinner="Fetching Results...")
+@cached("sql_gen", show_spinner="Fetching Results...", on_clear=lambda: get_sql_cache().clear())
 def generate_sql_cached(question:str):
-    return generate_sql(question)
+    # Paraphrases of earlier questions are answered from the shared semantic cache
+    return get_sql_cache().get_or_compute(question, generate_sql, should_store=_is_cacheable_sql)
+
+@cached("sql_gen")
+def is_sql_valid_cached(sql: str):
+    # Local check only (see sql_validation); no database round trip
+    return _is_cacheable_sql(sql) and not validate_sql(sql, get_schema_catalogue())
+
+_result_cache = get_result_cache()
+register_external("sql_results", _result_cache.clear, lambda: (_result_cache.hits, _result_cache.misses))
 
-@st.cache_data(show_spinner="Generating Response ...")
-def run_sql_cached(sql: str):
-    return run_sql(sql=sql)
+def evict_sql_results(sql: str):
+    # Drops the cached result pages of one query, e.g. after showing it failed
+    _result_cache.evict(sql)
 
-@st.cache_data(show_spinner="Checking if Chart can be generated from given result...")
+_rollup_store = get_rollup_store()
+if ROUTE_TO_ROLLUPS and SQL_BACKEND == "sqlserver":
+    _rollup_store.refresh_async()
+
+def _run_sql_or_rollup(sql: str, page: int = 0):
+    # Common aggregates are answered from the rollup cubes while they match the table version
+    df = _rollup_store.answer(sql, page=page) if ROUTE_TO_ROLLUPS else None
+    return df if df is not None else run_sql(sql=sql, page=page)
+
+def run_sql_cached(sql: str, page: int = 0, backend: str = None):
+    # Served from cache only while the customer_shopping_data version is unchanged
+    with st.spinner("Generating Response ..."):
+        if (backend or SQL_BACKEND) != "sqlserver":
+            # The local snapshot is not tied to the server's table version, so it skips the result cache and rollups
+            return run_sql(sql=sql, page=page, backend=backend)
+        return _result_cache.get_or_run(sql, _run_sql_or_rollup, page=page)
+
+@cached("plot_code", show_spinner="Checking if Chart can be generated from given result...")
 def should_generate_chart_cached(df):
     return should_generate_chart(df=df)
 
-@st.cache_data(show_spinner="Generating Chart ...")
+_chart_code_cache = get_chart_code_cache()
+register_external("plot_code", _chart_code_cache.clear, lambda: (_chart_code_cache.hits, _chart_code_cache.misses))
+
 def generate_plotly_code_cached(chart_query,question, sql, df):
-    code = generate_plotly_code(chart_query, question=question, sql=sql,df_metadata=f"Running df.dtypes gives:\n {df.dtypes}")
-    return code
+    # Keyed on the chart request and the result's columns/dtypes, so refreshed results reuse the code
+    return _chart_code_cache.get_or_generate(
+        chart_query, df,
+        lambda: generate_plotly_code(chart_query, question=question, sql=sql,df_metadata=f"{partial_result_note(df)}Running df.dtypes gives:\n {df.dtypes}"),
+    )
 
-@st.cache_data(show_spinner="Generating Chart ...")
+@cached("plots", show_spinner="Generating Chart ...")
 def generate_plot_cached(code, df):
     return get_plotly_figure(plotly_code=code, df=df)
 
-@st.cache_data(show_spinner="Generating summary ...")
+@cached("plots", show_spinner="Generating Chart ...")
+def render_chart_spec_cached(spec, df):
+    return render_chart_spec(spec=spec, df=df)
+
+class _SummaryNotCached(Exception):
+    pass
+
+_PEEK = object()
+# Lets stream_summary_cached look up, or fill in, generate_summary_cached's entry for the same key
+_summary_handoff = threading.local()
+
+@cached("summaries", show_spinner="Generating summary ...")
 def generate_summary_cached(question, df):
-    return generate_summary(question=question, df=df)
\ No newline at end of file
+    handoff = getattr(_summary_handoff, "value", None)
+    if handoff is _PEEK:
+        # Raised, so st.cache_data stores nothing
+        raise _SummaryNotCached()
+    if handoff is not None:
+        return handoff
+    return generate_summary(question=question, df=df)
+
+def _summary_call(value, question, df):
+    _summary_handoff.value = value
+    try:
+        return generate_summary_cached(question=question, df=df)
+    finally:
+        _summary_handoff.value = None
+
+def stream_summary_cached(question, df):
+    """
+    Yields the summary of `df`: the cached one in a single chunk if
+    generate_summary_cached has it, otherwise the LLM's reply as it streams,
+    which is then cached under the same key.
+    """
+    try:
+        cached_summary = _summary_call(_PEEK, question, df)
+    except _SummaryNotCached:
+        cached_summary = None
+    if cached_summary is not None:
+        yield cached_summary
+        return
+    summary = ""
+    for chunk in stream_summary(question=question, df=df):
+        summary += chunk
+        yield chunk
+    if summary:
+        _summary_call(summary, question, df)
+
+_background = ThreadPoolExecutor(max_workers=8, thread_name_prefix="helper")
+
+def run_in_background(fn, *args, **kwargs):
+    """
+    Runs fn in a worker thread attached to the current Streamlit session,
+    so cached helpers keep working there. Returns a Future.
+    """
+    ctx = get_script_run_ctx()
+    def _run():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+    return _background.submit(_run)
+
+def label_partial_chart(fig, df):
+    # A chart of one page of a larger result says which rows it shows
+    if fig is not None and is_partial(df):
+        fig.add_annotation(text=window_caption(df), xref="paper", yref="paper", x=1, y=1.02,
+                           xanchor="right", yanchor="bottom", showarrow=False, font={"size": 11})
+    return fig
+
+def start_chart(chart_query, question, sql, df):
+    def _chart():
+        # Common chart shapes are drawn from a local template; only the rest go to the LLM
+        spec = match_chart_template(chart_query, df)
+        if spec is not None:
+            return label_partial_chart(render_chart_spec_cached(spec=spec, df=df), df)
+        code = generate_plotly_code_cached(chart_query=chart_query, question=question, sql=sql, df=df)
+        return label_partial_chart(generate_plot_cached(code=code, df=df), df)
+    return run_in_background(_chart)
+
+def chart_result(chart_future):
+    # The figure from start_chart, or None if building it failed; the answer is shown without a chart
+    try:
+        return chart_future.result()
+    except Exception as e:
+        print(f"Chart generation failed: {e}")
+        return None
@@ -1,11 +1,41 @@
+import asyncio
+import hashlib
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from types import SimpleNamespace
+
+DEFAULT_MODEL = "gemini-2.5-pro"
+LLM_MAX_CONCURRENCY = 8
+LLM_TIMEOUT = 120  # seconds
+# Send static prompt prefixes through Vertex context caching. Off: the SQL prompt's prefix
+# (instructions and table) is far below CONTEXT_CACHE_MIN_TOKENS, so with today's prompts
+# every request would be sent inline anyway. Only worth turning on for prefixes that reach it.
+CONTEXT_CACHING = False
+CONTEXT_CACHE_TTL = 60 * 60  # seconds a cached prefix lives on the Vertex side
+CONTEXT_CACHE_MIN_TOKENS = 4096  # Vertex rejects smaller cached contents; shorter prefixes are sent inline
+
+
 # LLMResponseGenerator class to encapsulate prompt submission
 class LLMResponseGenerator:
-    def __init__(self, model_name="gemini-2.5-pro", config=None):
-        self.model = get_multimodal_model(model_name, config)
+    def __init__(self, model_name=DEFAULT_MODEL, config=None, client=None):
+        # Models are shared through the client, so constructing a generator is cheap
+        self.model_name = model_name
+        self.config = config
+        self.client = client or get_llm_client()
 
-    def submit_prompt(self,prompt):
+    def submit_prompt(self, prompt, timeout=None):
         # prompt should be a list of messages
-        return self.model.generate_content(prompt).text
+        return self.client.submit(prompt, model_name=self.model_name, config=self.config, timeout=timeout)
+
+    async def asubmit_prompt(self, prompt, timeout=None):
+        return await self.client.asubmit(prompt, model_name=self.model_name, config=self.config, timeout=timeout)
+
+    def stream_prompt(self, prompt):
+        # Yields the reply text chunk by chunk as the model produces it
+        return self.client.stream(prompt, model_name=self.model_name, config=self.config)
 
 
 import os
@@ -14,11 +44,16 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 key_path = os.path.join(current_dir, "credentials", "key.json")
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = key_path
 
+_vertexai_ready = False
+_vertexai_lock = threading.Lock()
 
-import vertexai
-from vertexai.generative_models import GenerativeModel
-
-vertexai.init(project="statspeak-484706", location="us-central1")
+def _init_vertexai():
+    global _vertexai_ready
+    with _vertexai_lock:
+        if not _vertexai_ready:
+            import vertexai
+            vertexai.init(project="statspeak-484706", location="us-central1")
+            _vertexai_ready = True
 
 # --- Configuration ---
 generation_config = {
@@ -29,7 +64,357 @@ generation_config = {
 
 
 # Function to build and return a GenerativeModel instance
-def get_multimodal_model(model_name="gemini-2.5-pro", config=None):
+def get_multimodal_model(model_name=DEFAULT_MODEL, config=None):
+    _init_vertexai()
+    from vertexai.generative_models import GenerativeModel
     if config is None:
         config = generation_config
     return GenerativeModel(model_name, generation_config=config)
+
+
+class FakeGenerativeModel:
+    """
+    Local stand-in for GenerativeModel. `responses` maps a substring of the
+    prompt to the reply text; `default` is returned when nothing matches.
+    Records every prompt it receives in `calls`.
+    """
+    def __init__(self, responses=None, default="", delay=0.0):
+        self.responses = responses or {}
+        self.default = default
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self._lock:
+            self.calls.append(prompt)
+        if self.delay:
+            time.sleep(self.delay)
+        text = json.dumps(prompt) if not isinstance(prompt, str) else prompt
+        reply = self.default
+        for needle, answer in self.responses.items():
+            if needle in text:
+                reply = answer
+                break
+        usage = SimpleNamespace(prompt_token_count=len(text.split()), candidates_token_count=len(reply.split()))
+        if stream:
+            return self._stream(reply, usage)
+        return SimpleNamespace(text=reply, usage_metadata=usage)
+
+    def _stream(self, reply, usage):
+        # Chunks on word boundaries, like the real streaming API roughly does
+        words = reply.split(" ")
+        for i, word in enumerate(words):
+            chunk = word if i == len(words) - 1 else word + " "
+            yield SimpleNamespace(text=chunk, usage_metadata=usage if i == len(words) - 1 else None)
+
+
+class VertexContextCache:
+    """
+    Creates one Vertex CachedContent per (model, config, static prompt prefix) and
+    returns a model bound to it, so the prefix is processed once on the model
+    side instead of with every request. get_model() returns None when the prefix
+    is too short to cache or caching fails; the caller then sends the full prompt.
+    """
+    def __init__(self, ttl=CONTEXT_CACHE_TTL, min_tokens=CONTEXT_CACHE_MIN_TOKENS):
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self._entries = {}  # key -> (model or None, expires_at)
+        self._creating = {}  # key -> Event set once the create in progress has finished
+        self._lock = threading.Lock()
+
+    def _create(self, model_name, config, prefix):
+        import datetime
+        _init_vertexai()
+        from vertexai.preview import caching
+        from vertexai.preview.generative_models import GenerativeModel
+        cached_content = caching.CachedContent.create(
+            model_name=model_name,
+            contents=[prefix],
+            ttl=datetime.timedelta(seconds=self.ttl),
+        )
+        return GenerativeModel.from_cached_content(
+            cached_content=cached_content,
+            generation_config=config if config is not None else generation_config,
+        )
+
+    def get_model(self, model_name, config, prefix):
+        # Rough count (about four characters per token) to skip a call that would be rejected
+        if len(prefix) // 4 < self.min_tokens:
+            return None
+        key = _prompt_key(model_name, config, hashlib.sha256(prefix.encode('utf-8')).hexdigest())
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                # Renew a minute early so a request never lands on an expired cache
+                if entry is not None and entry[1] - 60 > time.time():
+                    return entry[0]
+                creating = self._creating.get(key)
+                if creating is None:
+                    creating = self._creating[key] = threading.Event()
+                    break
+            # Another request is creating this cache; use its result
+            creating.wait()
+
+        # The create is a network call, so it runs without holding the lock
+        try:
+            model = self._create(model_name, config, prefix)
+        except Exception as e:
+            # Remember the failure for one TTL instead of retrying on every request
+            print(f"Vertex context caching unavailable, sending full prompts: {e}")
+            model = None
+        with self._lock:
+            self._entries[key] = (model, time.time() + self.ttl)
+            del self._creating[key]
+        creating.set()
+        return model
+
+
+class _PrefixedModel:
+    def __init__(self, model, prefix):
+        self.model = model
+        self.prefix = prefix
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        return self.model.generate_content(self.prefix + prompt, stream=stream, **kwargs)
+
+
+class FakeContextCache:
+    """
+    Local stand-in for VertexContextCache: "caches" each prefix by wrapping a
+    model from `model_factory` that prepends it. `created` lists the prefixes
+    cached and `hits` counts requests served from an existing one.
+    """
+    def __init__(self, model_factory):
+        self.model_factory = model_factory
+        self.created = []
+        self.hits = 0
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def get_model(self, model_name, config, prefix):
+        key = _prompt_key(model_name, config, prefix)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = _PrefixedModel(self.model_factory(model_name, config), prefix)
+                self._models[key] = model
+                self.created.append(prefix)
+            else:
+                self.hits += 1
+            return model
+
+
+_STREAM_END = object()
+
+
+def _prompt_key(model_name, config, prompt):
+    return json.dumps([model_name, config, prompt], sort_keys=True, default=str)
+
+
+class LLMClient:
+    """
+    Shared, thread-safe client for the generative model.
+
+    - Models are built once per (model, config) and reused.
+    - Identical prompts that are already in flight are coalesced: one call is
+      made and every caller gets its result.
+    - At most `max_concurrency` calls run at once; callers wait up to `timeout`.
+    - Static prompt prefixes go through `context_cache` (Vertex context caching)
+      when one is available; only the rest of the prompt is sent per request.
+    - metrics() reports call counts, latency and token usage.
+    """
+    def __init__(self, model_factory=get_multimodal_model, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT,
+                 context_cache=None):
+        self.model_factory = model_factory
+        self.timeout = timeout
+        if context_cache is None and CONTEXT_CACHING and model_factory is get_multimodal_model:
+            context_cache = VertexContextCache()
+        self.context_cache = context_cache
+        self._models = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._metrics = {
+            "calls": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "total_latency": 0.0,
+            "max_latency": 0.0,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "context_cached": 0,
+        }
+
+    def get_model(self, model_name=DEFAULT_MODEL, config=None):
+        key = _prompt_key(model_name, config, None)
+        with self._lock:
+            model = self._models.get(key)
+        if model is None:
+            model = self.model_factory(model_name, config)
+            with self._lock:
+                model = self._models.setdefault(key, model)
+        return model
+
+    def _resolve(self, model_name, config, prompt):
+        # Prompts with a static prefix (prompt_assembly.AssembledPrompt) send only their suffix
+        # when the prefix is held in a context cache
+        prefix = getattr(prompt, "prefix", None)
+        if prefix and self.context_cache is not None:
+            model = self.context_cache.get_model(model_name, config, prefix)
+            if model is not None:
+                with self._lock:
+                    self._metrics["context_cached"] += 1
+                return model, prompt.suffix
+        return self.get_model(model_name, config), prompt
+
+    def _call(self, model_name, config, prompt):
+        model, prompt = self._resolve(model_name, config, prompt)
+        start = time.perf_counter()
+        try:
+            response = model.generate_content(prompt)
+            text = response.text
+        except Exception:
+            with self._lock:
+                self._metrics["errors"] += 1
+            raise
+        latency = time.perf_counter() - start
+        usage = getattr(response, "usage_metadata", None)
+        with self._lock:
+            self._metrics["calls"] += 1
+            self._metrics["total_latency"] += latency
+            self._metrics["max_latency"] = max(self._metrics["max_latency"], latency)
+            if usage is not None:
+                self._metrics["prompt_tokens"] += getattr(usage, "prompt_token_count", 0) or 0
+                self._metrics["output_tokens"] += getattr(usage, "candidates_token_count", 0) or 0
+        return text
+
+    def submit_future(self, prompt, model_name=DEFAULT_MODEL, config=None):
+        """
+        Returns a concurrent.futures.Future for the reply, sharing an in-flight call if there is one.
+        """
+        key = _prompt_key(model_name, config, prompt)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._metrics["coalesced"] += 1
+                return future
+            future = self._executor.submit(self._call, model_name, config, prompt)
+            self._inflight[key] = future
+
+        def _done(_):
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+        future.add_done_callback(_done)
+        return future
+
+    def submit(self, prompt, model_name=DEFAULT_MODEL, config=None, timeout=None):
+        future = self.submit_future(prompt, model_name, config)
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._metrics["timeouts"] += 1
+            raise TimeoutError("LLM call timed out")
+
+    async def asubmit(self, prompt, model_name=DEFAULT_MODEL, config=None, timeout=None):
+        future = asyncio.wrap_future(self.submit_future(prompt, model_name, config))
+        try:
+            # shield() so one caller timing out does not cancel the call for the others
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._metrics["timeouts"] += 1
+            raise TimeoutError("LLM call timed out")
+
+    def _stream_to(self, chunks, stop, model_name, config, prompt):
+        # Runs on the worker pool: reads the model's stream into `chunks`, ending with
+        # _STREAM_END or the exception raised, and stops early once `stop` is set
+        start = time.perf_counter()
+        usage = None
+        try:
+            model, prompt = self._resolve(model_name, config, prompt)
+            for response in model.generate_content(prompt, stream=True):
+                if stop.is_set():
+                    break
+                usage = getattr(response, "usage_metadata", None) or usage
+                try:
+                    text = response.text
+                except ValueError:
+                    # Chunks without text (e.g. only safety metadata) are skipped
+                    continue
+                if text:
+                    chunks.put(text)
+            chunks.put(_STREAM_END)
+        except Exception as e:
+            with self._lock:
+                self._metrics["errors"] += 1
+            chunks.put(e)
+        finally:
+            latency = time.perf_counter() - start
+            with self._lock:
+                self._metrics["calls"] += 1
+                self._metrics["total_latency"] += latency
+                self._metrics["max_latency"] = max(self._metrics["max_latency"], latency)
+                if usage is not None:
+                    self._metrics["prompt_tokens"] += getattr(usage, "prompt_token_count", 0) or 0
+                    self._metrics["output_tokens"] += getattr(usage, "candidates_token_count", 0) or 0
+
+    def stream(self, prompt, model_name=DEFAULT_MODEL, config=None, timeout=None):
+        """
+        Yields reply text chunks as they arrive. Streams are not coalesced, but run
+        on the same worker pool as submit(), so they count against max_concurrency,
+        and the whole reply (including the wait for a worker) must arrive within
+        `timeout`. Closing the generator early stops reading the rest of the reply.
+        """
+        chunks = queue.Queue()
+        stop = threading.Event()
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        self._executor.submit(self._stream_to, chunks, stop, model_name, config, prompt)
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    with self._lock:
+                        self._metrics["timeouts"] += 1
+                    raise TimeoutError("LLM call timed out")
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["in_flight"] = len(self._inflight)
+        stats["avg_latency"] = stats["total_latency"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
+
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+def get_llm_client():
+    """
+    Returns the process-wide LLMClient, creating it on first use.
+    """
+    global _llm_client
+    with _llm_client_lock:
+        if _llm_client is None:
+            _llm_client = LLMClient()
+        return _llm_client
+
+def set_llm_client(client):
+    """
+    Replaces the process-wide client, e.g. with LLMClient(model_factory=lambda *_: FakeGenerativeModel(...)),
+    optionally with context_cache=FakeContextCache(that factory).
+    """
+    global _llm_client
+    with _llm_client_lock:
+        _llm_client = client
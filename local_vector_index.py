@@ -0,0 +1,78 @@
+import json
+import os
+import numpy as np
+from langchain_core.documents import Document
+
+
+class LocalVectorIndex:
+    """
+    In-process replacement for the OpenSearch vector store.
+
+    Embeddings live in a row-normalised float32 matrix on disk (`<path>.npy`),
+    memory-mapped on load, with the documents and the knowledge-base hash beside
+    it in `<path>.json`. similarity_search() mirrors OpenSearchVectorSearch so
+    get_columns works unchanged with either engine.
+    """
+    def __init__(self, matrix, documents, embedding_model, kb_hash=None):
+        self.matrix = matrix
+        self.documents = documents
+        self.embedding_model = embedding_model
+        self.kb_hash = kb_hash
+
+    @classmethod
+    def build(cls, documents, embedding_model, path, kb_hash=None, batch_size=64):
+        vectors = []
+        for start in range(0, len(documents), batch_size):
+            texts = [document.page_content for document in documents[start:start + batch_size]]
+            vectors.extend(embedding_model.embed_documents(texts))
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.size:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path + ".npy", matrix)
+        with open(path + ".json", 'w') as f:
+            json.dump({
+                "kb_hash": kb_hash,
+                "documents": [{"page_content": d.page_content, "metadata": d.metadata} for d in documents],
+            }, f)
+        return cls.load(path, embedding_model)
+
+    @classmethod
+    def load(cls, path, embedding_model):
+        """
+        Loads a saved index, memory-mapping the embedding matrix. Returns None if there is none.
+        """
+        if not (os.path.exists(path + ".npy") and os.path.exists(path + ".json")):
+            return None
+        matrix = np.load(path + ".npy", mmap_mode='r')
+        with open(path + ".json", 'r') as f:
+            stored = json.load(f)
+        documents = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in stored["documents"]]
+        return cls(matrix, documents, embedding_model, kb_hash=stored.get("kb_hash"))
+
+    def search_by_vector(self, vector, k=7):
+        """
+        Returns (index, score) pairs for the k rows most similar to `vector`, best first.
+        """
+        n = len(self.documents)
+        if n == 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = self.matrix @ query
+        k = min(k, n)
+        if k < n:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(n)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def similarity_search(self, query, k=7):
+        vector = self.embedding_model.embed_query(query)
+        return [self.documents[i] for i, _ in self.search_by_vector(vector, k)]
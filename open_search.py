@@ -1,21 +1,74 @@
+import time
+_import_start = time.perf_counter()
+
+import hashlib
 import json
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import threading
 from opensearchpy import OpenSearch
-from langchain_community.vectorstores import OpenSearchVectorSearch
 from utility import load_json_data
+import startup
 
 VM_IP = 'localhost'
 PORT = '9200'
 PROJECT_ID = "statspeak-484706"
 MODEL = "text-embedding-005"
+INDEX_NAME = "statspeak"
+INDEX_SYNC_MODE = "incremental"  # "incremental" embeds only changed columns, "full" rebuilds the index
+EMBED_BATCH_SIZE = 64
+RETRIEVAL_ENGINE = "opensearch"  # "opensearch" or "local" (in-process NumPy index, no container needed)
 import os
 current_dir = os.path.dirname(os.path.abspath(__file__))
 key_path = os.path.join(current_dir, "credentials", "key.json")
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = key_path
+KNOWLEDGE_BASE_PATH = os.path.join(current_dir, "knowledge_base", "customer_shopping_data_columns.jsonl")
+LOCAL_INDEX_PATH = os.path.join(current_dir, "cache", "column_index")
+EXAMPLE_INDEX_NAME = "statspeak_examples"
+LOCAL_EXAMPLE_INDEX_PATH = os.path.join(current_dir, "cache", "example_index")
+
+_embedding_model = None
+_docsearch = None
+_init_lock = threading.Lock()
+_warm_up_thread = None
+_example_index = None
+_example_index_version = None
+_example_lock = threading.Lock()
+
+
+def get_embedding_model():
+    global _embedding_model
+    if _embedding_model is None:
+        with startup.timed("embedding model"):
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+            _embedding_model = GoogleGenerativeAIEmbeddings(model=MODEL, project=PROJECT_ID)
+    return _embedding_model
+
+
+def get_documents(file_path=KNOWLEDGE_BASE_PATH):
+    return load_json_data(file_path=file_path)
 
 
-EMBEDDING_MODEL = GoogleGenerativeAIEmbeddings(model=MODEL, project=PROJECT_ID)
-DOCUMENT = load_json_data(file_path='knowledge_base\customer_shopping_data_columns.jsonl')
+def knowledge_base_hash(file_path=KNOWLEDGE_BASE_PATH):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def document_id(document):
+    """
+    Stable id for a column record, so re-syncs overwrite rather than duplicate it.
+    """
+    if "doc_id" in document.metadata:
+        return document.metadata["doc_id"]
+    data = json.loads(document.page_content)
+    key = f"{data.get('dataset_name', '')}.{data.get('table_name', '')}.{data.get('column_name', '')}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def document_hash(document):
+    if "doc_id" in document.metadata:
+        # Sample questions keep their SQL in metadata; a changed SQL must be re-synced too
+        content = document.page_content + json.dumps(document.metadata, sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+    return hashlib.sha256(document.page_content.encode('utf-8')).hexdigest()
 
 
 def get_opensearch_client(vm_ip=VM_IP, port=PORT, http_auth=("admin", "admin")):
@@ -26,33 +79,212 @@ def get_opensearch_client(vm_ip=VM_IP, port=PORT, http_auth=("admin", "admin")):
         verify_certs=False
     )
 
-def ensure_index(client, index_name = "statspeak"):
+def get_index_hash(client, index_name=INDEX_NAME):
+    """
+    Returns the knowledge-base hash the index was built from, or None if the index is missing.
+    """
+    if not client.indices.exists(index=index_name):
+        return None
+    mapping = client.indices.get_mapping(index=index_name)
+    return mapping.get(index_name, {}).get("mappings", {}).get("_meta", {}).get("kb_hash")
+
+def ensure_index(client, index_name=INDEX_NAME, kb_hash=None):
+    """
+    Returns True if the index has to be (re)built. An existing index is only
+    dropped when it was built from a different version of the knowledge base.
+    """
+    current = get_index_hash(client, index_name)
+    if current is not None and current == kb_hash:
+        return False
     if client.indices.exists(index=index_name):
         client.indices.delete(index=index_name)
+    return True
 
-client = get_opensearch_client()
+def get_indexed_hashes(client, index_name=INDEX_NAME):
+    """
+    Returns {document id: content hash} for every record already in the index.
+    """
+    from opensearchpy import helpers
+    if not client.indices.exists(index=index_name):
+        return {}
+    hashes = {}
+    query = {"query": {"match_all": {}}, "_source": ["metadata.content_hash"]}
+    for hit in helpers.scan(client, index=index_name, query=query):
+        hashes[hit["_id"]] = hit.get("_source", {}).get("metadata", {}).get("content_hash")
+    return hashes
 
-def create_docsearch(documents = DOCUMENT, embedding_model=EMBEDDING_MODEL, vm_ip=VM_IP, port=PORT, index_name="statspeak", engine="faiss", http_auth=("admin", "admin"), use_ssl=False, verify_certs=False,client = client):
+def sync_index(docsearch, client, documents, embedding_model, index_name=INDEX_NAME, batch_size=EMBED_BATCH_SIZE, engine="faiss"):
     """
-    Creates and returns an OpenSearchVectorSearch instance.
+    Brings the index in line with `documents`: embeds only new or changed column
+    descriptions (in batches), upserts them by stable id and deletes removed ones.
+    Returns counts of what was done.
     """
-    ensure_index(client)
-    return OpenSearchVectorSearch.from_documents(
-        documents,
-        embedding_model,
-        opensearch_url=f'http://{vm_ip}:{port}',
+    from opensearchpy import helpers
+    indexed = get_indexed_hashes(client, index_name)
+    wanted = {}
+    for document in documents:
+        wanted[document_id(document)] = document
+
+    changed = [
+        (doc_id, document) for doc_id, document in wanted.items()
+        if indexed.get(doc_id) != document_hash(document)
+    ]
+    for start in range(0, len(changed), batch_size):
+        batch = changed[start:start + batch_size]
+        texts = [document.page_content for _, document in batch]
+        vectors = embedding_model.embed_documents(texts)
+        metadatas = [dict(document.metadata, content_hash=document_hash(document)) for _, document in batch]
+        docsearch.add_embeddings(
+            list(zip(texts, vectors)),
+            metadatas=metadatas,
+            ids=[doc_id for doc_id, _ in batch],
+            engine=engine,
+        )
+
+    removed = [doc_id for doc_id in indexed if doc_id not in wanted]
+    if removed:
+        helpers.bulk(client, ({"_op_type": "delete", "_index": index_name, "_id": doc_id} for doc_id in removed))
+    if client.indices.exists(index=index_name):
+        client.indices.refresh(index=index_name)
+    return {"upserted": len(changed), "deleted": len(removed), "unchanged": len(wanted) - len(changed)}
+
+def _attach_docsearch(opensearch_url, index_name, embedding_model, http_auth, use_ssl, verify_certs):
+    from langchain_community.vectorstores import OpenSearchVectorSearch
+    return OpenSearchVectorSearch(
+        opensearch_url=opensearch_url,
         index_name=index_name,
-        engine=engine,
+        embedding_function=embedding_model,
         http_auth=http_auth,
         use_ssl=use_ssl,
         verify_certs=verify_certs,
     )
-docsearch = create_docsearch()
 
-def get_columns(question, docsearch = docsearch):
+def create_docsearch(documents=None, embedding_model=None, vm_ip=VM_IP, port=PORT, index_name=INDEX_NAME, engine="faiss", http_auth=("admin", "admin"), use_ssl=False, verify_certs=False, client=None, sync_mode=INDEX_SYNC_MODE, kb_path=KNOWLEDGE_BASE_PATH):
+    """
+    Creates and returns an OpenSearchVectorSearch instance, building the index
+    only if it is missing or the knowledge base has changed since it was built.
+    With sync_mode="incremental" a changed knowledge base is synced record by record.
+    `kb_path` is the file the documents come from; pass `documents` if it is not the column knowledge base.
+    """
+    client = client or get_opensearch_client(vm_ip, port, http_auth)
+    embedding_model = embedding_model or get_embedding_model()
+    kb_hash = knowledge_base_hash(kb_path)
+    opensearch_url = f'http://{vm_ip}:{port}'
+    if sync_mode == "incremental":
+        docsearch = _attach_docsearch(opensearch_url, index_name, embedding_model, http_auth, use_ssl, verify_certs)
+        if get_index_hash(client, index_name) != kb_hash:
+            with startup.timed("index sync"):
+                result = sync_index(docsearch, client, documents or get_documents(), embedding_model, index_name, engine=engine)
+                client.indices.put_mapping(index=index_name, body={"_meta": {"kb_hash": kb_hash}})
+            print(f"Synced index {index_name}: {result}")
+        return docsearch
+    if not ensure_index(client, index_name, kb_hash):
+        return _attach_docsearch(opensearch_url, index_name, embedding_model, http_auth, use_ssl, verify_certs)
+    from langchain_community.vectorstores import OpenSearchVectorSearch
+    with startup.timed("index build"):
+        docsearch = OpenSearchVectorSearch.from_documents(
+            documents or get_documents(),
+            embedding_model,
+            opensearch_url=opensearch_url,
+            index_name=index_name,
+            engine=engine,
+            http_auth=http_auth,
+            use_ssl=use_ssl,
+            verify_certs=verify_certs,
+        )
+        client.indices.put_mapping(index=index_name, body={"_meta": {"kb_hash": kb_hash}})
+    return docsearch
+
+def create_local_docsearch(documents=None, embedding_model=None, path=LOCAL_INDEX_PATH, kb_path=KNOWLEDGE_BASE_PATH):
+    """
+    Returns the in-process LocalVectorIndex, rebuilding the saved embedding file
+    only if it is missing or the knowledge base has changed.
+    """
+    from local_vector_index import LocalVectorIndex
+    embedding_model = embedding_model or get_embedding_model()
+    kb_hash = knowledge_base_hash(kb_path)
+    index = LocalVectorIndex.load(path, embedding_model)
+    if index is not None and index.kb_hash == kb_hash:
+        return index
+    with startup.timed("local index build"):
+        return LocalVectorIndex.build(documents or get_documents(), embedding_model, path,
+                                      kb_hash=kb_hash, batch_size=EMBED_BATCH_SIZE)
+
+def get_docsearch():
+    """
+    Returns the shared vector store for the configured RETRIEVAL_ENGINE, initialising it on first use.
+    Safe to call from several threads; the index is built at most once per process.
+    """
+    global _docsearch
+    if _docsearch is None:
+        with _init_lock:
+            if _docsearch is None:
+                with startup.timed("docsearch init"):
+                    if RETRIEVAL_ENGINE == "local":
+                        _docsearch = create_local_docsearch()
+                    else:
+                        _docsearch = create_docsearch()
+    return _docsearch
+
+def warm_up():
+    """
+    Starts initialising the vector store in a background thread so the first
+    question does not pay for it. Calling it again is a no-op.
+    """
+    global _warm_up_thread
+    with _init_lock:
+        if _warm_up_thread is None and _docsearch is None:
+            def _run():
+                try:
+                    get_docsearch()
+                except Exception as e:
+                    print(f"OpenSearch warm-up failed: {e}")
+            _warm_up_thread = threading.Thread(target=_run, name="opensearch-warm-up", daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
+
+def get_example_documents(examples):
+    """
+    One document per sample question; the question is what gets embedded and the SQL rides along in metadata.
+    """
+    from langchain_core.documents import Document
+    return [
+        Document(
+            page_content=example["question"],
+            metadata={
+                "doc_id": hashlib.sha1(example["question"].encode('utf-8')).hexdigest(),
+                "question": example["question"],
+                "sql": example["sql"],
+            },
+        )
+        for example in examples
+    ]
+
+def get_example_index(load_examples, version, kb_path):
+    """
+    Returns the vector store of sample questions for the configured RETRIEVAL_ENGINE,
+    syncing it when the example library `version` (its content hash) changes.
+    `load_examples()` is only called when the index has to be built or synced.
+    """
+    global _example_index, _example_index_version
+    with _example_lock:
+        if _example_index is None or _example_index_version != version:
+            with startup.timed("example index init"):
+                documents = get_example_documents(load_examples())
+                if RETRIEVAL_ENGINE == "local":
+                    _example_index = create_local_docsearch(documents, path=LOCAL_EXAMPLE_INDEX_PATH, kb_path=kb_path)
+                else:
+                    _example_index = create_docsearch(documents, index_name=EXAMPLE_INDEX_NAME, kb_path=kb_path)
+            _example_index_version = version
+        return _example_index
+
+def get_columns(question, docsearch=None):
+    docsearch = docsearch or get_docsearch()
     response = docsearch.similarity_search(question, k=7)
     columns = []
     for data in response:
         data = json.loads(data.page_content)
         columns.append({"column_name": data['column_name'], "description": data['description']})
-    return columns
\ No newline at end of file
+    return columns
+
+startup.record("open_search import", time.perf_counter() - _import_start)
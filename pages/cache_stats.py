@@ -0,0 +1,52 @@
+import pandas as pd
+import streamlit as st
+from cache_policy import CACHE_POLICIES, invalidate, stats
+from semantic_cache import get_sql_cache
+from result_cache import get_result_cache
+from chart_code_cache import get_chart_code_cache
+from rollups import get_rollup_store
+from sql_backends import get_backend
+from llm_response_generator import get_llm_client
+from utility import get_sql_pool
+
+st.set_page_config(page_title="Statspeak - Cache stats", layout="wide")
+st.header("Cache stats")
+
+st.subheader("Response caches")
+st.dataframe(pd.DataFrame(stats()), hide_index=True)
+
+st.subheader("Invalidate")
+columns = st.columns(len(CACHE_POLICIES) + 1)
+for column, namespace in zip(columns, CACHE_POLICIES):
+    if column.button(f"Clear {namespace}"):
+        invalidate(namespace)
+        st.rerun()
+if columns[-1].button("Clear all"):
+    invalidate()
+    st.rerun()
+
+st.subheader("Semantic SQL cache")
+st.json(get_sql_cache().stats())
+
+st.subheader("SQL result cache")
+st.json(get_result_cache().stats())
+
+st.subheader("Rollup cubes")
+st.json(get_rollup_store().stats())
+if st.button("Rebuild rollups"):
+    get_rollup_store().refresh_async()
+
+st.subheader("Local snapshot")
+st.json(get_backend("local").snapshot.stats())
+if st.button("Refresh snapshot"):
+    get_backend("local").snapshot.refresh_async()
+
+st.subheader("LLM client")
+st.json(get_llm_client().metrics())
+
+st.subheader("SQL connection pool")
+st.json(get_sql_pool().metrics())
+
+st.subheader("Chart code cache")
+st.json(get_chart_code_cache().stats())
+st.dataframe(pd.DataFrame(get_chart_code_cache().entry_stats()), hide_index=True)
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import threading
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# --- Configuration ---
+SAMPLE_SQL_PATH = os.path.join(current_dir, "knowledge_base", "sample_sql_query.json")
+TABLE = "customer_shopping_data"
+INSTRUCTIONS = (
+    "You are a Microsoft SQL Server Management Studio expert. "
+    "Please help to generate a SQL query that can run on Microsoft SQL Server to answer the question. Your response should ONLY be based on the given context and follow the response guidelines and format instructions. "
+)
+DOC_LIST = ['Always cast the column invoice_date using Date function', 'If Year is not mentioned in the question, then always filter on current year','Column alias should be under square brackets ("[]")']
+RESPONSE_GUIDELINES = (
+    "===Response Guidelines \n"
+    "Please generate the SQL query that corresponds to the question above. "
+    "Always study the question properly and try to find similar columns in the columns section. "
+    "Check for gender, especially in the question."
+)
+
+
+# --- Renderers (each returns one prompt section) ---
+def render_table(table: str) -> str:
+    return f"\n===Table \n {table}"
+
+
+def render_docs(docs: list) -> str:
+    if not docs:
+        return ""
+    return "\n===Additional Context \n\n" + "\n\n".join(docs) + "\n"
+
+
+def render_columns(cols_list: list) -> str:
+    if not cols_list:
+        return ""
+    return "\n===Columns \n" + "".join(f"{col}\n" for col in cols_list)
+
+
+def render_examples(question_sql_list: list) -> str:
+    if not question_sql_list:
+        return ""
+    parts = ["\n===Sample questions and corresponding sqls\n\n"]
+    for example in question_sql_list:
+        if example is None:
+            print("example is None")
+        elif "question" in example and "sql" in example:
+            parts.append(f"\nQuestion: {example['question']}, Sql: {example['sql']}\n")
+    return "".join(parts)
+
+
+def render_question(question: str) -> str:
+    return f"\n\nQuestion: {question}\n"
+
+
+class AssembledPrompt(str):
+    """
+    The full prompt text, remembering which leading part is static. The
+    LLM client can send `prefix` through Vertex context caching and only
+    `suffix` with the request; everything else treats it as a plain string.
+    """
+    def __new__(cls, prefix: str, suffix: str):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        return prompt
+
+
+class WatchedFile:
+    """
+    Parsed contents of a file, reloaded only when its mtime or size changes and
+    re-parsed only when its content hash changes. `version` is that hash.
+    """
+    def __init__(self, path, parse=json.loads):
+        self.path = path
+        self.parse = parse
+        self.value = None
+        self.version = None
+        self._stat = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if signature != self._stat:
+                with open(self.path, 'rb') as f:
+                    raw = f.read()
+                version = hashlib.sha256(raw).hexdigest()
+                if version != self.version:
+                    self.value = self.parse(raw)
+                    self.version = version
+                self._stat = signature
+            return self.value
+
+
+class PromptAssembler:
+    """
+    Builds SQL-generation prompts from pre-rendered parts, in the original order:
+    instructions, table, columns, examples, question, guidelines. The static
+    prefix (instructions and table) and, for a small library, the rendered
+    few-shot block are built once and again only when the examples file
+    changes; each request only renders its own sections and joins the parts
+    once. A large example library is not added whole: each prompt gets the
+    examples most similar to its question (see example_selector).
+    """
+    def __init__(self, table=TABLE, sample_sql_path=SAMPLE_SQL_PATH, instructions=INSTRUCTIONS):
+        self.table = table
+        self.instructions = instructions
+        self.sample_sql_path = sample_sql_path
+        self._examples = WatchedFile(sample_sql_path)
+        self._prefix = instructions + render_table(table)
+        self._examples_block = (None, None)  # (examples version, rendered examples)
+        self._lock = threading.Lock()
+
+    def examples(self) -> list:
+        return self._examples.get()
+
+    def selects_examples(self) -> bool:
+        from example_selector import SELECT_ABOVE
+        return len(self.examples()) > SELECT_ABOVE
+
+    def static_prefix(self) -> str:
+        return self._prefix
+
+    def examples_block(self) -> str:
+        """
+        The whole (deduplicated, budgeted) example library, rendered once per file version.
+        """
+        examples = self.examples()
+        with self._lock:
+            version, block = self._examples_block
+            if block is None or version != self._examples.version:
+                from example_selector import dedupe_examples, fit_token_budget
+                block = render_examples(fit_token_budget(dedupe_examples(examples)))
+                self._examples_block = (self._examples.version, block)
+            return block
+
+    def select_examples(self, question: str) -> list:
+        from example_selector import select_examples, dedupe_examples, fit_token_budget, EXAMPLES_PER_PROMPT
+        examples = self.examples()
+        try:
+            return select_examples(question, examples, self._examples.version, self.sample_sql_path)
+        except Exception as e:
+            print(f"Example retrieval failed, using the first examples: {e}")
+            return fit_token_budget(dedupe_examples(examples)[:EXAMPLES_PER_PROMPT])
+
+    def build(self, question: str, columns: list, question_sql_list: list = None, extra_docs: list = None) -> AssembledPrompt:
+        """
+        `question_sql_list` replaces the examples file for this prompt; `extra_docs`
+        (e.g. doc_list and intermediate query results) go after the examples.
+        """
+        if question_sql_list is None and not self.selects_examples():
+            examples = self.examples_block()
+        else:
+            examples = render_examples(
+                question_sql_list if question_sql_list is not None else self.select_examples(question)
+            )
+        suffix = "".join([
+            render_columns(columns),
+            examples,
+            render_docs(extra_docs),
+            render_question(question),
+            RESPONSE_GUIDELINES,
+        ])
+        return AssembledPrompt(self._prefix, suffix)
+
+
+_assembler = None
+_assembler_lock = threading.Lock()
+
+def get_prompt_assembler():
+    global _assembler
+    with _assembler_lock:
+        if _assembler is None:
+            _assembler = PromptAssembler()
+        return _assembler
@@ -0,0 +1,291 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+import numpy as np
+import pandas as pd
+import sqlparse
+from sqlparse import tokens as T
+
+# --- Configuration ---
+# Version token for customer_shopping_data read from catalog metadata, so no table
+# rows are scanned: the row count from sys.partitions and the last insert, update or
+# delete SQL Server recorded for the table (sys.dm_db_index_usage_stats; needs
+# VIEW DATABASE STATE). Swap for MAX(rowversion) if the table gets such a column.
+VERSION_PROBE_SQL = (
+    "SELECT (SELECT SUM(p.rows) FROM sys.partitions p "
+    "WHERE p.object_id = OBJECT_ID('dbo.customer_shopping_data') AND p.index_id IN (0, 1)) AS row_count, "
+    "(SELECT MAX(s.last_user_update) FROM sys.dm_db_index_usage_stats s "
+    "WHERE s.database_id = DB_ID() AND s.object_id = OBJECT_ID('dbo.customer_shopping_data')) AS last_update"
+)
+# Used if the usage stats cannot be read: catches inserts and deletes, and the TTL covers updates
+VERSION_PROBE_FALLBACK_SQL = (
+    "SELECT SUM(p.rows) AS row_count FROM sys.partitions p "
+    "WHERE p.object_id = OBJECT_ID('dbo.customer_shopping_data') AND p.index_id IN (0, 1)"
+)
+PROBE_INTERVAL = 10  # seconds a probed version is trusted before probing again
+MAX_ENTRIES = 200  # default; the app uses the sql_results policy in cache_policy
+RESULT_TTL = 60 * 60  # seconds; backstop for changes the probe cannot see
+MEMORY_BUDGET = 256 * 1024 * 1024  # bytes of cached result frames
+FINGERPRINT_SAMPLE_ROWS = 64  # rows re-hashed to check a stamped fingerprint still describes the frame
+
+
+def _canonical_number(text: str) -> str:
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        return text
+    if '.' not in text and 'e' not in text.lower():
+        return str(int(value))
+    # Keep it a decimal literal so integer vs decimal arithmetic is unchanged
+    normalised = format(value.normalize(), 'f')
+    return normalised if '.' in normalised else normalised + '.0'
+
+
+def normalise_sql(sql: str) -> str:
+    """
+    Canonical form of a query for use as a cache key: comments and a trailing ';'
+    removed, whitespace collapsed, keywords and function names upper-cased, numeric literals
+    written in one form. String literals and identifiers are kept as they are.
+    """
+    formatted = sqlparse.format(sql, strip_comments=True).strip().rstrip(';').strip()
+    parts = []
+    for statement in sqlparse.parse(formatted):
+        flat = list(statement.flatten())
+        for i, token in enumerate(flat):
+            is_function = (
+                token.ttype in T.Name and i + 1 < len(flat)
+                and flat[i + 1].ttype in T.Punctuation and flat[i + 1].value == '('
+            )
+            if token.is_whitespace:
+                if parts and parts[-1] != ' ':
+                    parts.append(' ')
+            elif token.ttype in T.Comment:
+                continue
+            elif token.ttype in T.Keyword or token.ttype in T.Name.Builtin or is_function:
+                parts.append(token.normalized.upper())
+            elif token.ttype in T.Number:
+                parts.append(_canonical_number(token.value))
+            else:
+                parts.append(token.value)
+    return "".join(parts).strip()
+
+
+def _sample_checksum(df: pd.DataFrame) -> str:
+    # Hash of up to FINGERPRINT_SAMPLE_ROWS evenly spaced rows (always the first and last)
+    if len(df) > FINGERPRINT_SAMPLE_ROWS:
+        positions = np.linspace(0, len(df) - 1, FINGERPRINT_SAMPLE_ROWS).astype(int)
+        df = df.iloc[np.unique(positions)]
+    content = pd.util.hash_pandas_object(df, index=True).values.tobytes()
+    return hashlib.sha1(content + repr(tuple(map(str, df.columns))).encode('utf-8')).hexdigest()
+
+
+def fingerprint_frame(df: pd.DataFrame, sql: str, version, page: int = 0) -> str:
+    """
+    Stamps `df` with a stable fingerprint derived from the query, the table
+    version it was read under and its shape, so cached helpers can key on it
+    without hashing the data. Returns the fingerprint.
+    """
+    key = repr((normalise_sql(sql), version, page, df.shape, tuple(map(str, df.columns))))
+    fingerprint = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    df.attrs["fingerprint"] = fingerprint
+    # attrs are copied onto derived frames, so the stamp is tied to this object and its sampled content
+    df.attrs["fingerprint_check"] = (id(df), df.shape, _sample_checksum(df))
+    return fingerprint
+
+
+def dataframe_fingerprint(df: pd.DataFrame) -> str:
+    """
+    hash_funcs entry for DataFrames: the stamped fingerprint when `df` is the
+    frame that was stamped and a sample of its rows is unchanged, otherwise a
+    content hash (copies, slices and filtered frames always get the latter).
+    """
+    fingerprint = df.attrs.get("fingerprint")
+    check = df.attrs.get("fingerprint_check")
+    if fingerprint is not None and check is not None and check[0] == id(df) and tuple(check[1]) == df.shape:
+        if check[2] == _sample_checksum(df):
+            return fingerprint
+    content = pd.util.hash_pandas_object(df, index=True).values.tobytes()
+    return hashlib.sha1(content + repr(tuple(map(str, df.columns))).encode('utf-8')).hexdigest()
+
+
+class TableVersionProbe:
+    """
+    Tracks a version token for the source table by running `probe_sql` (or
+    `fallback_sql` if that fails) at most once every `interval` seconds. Probes
+    run in a background thread and the last token is returned meanwhile, so
+    callers never wait on the database. version() returns None until the first
+    probe succeeds or after one fails, which callers must treat as "unknown"
+    and not serve cached results.
+    """
+    def __init__(self, connect, probe_sql=VERSION_PROBE_SQL, interval=PROBE_INTERVAL,
+                 fallback_sql=VERSION_PROBE_FALLBACK_SQL):
+        self.connect = connect
+        self.probe_sql = probe_sql
+        self.fallback_sql = fallback_sql
+        self.interval = interval
+        self._version = None
+        self._probed_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _run_probe(self, sql):
+        conn = self.connect()
+        if conn is None:
+            return None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            row = cursor.fetchone()
+            cursor.close()
+            return repr(tuple(row)) if row is not None else None
+        finally:
+            conn.close()
+
+    def _probe(self):
+        try:
+            return self._run_probe(self.probe_sql)
+        except Exception as e:
+            if not self.fallback_sql:
+                print(f"Table version probe failed: {e}")
+                return None
+            print(f"Table version probe failed, using the fallback probe: {e}")
+        try:
+            return self._run_probe(self.fallback_sql)
+        except Exception as e:
+            print(f"Table version probe failed: {e}")
+            return None
+
+    def _update(self):
+        version = self._probe()
+        with self._lock:
+            self._version = version
+            self._probed_at = time.monotonic()
+            self._refreshing = False
+        return version
+
+    def version(self, force=False):
+        """
+        The current token. force=True probes now, on the calling thread.
+        """
+        with self._lock:
+            if not force:
+                if time.monotonic() - self._probed_at >= self.interval and not self._refreshing:
+                    # Probe in the background and serve the last token until it returns
+                    self._refreshing = True
+                    threading.Thread(target=self._update, name="version-probe", daemon=True).start()
+                return self._version
+            self._refreshing = True
+        return self._update()
+
+
+class ResultCache:
+    """
+    Caches query results keyed on the normalised SQL and page. An entry is only
+    served while the table version it was computed under is still current, so a
+    change to the data invalidates every dependent result at once. Entries also
+    expire after `ttl` seconds whatever the version says.
+    """
+    def __init__(self, probe, max_entries=MAX_ENTRIES, memory_budget=MEMORY_BUDGET, ttl=RESULT_TTL):
+        self.probe = probe
+        self.max_entries = max_entries
+        self.memory_budget = memory_budget
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (version, df, size, stored at)
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _evict(self):
+        # Caller must hold the lock
+        while self._entries and (len(self._entries) > self.max_entries or self._memory_used > self.memory_budget):
+            _, (_, _, size, _) = self._entries.popitem(last=False)
+            self._memory_used -= size
+
+    def get_or_run(self, sql: str, run, page: int = 0):
+        """
+        Returns the cached result of `sql` (page `page`) if it is still fresh,
+        otherwise calls run(sql, page) and caches the DataFrame it returns.
+        Error strings from run_sql are passed through and never cached.
+        """
+        version = self.probe.version()
+        key = (normalise_sql(sql), page)
+        if version is not None:
+            with self._lock:
+                entry = self._entries.get(key)
+                fresh = entry is not None and (self.ttl is None or time.monotonic() - entry[3] < self.ttl)
+                if fresh and entry[0] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                if entry is not None:
+                    self.stale += 1
+                    del self._entries[key]
+                    self._memory_used -= entry[2]
+                self.misses += 1
+
+        df = run(sql, page)
+        if not isinstance(df, pd.DataFrame):
+            return df
+        if version is None:
+            if "fingerprint" not in df.attrs:
+                # Without a version token the data itself identifies the result (hashed once, here)
+                fingerprint_frame(df, sql, ("content", dataframe_fingerprint(df)), page)
+            return df
+        fingerprint_frame(df, sql, version, page)
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            self._entries[key] = (version, df, size, time.monotonic())
+            self._memory_used += size
+            self._evict()
+        return df
+
+    def evict(self, sql: str):
+        """
+        Drops every cached page of `sql`, leaving other queries' results in place.
+        """
+        key = normalise_sql(sql)
+        with self._lock:
+            for cached_key in [k for k in self._entries if k[0] == key]:
+                self._memory_used -= self._entries.pop(cached_key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_used = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_used,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_evictions": self.stale,
+                "table_version": self.probe._version,
+            }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """
+    Returns the process-wide result cache, probing the table through the SQL connection pool.
+    """
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            from utility import create_sql_connection
+            from cache_policy import CACHE_POLICIES
+            _result_cache = ResultCache(
+                TableVersionProbe(create_sql_connection),
+                max_entries=CACHE_POLICIES["sql_results"]["max_entries"],
+                ttl=CACHE_POLICIES["sql_results"]["ttl"],
+            )
+            # Start the first probe now so a token is ready by the first query
+            _result_cache.probe.version()
+        return _result_cache
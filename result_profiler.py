@@ -0,0 +1,94 @@
+import pandas as pd
+from result_window import is_partial, window_caption
+
+# --- Configuration ---
+TOKEN_BUDGET = 2000  # rough token budget for a DataFrame description in a prompt
+CHARS_PER_TOKEN = 4
+TOP_K_CATEGORIES = 5
+SAMPLE_ROWS = 5
+FULL_TABLE_MAX_ROWS = 100  # results up to this size are sent in full if they fit the budget
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _numeric_stats(df: pd.DataFrame) -> str:
+    numeric = df.select_dtypes(include=["number"])
+    if numeric.empty:
+        return ""
+    # One vectorised pass per statistic over all numeric columns
+    stats = pd.DataFrame({
+        "min": numeric.min(),
+        "max": numeric.max(),
+        "mean": numeric.mean(),
+        "sum": numeric.sum(),
+        "nulls": numeric.isna().sum(),
+    }).round(2)
+    return "Numeric columns:\n" + stats.to_markdown()
+
+
+def _category_stats(df: pd.DataFrame, top_k: int) -> str:
+    categorical = df.select_dtypes(include=["object", "category", "string", "bool"])
+    if categorical.empty or top_k <= 0:
+        return ""
+    lines = ["Top values of text columns (value: count):"]
+    for col in categorical.columns:
+        counts = categorical[col].value_counts(dropna=False)
+        top = ", ".join(f"{value}: {count}" for value, count in counts.head(top_k).items())
+        more = f" (+{len(counts) - top_k} more distinct)" if len(counts) > top_k else ""
+        lines.append(f"- {col}: {top}{more}")
+    return "\n".join(lines)
+
+
+def _samples(df: pd.DataFrame, n: int) -> str:
+    if n <= 0:
+        return ""
+    if len(df) <= 2 * n:
+        return "Rows:\n" + df.to_markdown()
+    return f"First {n} rows:\n{df.head(n).to_markdown()}\n\nLast {n} rows:\n{df.tail(n).to_markdown()}"
+
+
+def partial_result_note(df: pd.DataFrame) -> str:
+    """
+    A warning for prompts when `df` is only part of the query's result; "" otherwise.
+    """
+    if not is_partial(df):
+        return ""
+    return (f"Note: this is only part of the query result ({window_caption(df)}). "
+            "Totals, counts and averages computed from it do not cover the whole result.\n\n")
+
+
+def profile_dataframe(df: pd.DataFrame, token_budget: int = TOKEN_BUDGET) -> str:
+    """
+    Returns a description of `df` for use in an LLM prompt that stays within
+    `token_budget`. Small results are included in full; larger ones are
+    described by their schema, row count, column statistics, top categories
+    and head/tail samples, trimmed until the digest fits. If `df` is one page
+    of a larger result, the digest says so.
+    """
+    note = partial_result_note(df)
+    full = df.to_markdown() if len(df) <= FULL_TABLE_MAX_ROWS else None
+    if full is not None and estimate_tokens(note + full) <= token_budget:
+        return note + full
+
+    header = note + f"{len(df)} rows x {len(df.columns)} columns. Column types:\n" + \
+        "\n".join(f"- {col}: {dtype}" for col, dtype in df.dtypes.items())
+    numeric = _numeric_stats(df)
+
+    top_k, samples = TOP_K_CATEGORIES, SAMPLE_ROWS
+    while True:
+        parts = [header, numeric, _category_stats(df, top_k), _samples(df, samples)]
+        digest = "\n\n".join(part for part in parts if part)
+        if estimate_tokens(digest) <= token_budget or (top_k == 0 and samples == 0):
+            break
+        # Drop detail in order of least value: samples first, then categories
+        if samples > 0:
+            samples -= 1
+        else:
+            top_k -= 1
+
+    max_chars = token_budget * CHARS_PER_TOKEN
+    if len(digest) > max_chars:
+        digest = digest[:max_chars] + "\n...(truncated)"
+    return digest
@@ -0,0 +1,102 @@
+import pandas as pd
+from pandas.api.types import is_string_dtype, union_categoricals
+from result_window import FETCH_CHUNK_SIZE
+
+# Low-cardinality text columns of customer_shopping_data, stored as categoricals
+CATEGORICAL_COLUMNS = {"gender", "category", "payment_method", "shopping_mall"}
+# Other text columns become categoricals when at most this share of their values is distinct
+CATEGORY_MAX_RATIO = 0.5
+CATEGORY_MIN_ROWS = 1000  # smaller results are not worth converting
+# Measure and log how much memory reading each result took. Off by default: deep
+# memory_usage walks every string, which costs more than the read it measures.
+PROFILE_MEMORY = False
+
+
+def _process_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rounds numeric columns to one decimal place and narrows their dtype:
+    whole-number columns become the smallest integer type, others stay float64.
+    """
+    for col in chunk.select_dtypes(include=['number']).columns:
+        values = chunk[col].astype('float64').round(1)
+        if values.notna().all() and (values % 1 == 0).all():
+            chunk[col] = pd.to_numeric(values.astype('int64'), downcast='integer')
+        else:
+            chunk[col] = values
+    for col in chunk.columns:
+        if col in CATEGORICAL_COLUMNS and is_string_dtype(chunk[col]):
+            chunk[col] = chunk[col].astype('category')
+    return chunk
+
+
+def _concat_chunks(chunks: list, columns: list) -> pd.DataFrame:
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    if len(chunks) == 1:
+        return chunks[0]
+    data = {}
+    for col in columns:
+        parts = [chunk[col] for chunk in chunks]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            # Plain concat would fall back to object when chunks saw different categories
+            data[col] = pd.Series(union_categoricals(parts), name=col)
+        else:
+            data[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(data, columns=columns)
+
+
+def _categorise_text(df: pd.DataFrame) -> pd.DataFrame:
+    for col in df.columns:
+        if not is_string_dtype(df[col]) or isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        if len(df) >= CATEGORY_MIN_ROWS and df[col].nunique(dropna=False) <= CATEGORY_MAX_RATIO * len(df):
+            try:
+                df[col] = df[col].astype('category')
+            except TypeError:
+                # Unhashable values (e.g. bytes arrays) stay as they are
+                pass
+    return df
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def read_frame(cursor, max_rows: int, chunk_size: int = FETCH_CHUNK_SIZE, profile: bool = None):
+    """
+    Reads at most `max_rows` rows from an executed cursor into a DataFrame, one
+    fetchmany() chunk at a time, rounding and downcasting each chunk as it arrives.
+    Returns (df, truncated, peak_bytes): truncated is True if more rows were
+    available, peak_bytes estimates the most memory the frames held at once
+    (None unless `profile` or PROFILE_MEMORY is set).
+    With max_rows <= 0 nothing is fetched and the empty frame is not truncated.
+    """
+    profile = PROFILE_MEMORY if profile is None else profile
+    columns = [column[0] for column in cursor.description]
+    if max_rows <= 0:
+        df = pd.DataFrame(columns=columns)
+        return df, False, _frame_bytes(df) if profile else None
+    chunks = []
+    held_bytes = 0
+    fetched = 0
+    truncated = False
+    while fetched < max_rows:
+        rows = cursor.fetchmany(min(chunk_size, max_rows - fetched))
+        if not rows:
+            break
+        chunk = pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns, coerce_float=True)
+        chunk = _process_chunk(chunk)
+        chunks.append(chunk)
+        fetched += len(chunk)
+        if profile:
+            held_bytes += _frame_bytes(chunk)
+    else:
+        truncated = cursor.fetchone() is not None
+
+    df = _categorise_text(_concat_chunks(chunks, columns))
+    if not profile:
+        return df, truncated, None
+    final_bytes = _frame_bytes(df)
+    # While concatenating, the chunks and the final frame are alive together
+    peak_bytes = held_bytes + (final_bytes if len(chunks) > 1 else 0)
+    return df, truncated, max(peak_bytes, final_bytes)
@@ -0,0 +1,273 @@
+import re
+import sqlparse
+from sqlparse import tokens as T
+from sqlparse.sql import Identifier, IdentifierList
+
+# --- Configuration ---
+RESULT_PAGE_SIZE = 1000  # rows fetched per page; also the hard cap for a single query
+FETCH_CHUNK_SIZE = 500  # rows pulled from the cursor per fetchmany() call
+# Column that is unique per row of each table; the tiebreak that keeps OFFSET/FETCH pages stable
+TABLE_KEYS = {"customer_shopping_data": "invoice_no"}
+AGGREGATE_CALL = r"\b(?:sum|count|count_big|avg|min|max|stdev|stdevp|var|varp|string_agg)\s*\("
+
+
+def _clean(sql: str) -> str:
+    return sqlparse.format(sql, strip_comments=True).strip().rstrip(';').strip()
+
+
+def _parse(sql: str):
+    statements = [s for s in sqlparse.parse(sql) if str(s).strip()]
+    return statements[0] if len(statements) == 1 else None
+
+
+def _main_select_index(statement):
+    # Index of the first top-level SELECT, i.e. the one after any CTE definitions
+    for i, token in enumerate(statement.tokens):
+        if token.ttype is T.Keyword.DML and token.normalized == 'SELECT':
+            return i
+    return None
+
+
+def _next_token(statement, index):
+    return statement.token_next(index, skip_ws=True, skip_cm=True)[1]
+
+
+def has_top(statement) -> bool:
+    index = _main_select_index(statement)
+    if index is None:
+        return False
+    token = _next_token(statement, index)
+    if token is not None and token.normalized in ('DISTINCT', 'ALL'):
+        token = _next_token(statement, statement.token_index(token))
+    return token is not None and str(token).upper().startswith('TOP')
+
+
+def _order_by_index(statement):
+    for i, token in enumerate(statement.tokens):
+        if token.ttype is T.Keyword and token.normalized == 'ORDER BY':
+            return i
+    return None
+
+
+def _keyword_index(statement, *keywords):
+    for i, token in enumerate(statement.tokens):
+        if token.ttype is T.Keyword and token.normalized in keywords:
+            return i
+    return None
+
+
+def _single_table(statement):
+    # The one table in the main FROM clause (no joins), or None
+    from_index = _keyword_index(statement, 'FROM')
+    table = _next_token(statement, from_index) if from_index is not None else None
+    if not isinstance(table, Identifier) or any(
+        t.ttype is T.Keyword and t.normalized.endswith('JOIN') for t in statement.tokens
+    ):
+        return None
+    return table
+
+
+def _table_width(statement):
+    # Number of columns of the single catalogued table in the FROM clause, or None
+    table = _single_table(statement)
+    if table is None:
+        return None
+    try:
+        from sql_validation import get_schema_catalogue
+        columns = get_schema_catalogue().get(table.get_real_name().strip('[]"').lower())
+    except Exception:
+        return None
+    return len(columns) if columns else None
+
+
+def _select_list(statement):
+    # The column list of the main SELECT, after any DISTINCT and TOP
+    token = _next_token(statement, _main_select_index(statement))
+    if token is not None and token.normalized in ('DISTINCT', 'ALL'):
+        token = _next_token(statement, statement.token_index(token))
+    if token is not None and str(token).upper().startswith('TOP'):
+        token = _next_token(statement, statement.token_index(token))
+    return token
+
+
+def _output_width(statement):
+    """
+    Number of columns the main SELECT returns, or None if it cannot be told
+    (a * over a join or an uncatalogued table).
+    """
+    token = _select_list(statement)
+    if token is None:
+        return None
+    items = list(token.get_identifiers()) if isinstance(token, IdentifierList) else [token]
+    width = 0
+    for item in items:
+        if item.ttype is T.Wildcard or str(item).strip().endswith('*'):
+            table_width = _table_width(statement)
+            if table_width is None:
+                return None
+            width += table_width
+        else:
+            width += 1
+    return width
+
+
+def _is_distinct(statement) -> bool:
+    token = _next_token(statement, _main_select_index(statement))
+    return token is not None and token.normalized == 'DISTINCT'
+
+
+def _tiebreak(statement):
+    """
+    The columns that make the main SELECT's rows unique: its GROUP BY keys, or
+    the key column of its single table (see TABLE_KEYS). None if neither is
+    known, e.g. for UNIONs, ROLLUP/CUBE groupings and joins.
+    """
+    if _keyword_index(statement, 'UNION', 'UNION ALL', 'EXCEPT', 'INTERSECT') is not None:
+        return None
+    group_index = _keyword_index(statement, 'GROUP BY')
+    if group_index is not None:
+        keys = []
+        for token in statement.tokens[group_index + 1:]:
+            if token.ttype is T.Keyword and token.normalized in ('HAVING', 'ORDER BY', 'OPTION'):
+                break
+            keys.append(str(token))
+        keys = "".join(keys).strip()
+        if not keys or any(word in keys.upper() for word in ('ROLLUP', 'CUBE', 'GROUPING SETS')):
+            return None
+        return [key.strip() for key in _split_top_level(keys)]
+    if re.search(AGGREGATE_CALL, str(_select_list(statement)), re.IGNORECASE):
+        # An aggregate without GROUP BY returns one row; the table key is not in scope
+        return None
+    table = _single_table(statement)
+    key = TABLE_KEYS.get((table.get_real_name() or "").strip('[]"').lower()) if table is not None else None
+    if key is None:
+        return None
+    alias = table.get_alias()
+    return [f"{alias}.{key}" if alias else key]
+
+
+def _split_top_level(text: str):
+    # Splits "a, FORMAT(b, 'yyyy-MM')" on the commas outside brackets and quotes
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(text):
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char in "([":
+            depth += 1
+        elif not quoted and char in ")]":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _mentions(order_by: str, key: str) -> bool:
+    name = re.escape(key.split(".")[-1].strip('[]"').lower())
+    return re.search(rf"(?<![\w.]){name}(?!\w)|\.{name}(?!\w)|\[{name}\]", order_by.lower()) is not None
+
+
+def is_pageable(sql: str) -> bool:
+    """
+    True for a single SELECT (optionally with CTEs) without its own TOP clause,
+    which can be paged with OFFSET/FETCH.
+    """
+    statement = _parse(_clean(sql))
+    return (
+        statement is not None
+        and statement.get_type() == 'SELECT'
+        and _main_select_index(statement) is not None
+        and not has_top(statement)
+    )
+
+
+def page_sql(sql: str, offset: int = 0, limit: int = RESULT_PAGE_SIZE) -> str:
+    """
+    Rewrites a T-SQL SELECT so the server returns only rows [offset, offset + limit).
+    Queries that cannot be paged (not a SELECT, or already using TOP) are returned
+    unchanged; the caller still caps them while fetching.
+    """
+    cleaned = _clean(sql)
+    if not is_pageable(cleaned):
+        return sql
+    statement = _parse(cleaned)
+    # OFFSET/FETCH needs an ORDER BY, and pages only line up if it is a total order.
+    # The query's own ORDER BY is kept, with the grouping (or table) key appended
+    # only when it is not already there. Without one, the grouping key is the
+    # order; SELECT DISTINCT rows are unique, so it is ordered by its columns.
+    # (SELECT NULL) is left when nothing better is known.
+    keys = _tiebreak(statement)
+    order_index = _order_by_index(statement)
+    if order_index is not None:
+        order_by = "".join(str(t) for t in statement.tokens[order_index + 1:])
+        missing = [key for key in keys or [] if not _mentions(order_by, key)]
+        suffix = ", " + ", ".join(missing) if missing and not _is_distinct(statement) else ""
+        return f"{cleaned}{suffix} OFFSET {int(offset)} ROWS FETCH NEXT {int(limit)} ROWS ONLY"
+    width = _output_width(statement) if _is_distinct(statement) else None
+    if width:
+        positions = ", ".join(str(i) for i in range(1, width + 1))
+    elif keys and not _is_distinct(statement):
+        positions = ", ".join(keys)
+    else:
+        positions = "(SELECT NULL)"
+    return f"{cleaned} ORDER BY {positions} OFFSET {int(offset)} ROWS FETCH NEXT {int(limit)} ROWS ONLY"
+
+
+def count_sql(sql: str):
+    """
+    Returns a query that counts the rows `sql` would return, or None if it cannot be built.
+    """
+    cleaned = _clean(sql)
+    statement = _parse(cleaned)
+    if statement is None or statement.get_type() != 'SELECT':
+        return None
+    select_index = _main_select_index(statement)
+    if select_index is None:
+        return None
+    tokens = statement.tokens
+    order_index = _order_by_index(statement)
+    if order_index is not None and not has_top(statement):
+        # ORDER BY is not allowed in a derived table without TOP
+        tokens = tokens[:order_index]
+    prefix = "".join(str(t) for t in tokens[:select_index])
+    body = "".join(str(t) for t in tokens[select_index:]).strip()
+    # A derived table needs a unique name for every column, which SUM(price) or two
+    # "name" columns from a join do not have, so they are renamed c1..cN
+    width = _output_width(statement)
+    columns = "(" + ", ".join(f"c{i}" for i in range(1, width + 1)) + ")" if width else ""
+    return f"{prefix}SELECT COUNT_BIG(*) AS total_rows FROM ({body}) AS counted{columns}"
+
+
+def window_caption(df) -> str:
+    """
+    Human-readable description of which rows of the full result `df` holds.
+    """
+    page = df.attrs.get("page", 0)
+    page_size = df.attrs.get("page_size", len(df))
+    total = df.attrs.get("total_rows")
+    first = page * page_size + 1 if len(df) else 0
+    last = page * page_size + len(df)
+    total_text = f"{total:,}" if total is not None else "an unknown number of"
+    return f"Showing rows {first:,}-{last:,} of {total_text} rows"
+
+
+def is_partial(df) -> bool:
+    """
+    True if `df` holds only some of the rows its query returns (one page of a larger result).
+    """
+    if df.attrs.get("page", 0) > 0:
+        return True
+    total = df.attrs.get("total_rows")
+    if total is None:
+        return "page_size" in df.attrs and len(df) >= df.attrs["page_size"]
+    return total > len(df)
+
+
+def has_next_page(df) -> bool:
+    page = df.attrs.get("page", 0)
+    page_size = df.attrs.get("page_size", len(df))
+    total = df.attrs.get("total_rows")
+    if total is None:
+        return len(df) >= page_size
+    return (page + 1) * page_size < total
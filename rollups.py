@@ -0,0 +1,508 @@
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+import pandas as pd
+from result_reader import _process_chunk, CATEGORICAL_COLUMNS
+from result_window import RESULT_PAGE_SIZE
+from result_cache import fingerprint_frame
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# --- Configuration ---
+ROLLUP_DIR = os.path.join(current_dir, "cache", "rollups")
+SOURCE_TABLE = "customer_shopping_data"
+DIMENSIONS = ("category", "shopping_mall", "gender", "payment_method")
+MEASURES = ("quantity", "price", "age")
+INTEGER_MEASURES = {"quantity", "age"}  # SQL Server's AVG over an int column is an int
+GRAINS = ("day", "month", "all")  # cubes kept on disk; queries use the coarsest one that fits
+ROUTE_TO_ROLLUPS = True
+ROLLUP_FETCH_SIZE = 50000  # rows pulled per fetchmany() while building the day cube
+
+ROLLUP_SQL = (
+    f"SELECT {', '.join(DIMENSIONS)}, CAST(invoice_date AS DATE) AS [day], COUNT_BIG(*) AS row_count, "
+    + ", ".join(
+        f"COUNT({m}) AS count_{m}, SUM(CAST({m} AS FLOAT)) AS sum_{m}, MIN({m}) AS min_{m}, MAX({m}) AS max_{m}"
+        for m in MEASURES
+    )
+    + f", SUM(CAST(quantity AS FLOAT) * price) AS sum_revenue FROM {SOURCE_TABLE} "
+    f"GROUP BY {', '.join(DIMENSIONS)}, CAST(invoice_date AS DATE)"
+)
+
+_DATE_ARG = r"(?:cast\(invoice_dateasdate\)|convert\(date,invoice_date\)|invoice_date)"
+_KEY_PATTERNS = [
+    ("day", re.compile(r"cast\(invoice_dateasdate\)|convert\(date,invoice_date\)")),
+    ("year", re.compile(rf"year\({_DATE_ARG}\)|datepart\((?:year|yy|yyyy),{_DATE_ARG}\)")),
+    ("month_num", re.compile(rf"month\({_DATE_ARG}\)|datepart\((?:month|mm|m),{_DATE_ARG}\)")),
+]
+_AGGREGATE = re.compile(r"(sum|avg|min|max|count)\((.+)\)")
+_LITERAL = re.compile(r"\x00(\d+)\x00")
+_CLAUSES = re.compile(
+    r"^select\s+(?:top\s*\(?\s*(?P<top>\d+)\s*\)?\s+)?(?P<select>.+?)\s+from\s+(?P<table>\S+)"
+    r"(?:\s+where\s+(?P<where>.+?))?(?:\s+group\s+by\s+(?P<group>.+?))?(?:\s+order\s+by\s+(?P<order>.+?))?$",
+    re.IGNORECASE | re.DOTALL,
+)
+_UNSUPPORTED = re.compile(
+    r"\b(join|having|union|intersect|except|over|distinct|with|into|exists|case|select\b.*\bselect|or|like|is|percent)\b",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+# --- query planning ---
+def _hide_literals(sql: str):
+    # String literals are swapped for placeholders so keywords inside them cannot confuse the parser
+    literals = []
+    def _hide(match):
+        literals.append(match.group(1).replace("''", "'"))
+        return f"\x00{len(literals) - 1}\x00"
+    return re.sub(r"(?:\bN)?'((?:[^']|'')*)'", _hide, sql), literals
+
+
+def _split_top_level(text: str, separator: str = ","):
+    parts, depth, current = [], 0, []
+    for char in text:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == separator and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current).strip())
+    return parts
+
+
+def _compact(expr: str) -> str:
+    return re.sub(r"\s+", "", re.sub(r"[\[\]\"]", "", expr)).lower().replace("dbo.", "").replace(f"{SOURCE_TABLE}.", "")
+
+
+def _key(expr: str, literals: list):
+    """
+    The cube column an expression groups or filters on, or None.
+    """
+    compact = _compact(expr)
+    if compact in DIMENSIONS:
+        return compact
+    for key, pattern in _KEY_PATTERNS:
+        if pattern.fullmatch(compact):
+            return key
+    match = re.fullmatch(rf"format\({_DATE_ARG},\x00(\d+)\x00\)", compact)
+    if match and literals[int(match.group(1))] == "yyyy-MM":
+        return "month"
+    return None
+
+
+def _aggregate(expr: str):
+    match = _AGGREGATE.fullmatch(_compact(expr))
+    if not match:
+        return None
+    function, argument = match.groups()
+    if argument == "*":
+        return ("count", "*") if function == "count" else None
+    if argument in ("quantity*price", "price*quantity"):
+        return ("sum", "revenue") if function == "sum" else None
+    if argument in MEASURES:
+        return (function, argument)
+    return None
+
+
+def _literal(text: str, literals: list):
+    text = text.strip()
+    match = _LITERAL.fullmatch(text)
+    if match:
+        return literals[int(match.group(1))]
+    try:
+        return float(text) if "." in text else int(text)
+    except ValueError:
+        return None
+
+
+def _split_alias(item: str):
+    match = re.fullmatch(r"(.+?)\s+(?:as\s+)?(\[[^\]]+\]|\"[^\"]+\"|\w+)", item, re.IGNORECASE | re.DOTALL)
+    if match and not re.fullmatch(r"as", match.group(2), re.IGNORECASE):
+        return match.group(1), match.group(2).strip('[]"')
+    return item, None
+
+
+def _coerce(key: str, value):
+    """
+    `value` converted the way SQL Server converts it for a comparison with
+    `key`, e.g. '2023' to 2023 for year, or None if it would not convert cleanly.
+    """
+    if value is None:
+        return None
+    if key in ("year", "month_num"):
+        if isinstance(value, str):
+            try:
+                return int(value.strip())
+            except ValueError:
+                return None
+        return value
+    if not isinstance(value, str):
+        return None  # dimensions, FORMAT(..., 'yyyy-MM') and dates only compare with strings here
+    if key == "day":
+        try:
+            pd.Timestamp(value)
+        except ValueError:
+            return None
+    return value
+
+
+def _parse_condition(condition: str, literals: list):
+    match = re.fullmatch(r"(.+?)\s+between\s+(\S+)\s+and\s+(\S+)", condition, re.IGNORECASE | re.DOTALL)
+    if match:
+        key = _key(match.group(1), literals)
+        low, high = _coerce(key, _literal(match.group(2), literals)), _coerce(key, _literal(match.group(3), literals))
+        return (key, "between", (low, high)) if key and low is not None and high is not None else None
+    match = re.fullmatch(r"(.+?)\s+(not\s+)?in\s*\((.+)\)", condition, re.IGNORECASE | re.DOTALL)
+    if match:
+        key = _key(match.group(1), literals)
+        values = [_coerce(key, _literal(v, literals)) for v in _split_top_level(match.group(3))]
+        if key is None or any(v is None for v in values):
+            return None
+        return (key, "not in" if match.group(2) else "in", values)
+    match = re.fullmatch(r"(.+?)\s*(=|<>|!=|>=|<=|>|<)\s*(.+)", condition, re.DOTALL)
+    if match:
+        key = _key(match.group(1), literals)
+        value = _coerce(key, _literal(match.group(3), literals))
+        return (key, match.group(2), value) if key and value is not None else None
+    return None
+
+
+def plan_query(sql: str):
+    """
+    Parses `sql` into a plan the rollup cubes can answer: aggregates of the cube
+    measures over SOURCE_TABLE, grouped by dimensions or dates, filtered by
+    comparisons on them. Returns None for anything else.
+    """
+    text, literals = _hide_literals(sql.strip().rstrip(';').strip())
+    if "--" in text or "/*" in text or _UNSUPPORTED.search(text):
+        return None
+    match = _CLAUSES.match(text)
+    if match is None or _compact(match.group("table")) != SOURCE_TABLE:
+        return None
+
+    items = []
+    for item in _split_top_level(match.group("select")):
+        expr, alias = item, None
+        key, aggregate = _key(expr, literals), _aggregate(expr)
+        if key is None and aggregate is None:
+            expr, alias = _split_alias(item)
+            key, aggregate = _key(expr, literals), _aggregate(expr)
+        if key is None and aggregate is None:
+            return None
+        name = alias if alias is not None else (key if key in DIMENSIONS else "")
+        items.append({"key": key, "aggregate": aggregate, "name": name, "expr": _compact(expr)})
+    keys = [item["key"] for item in items if item["key"] is not None]
+    if len(keys) == len(items):
+        return None  # no aggregate: a row-level query needs the base table
+
+    group = [_key(g, literals) for g in _split_top_level(match.group("group"))] if match.group("group") else []
+    if None in group or set(group) != set(keys):
+        return None
+
+    filters = []
+    if match.group("where"):
+        parts = re.split(r"\s+and\s+", match.group("where"), flags=re.IGNORECASE)
+        merged = []
+        for part in parts:
+            if merged and re.search(r"\sbetween\s+\S+$", merged[-1], re.IGNORECASE):
+                merged[-1] += " AND " + part
+            else:
+                merged.append(part)
+        for part in merged:
+            condition = _parse_condition(part.strip(), literals)
+            if condition is None:
+                return None
+            filters.append(condition)
+
+    order = []
+    if match.group("order"):
+        for part in _split_top_level(match.group("order")):
+            ref_match = re.fullmatch(r"(.+?)(?:\s+(asc|desc))?", part.strip(), re.IGNORECASE | re.DOTALL)
+            ref, direction = ref_match.group(1), (ref_match.group(2) or "asc").lower()
+            position = None
+            if ref.isdigit() and 1 <= int(ref) <= len(items):
+                position = int(ref) - 1
+            else:
+                for i, item in enumerate(items):
+                    if (item["name"] and item["name"].lower() == ref.strip('[]"').lower()) or item["expr"] == _compact(ref):
+                        position = i
+                        break
+            if position is None:
+                return None
+            order.append((position, direction == "desc"))
+
+    return {"top": int(match.group("top")) if match.group("top") else None, "items": items,
+            "group": group, "filters": filters, "order": order}
+
+
+# --- plan execution ---
+def _grain(plan) -> str:
+    used = set(plan["group"]) | {key for key, _, _ in plan["filters"]}
+    if "day" in used:
+        return "day"
+    if used & {"year", "month_num", "month"}:
+        return "month"
+    return "all"
+
+
+def _with_date_keys(cube: pd.DataFrame, grain: str) -> pd.DataFrame:
+    if grain == "all":
+        return cube
+    dates = pd.to_datetime(cube[grain])
+    return cube.assign(year=dates.dt.year, month_num=dates.dt.month, month=dates.dt.strftime("%Y-%m"), day=dates)
+
+
+def _mask(series: pd.Series, key: str, op: str, value):
+    if key in DIMENSIONS:
+        # SQL Server's default collation ignores case and trailing spaces
+        series = series.astype(str).str.casefold().str.rstrip()
+        value = [str(v).casefold().rstrip() for v in value] if isinstance(value, (list, tuple)) else str(value).casefold().rstrip()
+    elif key == "day":
+        value = [pd.Timestamp(v) for v in value] if isinstance(value, (list, tuple)) else pd.Timestamp(value)
+    if op == "between":
+        return (series >= value[0]) & (series <= value[1])
+    if op in ("in", "not in"):
+        mask = series.isin(value)
+        return ~mask if op == "not in" else mask
+    return {
+        "=": series == value, "<>": series != value, "!=": series != value,
+        ">": series > value, ">=": series >= value, "<": series < value, "<=": series <= value,
+    }[op]
+
+
+def _evaluate(function, argument, sums):
+    if function == "count":
+        return sums["row_count"] if argument == "*" else sums[f"count_{argument}"]
+    if argument == "revenue":
+        return sums["sum_revenue"]
+    if function in ("min", "max"):
+        return sums[f"{function}_{argument}"]
+    count = sums[f"count_{argument}"]
+    total = sums[f"sum_{argument}"].where(count > 0)
+    if function == "sum":
+        return total
+    average = total / count.where(count > 0)
+    return np.trunc(average) if argument in INTEGER_MEASURES else average
+
+
+def execute_plan(plan, cubes: dict) -> pd.DataFrame:
+    grain = _grain(plan)
+    cube = _with_date_keys(cubes[grain], grain)
+    mask = pd.Series(True, index=cube.index)
+    for key, op, value in plan["filters"]:
+        mask &= _mask(cube[key], key, op, value)
+    cube = cube[mask]
+
+    sum_columns = [c for c in cube.columns if c == "row_count" or c.startswith(("count_", "sum_"))]
+    if plan["group"]:
+        grouped = cube.groupby(plan["group"], observed=True, sort=True, dropna=False)
+        sums = grouped[sum_columns].sum()
+        sums = sums.join(grouped[[c for c in cube.columns if c.startswith("min_")]].min())
+        sums = sums.join(grouped[[c for c in cube.columns if c.startswith("max_")]].max()).reset_index()
+    else:
+        row = cube[sum_columns].sum().to_dict()
+        row.update(cube[[c for c in cube.columns if c.startswith("min_")]].min().to_dict())
+        row.update(cube[[c for c in cube.columns if c.startswith("max_")]].max().to_dict())
+        sums = pd.DataFrame([row])
+
+    columns = {}
+    for i, item in enumerate(plan["items"]):
+        if item["key"] is not None:
+            values = sums[item["key"]]
+            columns[i] = values.dt.date if item["key"] == "day" else values
+        else:
+            columns[i] = _evaluate(*item["aggregate"], sums)
+    result = pd.DataFrame(columns)
+    if plan["order"]:
+        result = result.sort_values([i for i, _ in plan["order"]], ascending=[not desc for _, desc in plan["order"]],
+                                    kind="stable")
+    if plan["top"] is not None:
+        result = result.head(plan["top"])
+    # Numbers are processed while the columns are still positional: unaliased expressions all share the name ""
+    result = _process_chunk(result.reset_index(drop=True))
+    result.columns = [item["name"] for item in plan["items"]]
+    for i, item in enumerate(plan["items"]):
+        if item["name"] in CATEGORICAL_COLUMNS and item["key"] in DIMENSIONS:
+            result.isetitem(i, result.iloc[:, i].astype('category'))
+    return result
+
+
+# --- cube storage ---
+def build_cubes(day_cube: pd.DataFrame) -> dict:
+    """
+    Derives the month and all-time cubes from the day cube.
+    """
+    day_cube = day_cube.assign(day=pd.to_datetime(day_cube["day"]))
+    sum_columns = [c for c in day_cube.columns if c == "row_count" or c.startswith(("count_", "sum_"))]
+    aggregations = {c: "sum" for c in sum_columns}
+    aggregations.update({c: "min" for c in day_cube.columns if c.startswith("min_")})
+    aggregations.update({c: "max" for c in day_cube.columns if c.startswith("max_")})
+    month_cube = (day_cube.assign(month=day_cube["day"].dt.to_period("M").dt.to_timestamp())
+                  .groupby(list(DIMENSIONS) + ["month"], observed=True, dropna=False).agg(aggregations).reset_index())
+    all_cube = day_cube.groupby(list(DIMENSIONS), observed=True, dropna=False).agg(aggregations).reset_index()
+    return {"day": day_cube, "month": month_cube, "all": all_cube}
+
+
+class RollupStore:
+    """
+    Pre-aggregated cubes of SOURCE_TABLE over DIMENSIONS at day, month and
+    all-time grain, stored as Parquet under `path`. A cube is only used while
+    the table version it was built from (see result_cache.TableVersionProbe)
+    is still current; otherwise the query goes to the database and the cubes
+    are rebuilt in the background.
+    """
+    def __init__(self, probe, connect, path=ROLLUP_DIR):
+        self.probe = probe
+        self.connect = connect
+        self.path = path
+        self.cubes = {}
+        self.version = None
+        self.built_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.not_routable = 0
+        self.stale = 0
+        self.refreshes = 0
+        self._load()
+
+    def _load(self):
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            return
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            self.cubes = {grain: pd.read_parquet(os.path.join(self.path, f"{grain}.parquet")) for grain in GRAINS}
+            self.version, self.built_at = meta["version"], meta["built_at"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable rollups in {self.path}: {e}")
+            self.cubes = {}
+
+    def _fetch_day_cube(self) -> pd.DataFrame:
+        conn = self.connect()
+        if conn is None:
+            raise RuntimeError("Failed to connect to the database.")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(ROLLUP_SQL)
+            columns = [column[0] for column in cursor.description]
+            chunks = []
+            while True:
+                rows = cursor.fetchmany(ROLLUP_FETCH_SIZE)
+                if not rows:
+                    break
+                chunks.append(pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns))
+            cursor.close()
+        finally:
+            conn.close()
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+
+    def refresh(self):
+        """
+        Rebuilds the cubes from the database and saves them. Returns the table version they reflect.
+        """
+        version = self.probe.version(force=True)
+        if version is None:
+            raise RuntimeError("Table version unknown; not building rollups")
+        start = time.perf_counter()
+        cubes = build_cubes(self._fetch_day_cube())
+        os.makedirs(self.path, exist_ok=True)
+        for grain, cube in cubes.items():
+            tmp_path = os.path.join(self.path, f"{grain}.parquet.tmp")
+            cube.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, os.path.join(self.path, f"{grain}.parquet"))
+        built_at = time.time()
+        with open(os.path.join(self.path, "meta.json"), 'w') as f:
+            json.dump({"version": version, "built_at": built_at}, f)
+        with self._lock:
+            self.cubes, self.version, self.built_at = cubes, version, built_at
+            self.refreshes += 1
+        print(f"Rebuilt rollups ({len(cubes['day'])} day cells) in {time.perf_counter() - start:.1f}s")
+        return version
+
+    def refresh_async(self):
+        """
+        Rebuilds the cubes in a background thread if they are missing or stale. Calling it again while one runs is a no-op.
+        """
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def _run():
+            try:
+                if not self.is_fresh():
+                    self.refresh()
+            except Exception as e:
+                print(f"Rollup refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+        threading.Thread(target=_run, name="rollup-refresh", daemon=True).start()
+
+    def is_fresh(self) -> bool:
+        current = self.probe.version()
+        return bool(self.cubes) and current is not None and current == self.version
+
+    def answer(self, sql: str, page: int = 0, page_size: int = RESULT_PAGE_SIZE):
+        """
+        Answers `sql` from the cubes and returns a DataFrame shaped like run_sql's,
+        or None if the query does not fit a cube or the cubes are stale.
+        """
+        plan = plan_query(sql)
+        if plan is None:
+            with self._lock:
+                self.not_routable += 1
+            return None
+        if not self.is_fresh():
+            with self._lock:
+                self.stale += 1
+            self.refresh_async()
+            return None
+        with self._lock:
+            cubes, version = self.cubes, self.version
+        df = execute_plan(plan, cubes)
+        total_rows = len(df)
+        start = page * page_size
+        df = df.iloc[start:start + page_size]
+        df.index = np.arange(start + 1, start + len(df) + 1)
+        df.attrs.update(page=page, page_size=page_size, total_rows=total_rows, peak_memory_bytes=0, source="rollup")
+        fingerprint_frame(df, sql, ("rollup", version), page)
+        with self._lock:
+            self.routed += 1
+        return df
+
+    def stats(self):
+        with self._lock:
+            return {
+                "routed": self.routed,
+                "not_routable": self.not_routable,
+                "stale": self.stale,
+                "refreshes": self.refreshes,
+                "version": self.version,
+                "built_at": self.built_at,
+                "cells": {grain: len(cube) for grain, cube in self.cubes.items()},
+            }
+
+
+_rollup_store = None
+_rollup_store_lock = threading.Lock()
+
+def get_rollup_store():
+    """
+    Returns the process-wide rollup store, sharing the result cache's table version probe.
+    """
+    global _rollup_store
+    with _rollup_store_lock:
+        if _rollup_store is None:
+            from utility import create_sql_connection
+            from result_cache import get_result_cache
+            _rollup_store = RollupStore(get_result_cache().probe, create_sql_connection)
+        return _rollup_store
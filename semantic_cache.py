@@ -0,0 +1,257 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# --- Configuration ---
+CACHE_PATH = os.path.join(current_dir, "cache", "semantic_sql_cache.json")
+SIMILARITY_THRESHOLD = 0.92  # cosine similarity needed to treat two questions as the same
+MAX_ENTRIES = 500
+TTL_SECONDS = 24 * 60 * 60
+# Words that change a query's filters, aggregate, measure or grouping while barely
+# moving the embedding; two questions must agree on them (as on numbers and quoted
+# text) to share an answer
+LITERAL_WORDS = {
+    "january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+    "november", "december", "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday", "weekday", "weekend",
+    "male", "female", "men", "women", "man", "woman",
+    "top", "bottom", "highest", "lowest", "most", "least", "max", "maximum", "min", "minimum",
+    "ascending", "descending", "first", "last", "before", "after", "above", "below", "over", "under",
+    # aggregates
+    "average", "total", "count", "median", "percentage", "share", "distinct", "unique", "cumulative", "growth",
+    # measures and dimensions of customer_shopping_data
+    "quantity", "price", "age", "revenue", "sales", "spend", "category", "payment", "method", "mall", "gender",
+    "customer", "invoice", "transaction", "order",
+    # time grains
+    "year", "quarter", "month", "week", "day", "daily", "weekly", "monthly", "quarterly", "yearly", "annual",
+}
+# Spellings folded onto one LITERAL_WORDS entry, so paraphrases still match
+LITERAL_SYNONYMS = {
+    "avg": "average", "mean": "average", "sum": "total", "number": "count", "many": "count",
+    "males": "male", "females": "female", "spending": "spend", "spent": "spend", "sale": "sales",
+    "categories": "category", "annually": "annual", "percent": "percentage",
+}
+def _default_embed(text):
+    # Imported lazily so the cache can be used (and tested) without OpenSearch
+    from open_search import get_embedding_model
+    return get_embedding_model().embed_query(text)
+
+
+def _normalise(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+_QUOTED = re.compile(r"'([^']+)'|\"([^\"]+)\"")
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9][a-z0-9'&-]*", text.lower())
+
+
+def question_literals(question):
+    """
+    The parts of a question that must be identical for two questions to share
+    an answer: numbers, quoted text and LITERAL_WORDS (after LITERAL_SYNONYMS).
+    """
+    quoted = {(m.group(1) or m.group(2)).lower() for m in _QUOTED.finditer(question)}
+    unquoted = _QUOTED.sub(" ", question)
+    numbers = {n.replace(",", "").rstrip(".") for n in re.findall(r"\d[\d,]*(?:\.\d+)?", unquoted)}
+    words = {_literal_word(w) for w in _words(unquoted)} & LITERAL_WORDS
+    return quoted, numbers, words
+
+
+def _literal_word(word):
+    word = LITERAL_SYNONYMS.get(word, word)
+    if word not in LITERAL_WORDS and word.endswith("s") and word[:-1] in LITERAL_WORDS:
+        return word[:-1]  # plurals: malls, customers, prices
+    return word
+
+
+def _names(question):
+    # Capitalised words that do not start a sentence, e.g. mall or category names
+    names = set()
+    for sentence in re.split(r"[.?!]\s+", _QUOTED.sub(" ", question)):
+        words = re.findall(r"[A-Za-z][\w'&-]*", sentence)
+        names.update(w.lower() for w in words[1:] if len(w) > 1 and w[0].isupper())
+    return names
+
+
+def literals_match(question, other, value=None):
+    """
+    True if `other` (a cached question) can answer `question`: both have the same
+    literals (see question_literals), every capitalised name in either also
+    appears in the other, and the quoted values of the cached SQL `value` that
+    came from `other` also appear in `question`.
+    """
+    if question_literals(question) != question_literals(other):
+        return False
+    question_text, other_text = " ".join(_words(question)), " ".join(_words(other))
+    if _names(question) - set(_words(other)) or _names(other) - set(_words(question)):
+        return False
+    if isinstance(value, str):
+        for literal in re.findall(r"'([^']+)'", value):
+            literal = " ".join(_words(literal))
+            if literal and literal in other_text and literal not in question_text:
+                return False
+    return True
+
+
+class SemanticCache:
+    """
+    Process-wide question -> value cache that matches paraphrased questions by
+    embedding similarity, provided their numbers, quoted text, names and
+    aggregate, measure and grouping words agree (see literals_match). Entries are evicted least-recently-used once the cache
+    is full and expire after `ttl` seconds. The cache is persisted to `path`.
+    """
+    def __init__(self, embed_fn=None, threshold=SIMILARITY_THRESHOLD, max_entries=MAX_ENTRIES,
+                 ttl=TTL_SECONDS, path=CACHE_PATH):
+        self.embed_fn = embed_fn or _default_embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()  # question -> {"vector", "value", "created"}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable semantic cache file {self.path}: {e}")
+            return
+        for item in stored:
+            self._entries[item["question"]] = {
+                "vector": np.asarray(item["vector"], dtype=np.float32),
+                "value": item["value"],
+                "created": item["created"],
+            }
+
+    def _save(self):
+        # Caller must hold the lock
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        stored = [
+            {"question": q, "vector": e["vector"].tolist(), "value": e["value"], "created": e["created"]}
+            for q, e in self._entries.items()
+        ]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(stored, f)
+        os.replace(tmp_path, self.path)
+
+    def _expire(self):
+        # Caller must hold the lock
+        now = time.time()
+        expired = [q for q, e in self._entries.items() if now - e["created"] > self.ttl]
+        for q in expired:
+            del self._entries[q]
+        return bool(expired)
+
+    def lookup(self, question, vector=None):
+        """
+        Returns the value stored for the most similar earlier question whose
+        literals match (see literals_match), or None if nothing scores above the
+        threshold. Pass `vector` to reuse an embedding.
+        """
+        with self._lock:
+            if self._expire():
+                self._save()
+            exact = self._entries.get(question)
+            if exact is not None:
+                self._entries.move_to_end(question)
+                self.hits += 1
+                return exact["value"]
+            if not self._entries:
+                self.misses += 1
+                return None
+        if vector is None:
+            vector = self.embed_fn(question)
+        query = _normalise(vector)
+        with self._lock:
+            questions = list(self._entries.keys())
+            if not questions:
+                self.misses += 1
+                return None
+            matrix = np.stack([self._entries[q]["vector"] for q in questions])
+            scores = matrix @ query
+            # Most similar first; "sales in 2022" and "sales in 2023" embed alike but need different answers
+            for best in np.argsort(-scores):
+                if scores[best] < self.threshold:
+                    break
+                entry = self._entries[questions[best]]
+                if literals_match(question, questions[best], entry["value"]):
+                    self._entries.move_to_end(questions[best])
+                    self.hits += 1
+                    return entry["value"]
+            self.misses += 1
+            return None
+
+    def store(self, question, value, vector=None):
+        if vector is None:
+            vector = self.embed_fn(question)
+        with self._lock:
+            self._entries[question] = {"vector": _normalise(vector), "value": value, "created": time.time()}
+            self._entries.move_to_end(question)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def get_or_compute(self, question, compute, should_store=None):
+        """
+        Returns the cached value for `question`, or calls `compute(question)`,
+        stores the result and returns it. The question is embedded at most once.
+        """
+        with self._lock:
+            cached = question in self._entries
+        vector = None if cached or not self._entries else self.embed_fn(question)
+        value = self.lookup(question, vector=vector)
+        if value is not None:
+            return value
+        value = compute(question)
+        if value and (should_store is None or should_store(value)):
+            self.store(question, value, vector=vector)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._save()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+_sql_cache = None
+_sql_cache_lock = threading.Lock()
+
+def get_sql_cache():
+    """
+    Returns the process-wide semantic cache of generated SQL, shared by all sessions.
+    """
+    global _sql_cache
+    with _sql_cache_lock:
+        if _sql_cache is None:
+            _sql_cache = SemanticCache()
+        return _sql_cache
@@ -0,0 +1,348 @@
+import json
+import os
+import re
+import threading
+import time
+import pandas as pd
+from rollups import _hide_literals, _split_top_level
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# --- Configuration ---
+SQL_BACKEND = "sqlserver"  # default for run_sql: "sqlserver", or "local" for the snapshot engine
+SNAPSHOT_DIR = os.path.join(current_dir, "cache", "snapshot")
+SNAPSHOT_TABLE = "customer_shopping_data"
+SNAPSHOT_MAX_AGE = 3600  # seconds before the snapshot is refreshed in the background
+SNAPSHOT_FETCH_SIZE = 50000  # rows pulled per fetchmany() while taking a snapshot
+# invoice_date is copied as the server casts it, so CAST(invoice_date AS DATE) means the same locally
+SNAPSHOT_SQL = f"SELECT *, CAST(invoice_date AS DATE) AS [__invoice_date] FROM {SNAPSHOT_TABLE}"
+
+_DATE_PARTS = {
+    "year": "year", "yy": "year", "yyyy": "year", "quarter": "quarter", "qq": "quarter", "q": "quarter",
+    "month": "month", "mm": "month", "m": "month", "dayofyear": "doy", "dy": "doy", "y": "doy",
+    "day": "day", "dd": "day", "d": "day", "week": "week", "wk": "week", "ww": "week",
+    "hour": "hour", "hh": "hour", "minute": "minute", "mi": "minute", "n": "minute",
+    "second": "second", "ss": "second", "s": "second",
+}
+_INTERVALS = {"year": "to_years", "month": "to_months", "week": "to_weeks", "day": "to_days",
+              "hour": "to_hours", "minute": "to_minutes", "second": "to_seconds"}
+# .NET date format tokens used with FORMAT(), longest first
+_FORMAT_TOKENS = [("yyyy", "%Y"), ("yy", "%y"), ("MMMM", "%B"), ("MMM", "%b"), ("MM", "%m"), ("dddd", "%A"),
+                  ("ddd", "%a"), ("dd", "%d"), ("HH", "%H"), ("mm", "%M"), ("ss", "%S")]
+
+
+# --- T-SQL to DuckDB translation ---
+def _rewrite_calls(text: str, name: str, rewrite) -> str:
+    # Replaces every call name(args) with rewrite(args); arguments are rewritten first
+    pattern = re.compile(rf"\b{name}\s*\(", re.IGNORECASE)
+    parts, pos = [], 0
+    while True:
+        match = pattern.search(text, pos)
+        if match is None:
+            break
+        depth, end = 1, match.end()
+        while end < len(text) and depth:
+            depth += {'(': 1, ')': -1}.get(text[end], 0)
+            end += 1
+        if depth:
+            break
+        args = [_rewrite_calls(arg, name, rewrite) for arg in _split_top_level(text[match.end():end - 1])]
+        replacement = rewrite(args)
+        parts.append(text[pos:match.start()])
+        parts.append(replacement if replacement is not None else text[match.start():end])
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _date_part(args):
+    part = _DATE_PARTS.get(args[0].strip().lower())
+    if args[0].strip().lower() in ("weekday", "dw"):
+        # SQL Server numbers weekdays from 1 (Sunday); DuckDB from 0
+        return f"(date_part('dow', {args[1]}) + 1)"
+    return f"date_part('{part}', {args[1]})" if part else None
+
+
+def _date_name(args):
+    part = args[0].strip().lower()
+    if _DATE_PARTS.get(part) == "month":
+        return f"monthname({args[1]})"
+    if part in ("weekday", "dw"):
+        return f"dayname({args[1]})"
+    return None
+
+
+def _date_add(args):
+    part = _DATE_PARTS.get(args[0].strip().lower())
+    if part == "quarter":
+        return f"(CAST({args[2]} AS TIMESTAMP) + to_months(3 * CAST({args[1]} AS INTEGER)))"
+    if part not in _INTERVALS:
+        return None
+    return f"(CAST({args[2]} AS TIMESTAMP) + {_INTERVALS[part]}(CAST({args[1]} AS INTEGER)))"
+
+
+def _date_diff(args):
+    part = _DATE_PARTS.get(args[0].strip().lower())
+    return f"date_diff('{part}', {args[1]}, {args[2]})" if part else None
+
+
+def _format(literals):
+    def rewrite(args):
+        match = re.fullmatch(r"\s*\x00(\d+)\x00\s*", args[1]) if len(args) == 2 else None
+        if match is None or not re.fullmatch(r"[yMdHms\-/ :.]+", literals[int(match.group(1))]):
+            return None  # number formats and cultures have no DuckDB equivalent
+        pattern = literals[int(match.group(1))]
+        for token, directive in _FORMAT_TOKENS:
+            pattern = pattern.replace(token, directive)
+        literals.append(pattern)
+        return f"strftime({args[0]}, \x00{len(literals) - 1}\x00)"
+    return rewrite
+
+
+def _top_to_limit(text: str) -> str:
+    # SELECT TOP n ... becomes ... LIMIT n at the end of the same (sub)query
+    for match in reversed(list(re.finditer(r"\bTOP\s*\(?\s*(\d+)\s*\)?\s+", text, re.IGNORECASE))):
+        depth, end = 0, match.end()
+        while end < len(text):
+            depth += {'(': 1, ')': -1}.get(text[end], 0)
+            if depth < 0:
+                break
+            end += 1
+        text = f"{text[:match.start()]}{text[match.end():end].rstrip()} LIMIT {match.group(1)}{text[end:]}"
+    return text
+
+
+def _restore_literals(text: str, literals) -> str:
+    return re.sub(r"\x00(\d+)\x00", lambda m: "'" + literals[int(m.group(1))].replace("'", "''") + "'", text)
+
+
+def _float_types(sql: str) -> str:
+    # T-SQL FLOAT is 8 bytes (4 for FLOAT(1..24)) but DuckDB's FLOAT is 4, so spell the width out
+    text, literals = _hide_literals(sql)
+    text = re.sub(r"\bFLOAT\s*\(\s*(\d+)\s*\)",
+                  lambda m: "REAL" if int(m.group(1)) <= 24 else "DOUBLE PRECISION", text, flags=re.IGNORECASE)
+    text = re.sub(r"\bFLOAT\b", "DOUBLE PRECISION", text, flags=re.IGNORECASE)
+    return _restore_literals(text, literals)
+
+
+def _rewrite_tsql(sql: str) -> str:
+    text, literals = _hide_literals(_float_types(sql))
+    text = re.sub(r"\[([^\]]+)\]", r'"\1"', text)
+    text = re.sub(r"\bCOUNT_BIG\s*\(", "COUNT(", text, flags=re.IGNORECASE)
+    text = re.sub(r"\b(?:GETDATE|SYSDATETIME)\s*\(\s*\)", "current_timestamp", text, flags=re.IGNORECASE)
+    text = re.sub(r"\bNVARCHAR\b", "VARCHAR", text, flags=re.IGNORECASE)
+    text = re.sub(r"\bDATETIME2?\b", "TIMESTAMP", text, flags=re.IGNORECASE)
+    text = _rewrite_calls(text, "ISNULL", lambda args: f"coalesce({', '.join(args)})")
+    text = _rewrite_calls(text, "LEN", lambda args: f"length({args[0]})")
+    text = _rewrite_calls(text, "CONVERT", lambda args: f"CAST({args[1]} AS {args[0]})")
+    text = _rewrite_calls(text, "DATEPART", _date_part)
+    text = _rewrite_calls(text, "DATENAME", _date_name)
+    text = _rewrite_calls(text, "DATEADD", _date_add)
+    text = _rewrite_calls(text, "DATEDIFF", _date_diff)
+    text = _rewrite_calls(text, "FORMAT", _format(literals))
+    text = re.sub(r"\bOFFSET\s+(\d+)\s+ROWS\s+FETCH\s+(?:NEXT|FIRST)\s+(\d+)\s+ROWS\s+ONLY\b",
+                  r"LIMIT \2 OFFSET \1", text, flags=re.IGNORECASE)
+    text = _top_to_limit(text)
+    return _restore_literals(text, literals)
+
+
+def translate_tsql(sql: str) -> str:
+    """
+    Rewrites a T-SQL query (as generated for SQL Server and paged by page_sql)
+    for DuckDB: with sqlglot if it is installed, otherwise with the rewrites
+    above, which cover TOP, OFFSET/FETCH, [brackets] and the date and string
+    functions the SQL prompt produces.
+    """
+    sql = re.sub(r"\s+ORDER\s+BY\s+\(\s*SELECT\s+NULL\s*\)", "", sql.strip().rstrip(';'), flags=re.IGNORECASE)
+    sql = _float_types(sql)
+    try:
+        import sqlglot
+    except ImportError:
+        return _rewrite_tsql(sql)
+    try:
+        return sqlglot.transpile(sql, read="tsql", write="duckdb")[0]
+    except sqlglot.errors.SqlglotError as e:
+        print(f"sqlglot could not translate the query, using the built-in rewrites: {e}")
+        return _rewrite_tsql(sql)
+
+
+# --- Snapshot ---
+class TableSnapshot:
+    """
+    A Parquet copy of SNAPSHOT_TABLE under `path`, taken through `connect`
+    (a SQL Server connection). It is refreshed in the background once it is
+    older than `max_age`; if the server is unreachable the old copy keeps
+    being used, so the app can run offline once a snapshot exists. write()
+    installs a DataFrame as the snapshot directly, e.g. for tests.
+    """
+    def __init__(self, connect, path=SNAPSHOT_DIR, max_age=SNAPSHOT_MAX_AGE):
+        self.connect = connect
+        self.path = path
+        self.max_age = max_age
+        self.parquet_path = os.path.join(path, f"{SNAPSHOT_TABLE}.parquet")
+        self._meta_path = os.path.join(path, "meta.json")
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # held while the first snapshot is taken
+        self.refreshes = 0
+        self.failures = 0
+
+    def built_at(self):
+        try:
+            with open(self._meta_path, 'r') as f:
+                return json.load(f)["built_at"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def write(self, df: pd.DataFrame):
+        os.makedirs(self.path, exist_ok=True)
+        # Temp names are unique per writer, so concurrent writes never touch each other's files
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(self.parquet_path + suffix, index=False)
+        os.replace(self.parquet_path + suffix, self.parquet_path)
+        with open(self._meta_path + suffix, 'w') as f:
+            json.dump({"built_at": time.time(), "rows": len(df)}, f)
+        os.replace(self._meta_path + suffix, self._meta_path)
+
+    def refresh(self):
+        start = time.perf_counter()
+        conn = self.connect()
+        if conn is None:
+            raise RuntimeError("Failed to connect to the database.")
+        try:
+            cursor = conn.cursor()
+            cursor.execute(SNAPSHOT_SQL)
+            columns = [column[0] for column in cursor.description]
+            chunks = []
+            while True:
+                rows = cursor.fetchmany(SNAPSHOT_FETCH_SIZE)
+                if not rows:
+                    break
+                chunks.append(pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns))
+            cursor.close()
+        finally:
+            conn.close()
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+        df["invoice_date"] = df.pop("__invoice_date")
+        self.write(df)
+        with self._lock:
+            self.refreshes += 1
+        print(f"Took a snapshot of {SNAPSHOT_TABLE} ({len(df)} rows) in {time.perf_counter() - start:.1f}s")
+
+    def refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def _run():
+            try:
+                self.refresh()
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                print(f"Snapshot refresh failed, keeping the current one: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+        threading.Thread(target=_run, name="snapshot-refresh", daemon=True).start()
+
+    def ensure(self) -> str:
+        """
+        Path of a usable snapshot: taken now if there is none, refreshed in the background if it is old.
+        """
+        built_at = self.built_at()
+        if built_at is None or not os.path.exists(self.parquet_path):
+            with self._build_lock:
+                # Callers that waited here use the snapshot the first one took
+                if self.built_at() is None or not os.path.exists(self.parquet_path):
+                    self.refresh()
+        elif time.time() - built_at > self.max_age:
+            self.refresh_async()
+        return self.parquet_path
+
+    def stats(self):
+        built_at = self.built_at()
+        with self._lock:
+            return {
+                "built_at": built_at,
+                "age_seconds": None if built_at is None else round(time.time() - built_at),
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+            }
+
+
+# --- Backends ---
+class SqlServerBackend:
+    """
+    Runs queries on the SQL Server database through the connection pool.
+    """
+    name = "sqlserver"
+    label = "SQL Server"
+
+    def connect(self):
+        from utility import create_sql_connection
+        return create_sql_connection()
+
+    def translate(self, sql: str) -> str:
+        return sql
+
+    def version(self):
+        # The table version last seen by the result cache's probe; never waits on the database
+        from result_cache import get_result_cache
+        return get_result_cache().probe.version()
+
+
+class LocalSnapshotBackend:
+    """
+    Runs queries in-process with DuckDB over a TableSnapshot, translating them
+    from T-SQL first. Comparisons ignore case and integer division truncates,
+    as with SQL Server's defaults.
+    """
+    name = "local"
+    label = "Local engine"
+
+    def __init__(self, snapshot=None):
+        if snapshot is None:
+            from utility import create_sql_connection
+            snapshot = TableSnapshot(create_sql_connection)
+        self.snapshot = snapshot
+
+    def connect(self):
+        try:
+            import duckdb
+            path = self.snapshot.ensure().replace("'", "''")
+            conn = duckdb.connect()
+            conn.execute("SET default_collation = 'nocase'")
+            conn.execute("SET integer_division = true")
+            conn.execute("CREATE SCHEMA IF NOT EXISTS dbo")
+            for name in (SNAPSHOT_TABLE, f"dbo.{SNAPSHOT_TABLE}"):
+                conn.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet('{path}')")
+            return conn
+        except Exception as e:
+            print("Error opening the local snapshot:", e)
+            return None
+
+    def translate(self, sql: str) -> str:
+        return translate_tsql(sql)
+
+    def version(self):
+        built_at = self.snapshot.built_at()
+        return None if built_at is None else ("snapshot", built_at)
+
+
+BACKENDS = {"sqlserver": SqlServerBackend, "local": LocalSnapshotBackend}
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_backend(name: str = None):
+    """
+    Returns the process-wide backend called `name` (SQL_BACKEND if None).
+    """
+    name = name or SQL_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown SQL backend {name!r}; expected one of {', '.join(BACKENDS)}")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
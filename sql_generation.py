@@ -1,11 +1,13 @@
 import subprocess
 import json
 import re
-import pandas as pd
 import numpy as np
 from open_search import get_columns
-import os
-from llm_response_generator import get_multimodal_model
+from llm_response_generator import LLMResponseGenerator
+from result_profiler import profile_dataframe
+from sql_validation import validate_sql, validate_and_repair
+from prompt_assembly import (get_prompt_assembler, render_table, render_columns, render_examples, render_docs,
+                             render_question, INSTRUCTIONS, DOC_LIST, RESPONSE_GUIDELINES)
 # def get_columns(question,docsearch):
 #         response = docsearch.similarity_search(question, k = 5)
 #         columns = []
@@ -16,107 +18,98 @@ from llm_response_generator import get_multimodal_model
 
         # return columns
 def add_cols_to_prompt(starting_prompt: str, table: str, cols_list: list[str]) -> str:
-    starting_prompt += f"\n===Table \n {table}"
-    if len(cols_list) > 0:
-        starting_prompt += "\n===Columns \n"
-        for col in cols_list:
-            starting_prompt += f"{col}\n"
-    return starting_prompt
+    return "".join([starting_prompt, render_table(table), render_columns(cols_list)])
 
 def add_sample_sqls_to_prompt(starting_prompt: str, question_sql_list: list) -> str:
-    if len(question_sql_list) > 0:
-        starting_prompt += "\n===Sample questions and corresponding sqls\n\n"
-        for example in question_sql_list:
-            if example is None:
-                print("example is None")
-            else:
-                if "question" in example and "sql" in example:
-                    starting_prompt += f"\nQuestion: {example['question']}"
-                    starting_prompt += f", Sql: {example['sql']}\n"
-    return starting_prompt
-
-def get_sql_prompt(starting_prompt: str, question: str, columns_list: list, question_sql_list: list, table: str) -> str:
-    if starting_prompt is None:
-        starting_prompt = (
-            "You are a Microsoft SQL Server Management Studio expert. "
-            "Please help to generate a SQL query that can run on Microsoft SQL Server to answer the question. Your response should ONLY be based on the given context and follow the response guidelines and format instructions. "
-        )
-    
-    # Adding table and columns context
-    starting_prompt = add_cols_to_prompt(starting_prompt, table, columns_list)
-    starting_prompt = add_sample_sqls_to_prompt(starting_prompt, question_sql_list)
-    
-    # Including the question in the prompt
-    starting_prompt += f"\n\nQuestion: {question}\n"
-
-    starting_prompt += (
-        "===Response Guidelines \n"
-        "Please generate the SQL query that corresponds to the question above. "
-        "Always study the question properly and try to find similar columns in the columns section. "
-        "Check for gender, especially in the question."
+    return starting_prompt + render_examples(question_sql_list)
+
+def get_sql_prompt(starting_prompt: str, question: str, columns_list: list, question_sql_list: list, table: str, doc_list: list = None) -> str:
+    # All sections are rendered separately and joined once
+    return "".join([
+        INSTRUCTIONS if starting_prompt is None else starting_prompt,
+        render_table(table),
+        render_columns(columns_list),
+        render_examples(question_sql_list),
+        render_docs(doc_list),
+        render_question(question),
+        RESPONSE_GUIDELINES,
+    ])
+
+doc_list = DOC_LIST
+
+def load_sample_sqls() -> list:
+    # Parsed once and reloaded only when the file changes
+    return get_prompt_assembler().examples()
+
+def build_sql_prompt(question: str, columns: list, question_sql_list: list = None, extra_docs: list = None) -> str:
+    """
+    Prompt for `question` with the pre-rendered static prefix (instructions and
+    table), its columns, and the sample SQLs (or `question_sql_list` if given).
+    """
+    return get_prompt_assembler().build(question, columns, question_sql_list=question_sql_list, extra_docs=extra_docs)
+
+def resolve_intermediate_sql(question: str, columns: list, question_sql_list: list, llm_response_text: str, llm: LLMResponseGenerator) -> str:
+    """
+    If the LLM asked to look at data first ('intermediate_sql'), runs that query and
+    re-prompts with its results. Returns the final LLM response text.
+    """
+    if 'intermediate_sql' not in llm_response_text:
+        return llm_response_text
+
+    intermediate_sql = extract_sql(llm_response_text)
+    # print("Running Intermediate SQL", intermediate_sql)
+    # Run the intermediate SQL query and get the DataFrame
+    df = run_sql(intermediate_sql)
+
+    # Generate final SQL prompt with the intermediate SQL results
+    prompt = build_sql_prompt(
+        question,
+        columns,
+        question_sql_list,
+        extra_docs=doc_list + [f"The following describes a pandas DataFrame with the results of the intermediate SQL query {intermediate_sql}:\n" + profile_dataframe(df)]
     )
-    
-    return starting_prompt
+    # print("Final SQL Prompt", prompt)
+    # print("\nThis is the len of final input prompt:", len(prompt))
+
+    # Generate LLM response for the final prompt
+    return llm.submit_prompt(prompt)
+
+def sql_from_response(question: str, columns: list, question_sql_list: list, llm_response_text: str, llm: LLMResponseGenerator) -> str:
+    """
+    The rest of the pipeline once the LLM has answered the SQL prompt: resolves an
+    intermediate query, extracts the SQL and validates it (with one repair round).
+    Returns the SQL, or a string starting with "Error" if any step failed.
+    """
+    # Check if 'intermediate_sql' is in the response text
+    try:
+        llm_response_text = resolve_intermediate_sql(question, columns, question_sql_list, llm_response_text, llm)
+    except Exception as e:
+        return f"Error running intermediate SQL: {e}"
 
-doc_list = ['Always cast the column invoice_date using Date function', 'If Year is not mentioned in the question, then always filter on current year','Column alias should be under backticks ("``")']
+    # Extract the final SQL query from the LLM response
+    final_sql = extract_sql(llm_response_text)
+
+    # Check it locally against the schema before it goes near the database; one repair round if needed
+    final_sql, problems = validate_and_repair(question, final_sql, llm, extract_sql)
+    if problems:
+        return "Error: generated SQL failed validation: " + " ".join(problems)
+
+    return final_sql
 
 def generate_sql(question: str) -> str:
-    starting_prompt = None
     columns  = get_columns(question)
-    
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    json_path = os.path.join(current_dir, 'knowledge_base/sample_sql_query.json')
-    with open(json_path, 'r') as f:
-        question_sql_list = json.load(f)
-
-    multimodal_model = get_multimodal_model()
-    table = "customer_shopping_data"
-    prompt = get_sql_prompt(
-        starting_prompt=starting_prompt,
-        question=question,
-        columns_list=columns,
-        question_sql_list=question_sql_list,
-        table=table
-    )
+    question_sql_list = None  # the sample SQLs are already part of the cached prompt prefix
+
+    llm = LLMResponseGenerator()
+    prompt = build_sql_prompt(question, columns, question_sql_list)
     # print("SQL Prompt", prompt)
 
-    # Generate LLM response for initial prompt
-    llm_response = multimodal_model.generate_content(prompt)
-    llm_response_text = llm_response.text  # Extract the response text
+    # Generate LLM response for initial prompt. Submitted, not streamed: the SQL is picked from the
+    # whole reply anyway, and identical questions in flight share one call
+    llm_response_text = llm.submit_prompt(prompt)
     # print("LLM Response", llm_response_text)
 
-    # Check if 'intermediate_sql' is in the response text
-    if 'intermediate_sql' in llm_response_text:
-        intermediate_sql = extract_sql(llm_response_text)
-
-        try:
-            # print("Running Intermediate SQL", intermediate_sql)
-            # Run the intermediate SQL query and get the DataFrame
-            df = run_sql(intermediate_sql)
-
-            # Generate final SQL prompt with the intermediate SQL results
-            prompt = get_sql_prompt(
-                starting_prompt=starting_prompt,
-                question=question,
-                columns_list=columns,
-                question_sql_list=question_sql_list,
-                doc_list=doc_list + [f"The following is a pandas DataFrame with the results of the intermediate SQL query {intermediate_sql}:\n" + df.to_markdown()]
-            )
-            # print("Final SQL Prompt", prompt)
-            # print("\nThis is the len of final input prompt:", len(prompt))
-
-            # Generate LLM response for the final prompt
-            llm_response = multimodal_model.generate_content(prompt)
-            llm_response_text = llm_response.text  # Extract the response text again
-            # print("LLM Response", llm_response_text)
-
-        except Exception as e:
-            return f"Error running intermediate SQL: {e}"
-
-    # Extract the final SQL query from the LLM response
-    final_sql = extract_sql(llm_response_text)
-
-    return final_sql
+    return sql_from_response(question, columns, question_sql_list, llm_response_text, llm)
 
 def extract_sql(llm_response: str) -> str:
         # If the llm_response contains a CTE (with clause), extract the last sql between WITH and ;
@@ -147,33 +140,80 @@ def extract_sql(llm_response: str) -> str:
             return sql
 
         return llm_response
-from utility import create_sql_connection
-
-def run_sql(sql: str):
-    conn = create_sql_connection()
+from sql_backends import get_backend
+from result_window import RESULT_PAGE_SIZE, page_sql, count_sql, is_pageable
+from result_reader import read_frame
+from result_cache import fingerprint_frame, dataframe_fingerprint
+
+def count_result_rows(conn, sql: str, backend=None):
+    # Total row count of the unpaged query; None if it cannot be determined
+    query = count_sql(sql)
+    if query is None:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(get_backend(backend).translate(query))
+        total = cursor.fetchone()[0]
+        cursor.close()
+        return int(total)
+    except Exception as e:
+        print(f"Could not count result rows: {e}")
+        return None
+
+def run_sql(sql: str, page: int = 0, page_size: int = RESULT_PAGE_SIZE, backend: str = None):
+    """
+    Runs one page of the query and returns it as a DataFrame. The query is rewritten
+    to return only that page and at most `page_size` rows are read from the cursor.
+    df.attrs holds the page, page_size and total_rows (None if unknown), and the
+    frame is stamped with a fingerprint (see result_cache.fingerprint_frame).
+    `backend` picks where it runs (see sql_backends); the default is SQL_BACKEND.
+    """
+    # Never send anything but a single read-only SELECT to the database
+    problems = validate_sql(sql)
+    if problems:
+        return "SQL validation error: " + " ".join(problems)
+
+    backend = get_backend(backend)
+    conn = backend.connect()
     
     # Check if connection was successful
     if conn is None:
         return "Failed to connect to the database."
 
     try:
-        # Use pandas read_sql to fetch data directly into a DataFrame
-        df = pd.read_sql(sql, conn)
-
-        # Round numeric columns to one decimal place
-        numeric_cols = df.select_dtypes(include=['number']).columns
-        if not numeric_cols.empty:
-            df[numeric_cols] = df[numeric_cols].astype('float64').round(1)
-
-        # Set the index starting from 1
-        df.index = np.arange(1, len(df) + 1)
+        version = backend.version()
+        cursor = conn.cursor()
+        cursor.execute(backend.translate(page_sql(sql, offset=page * page_size, limit=page_size)))
+        if page > 0 and not is_pageable(sql):
+            # Queries with their own TOP clause are returned as a single page
+            df, truncated, peak_bytes = read_frame(cursor, 0)
+        else:
+            # Read in chunks, rounding and downcasting numeric columns as they arrive
+            df, truncated, peak_bytes = read_frame(cursor, page_size)
+        cursor.close()
+
+        # Set the index starting from 1 (continuing across pages)
+        start = page * page_size
+        df.index = np.arange(start + 1, start + len(df) + 1)
+
+        if len(df) < page_size and not truncated and (len(df) > 0 or page == 0):
+            total_rows = start + len(df)
+        else:
+            total_rows = count_result_rows(conn, sql, backend.name)
+        df.attrs.update(page=page, page_size=page_size, total_rows=total_rows, peak_memory_bytes=peak_bytes)
+        if peak_bytes is not None:
+            print(f"run_sql: {len(df)} rows, peak memory {peak_bytes / 1024:.1f} KiB")
+        # Cached helpers key on this stamp instead of hashing the frame; without a version the data is hashed once
+        if version is None:
+            version = ("content", dataframe_fingerprint(df))
+        fingerprint_frame(df, sql, (backend.name, version), page)
 
         return df
 
     except Exception as e:
-        return f"SQL Server error: {e}"
+        return f"{backend.label} error: {e}"
         
     finally:
         # Close the connection safely
         if conn:
-            conn.close()
\ No newline at end of file
+            conn.close()
@@ -0,0 +1,176 @@
+import json
+import os
+import re
+import threading
+import sqlparse
+from sqlparse import tokens as T
+from prompt_assembly import WatchedFile
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# --- Configuration ---
+KNOWLEDGE_BASE_PATH = os.path.join(current_dir, "knowledge_base", "customer_shopping_data_columns.jsonl")
+# Statements and clauses a generated query must never contain
+FORBIDDEN_KEYWORDS = {
+    "INSERT", "UPDATE", "DELETE", "MERGE", "TRUNCATE", "DROP", "CREATE", "ALTER", "GRANT", "REVOKE",
+    "DENY", "EXEC", "EXECUTE", "INTO", "BULK", "OPENROWSET", "OPENQUERY", "SHUTDOWN", "KILL", "DBCC",
+}
+# Date parts and T-SQL words that sqlparse reads as plain names
+NON_COLUMN_NAMES = {
+    "TOP", "PERCENT", "TIES", "YEAR", "YY", "YYYY", "QUARTER", "QQ", "Q", "MONTH", "MM", "M", "DAYOFYEAR",
+    "DY", "Y", "DAY", "DD", "D", "WEEK", "WK", "WW", "WEEKDAY", "DW", "HOUR", "HH", "MINUTE", "MI", "N",
+    "SECOND", "SS", "S", "MILLISECOND", "MS", "ISO_WEEK", "ISOWK", "ISOWW",
+}
+
+
+def _parse_catalogue(raw: bytes) -> dict:
+    tables = {}
+    for line in raw.decode('utf-8').splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        tables.setdefault(record["table_name"].lower(), set()).add(record["column_name"].lower())
+    return tables
+
+
+_catalogue = WatchedFile(KNOWLEDGE_BASE_PATH, parse=_parse_catalogue)
+_catalogue_lock = threading.Lock()
+
+def get_schema_catalogue() -> dict:
+    """
+    {table name: set of column names} (lower-case) from the column knowledge base,
+    reloaded when the file changes.
+    """
+    with _catalogue_lock:
+        return _catalogue.get()
+
+
+def _unquote(name: str) -> str:
+    if len(name) >= 2 and name[0] + name[-1] in ('[]', '""', '``'):
+        return name[1:-1]
+    return name
+
+
+def _is_name(token) -> bool:
+    return token.ttype in T.Name or token.ttype in T.Literal.String.Symbol
+
+
+def _is_alias_position(previous) -> bool:
+    # "expr alias": the name directly follows a value rather than an operator, keyword or comma
+    return previous is not None and (
+        _is_name(previous) or previous.ttype in T.Literal or previous.value == ')'
+        or previous.ttype is T.Wildcard
+    )
+
+
+def fix_dialect(sql: str) -> str:
+    """
+    Deterministic fixes that need no model: MySQL `backtick` identifiers become
+    SQL Server [brackets] and trailing semicolons are reduced to one.
+    """
+    fixed = re.sub(r"`([^`]*)`", r"[\1]", sql.strip())
+    return re.sub(r"(\s*;)+\s*$", ";", fixed)
+
+
+def validate_sql(sql: str, catalogue: dict = None) -> list:
+    """
+    Checks a generated query without running it and returns the problems found
+    (an empty list if it looks valid): more than one statement, anything but a
+    SELECT, forbidden keywords, MySQL syntax and, when a `catalogue` from
+    get_schema_catalogue() is given, unknown tables and columns.
+    """
+    if not sql or not sql.strip():
+        return ["The query is empty."]
+    cleaned = sqlparse.format(sql, strip_comments=True).strip()
+    statements = [s for s in sqlparse.parse(cleaned) if str(s).strip().strip(';').strip()]
+    if len(statements) != 1:
+        return [f"Expected exactly one SQL statement, found {len(statements)}."]
+    statement = statements[0]
+
+    problems = []
+    if statement.get_type() != 'SELECT':
+        problems.append(f"Only SELECT queries are allowed, not {statement.get_type()}.")
+    tokens = [t for t in statement.flatten() if not t.is_whitespace and t.ttype not in T.Comment]
+
+    for token in tokens:
+        word = token.normalized.upper()
+        if token.ttype in T.Keyword and word in FORBIDDEN_KEYWORDS:
+            problems.append(f"{word} is not allowed; the query must only read data.")
+        elif token.ttype in T.Keyword and word == 'LIMIT':
+            problems.append("LIMIT is not SQL Server syntax; use SELECT TOP n instead.")
+        elif _is_name(token) and token.value.startswith('`'):
+            problems.append(f"Backtick-quoted name {token.value} is not SQL Server syntax; use [brackets].")
+    if problems or catalogue is None:
+        return list(dict.fromkeys(problems))
+
+    # First pass: names the query defines itself (CTEs and aliases)
+    defined = set()
+    for i, token in enumerate(tokens):
+        if not _is_name(token):
+            continue
+        previous = tokens[i - 1] if i > 0 else None
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        after = tokens[i + 2] if i + 2 < len(tokens) else None
+        if previous is not None and previous.ttype in T.Keyword and previous.normalized == 'AS':
+            defined.add(_unquote(token.value).lower())
+        elif following is not None and following.normalized == 'AS' and after is not None and after.value == '(':
+            defined.add(_unquote(token.value).lower())
+        elif _is_alias_position(previous) and not (following is not None and following.value in ('(', '.')):
+            defined.add(_unquote(token.value).lower())
+
+    # Second pass: every other name must be a known table or column
+    columns = set().union(*catalogue.values()) if catalogue else set()
+    in_table_reference = False
+    for i, token in enumerate(tokens):
+        if token.ttype in T.Keyword and (token.normalized == 'FROM' or token.normalized.endswith('JOIN')):
+            in_table_reference = True
+            continue
+        if not _is_name(token):
+            if token.value not in ('.',):
+                in_table_reference = False
+            continue
+        name = _unquote(token.value)
+        lowered = name.lower()
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if following is not None and following.value == '.':
+            continue  # database, schema or table qualifier
+        if in_table_reference:
+            in_table_reference = False
+            if lowered not in catalogue and lowered not in defined:
+                problems.append(f"Unknown table {name}.")
+            continue
+        if following is not None and following.value == '(':
+            continue  # function call
+        if lowered in defined or lowered in catalogue or name.upper() in NON_COLUMN_NAMES or name.startswith('@'):
+            continue
+        if lowered not in columns:
+            problems.append(f"Unknown column {name}.")
+    return list(dict.fromkeys(problems))
+
+
+def get_repair_prompt(question: str, sql: str, problems: list, catalogue: dict) -> str:
+    schema = "\n".join(f"{table}: {', '.join(sorted(cols))}" for table, cols in sorted(catalogue.items()))
+    return "".join([
+        "You are a Microsoft SQL Server expert. The query below was written to answer the question: ",
+        f"'{question}'\n\nQuery:\n{sql}\n\nIt has these problems:\n",
+        "".join(f"- {problem}\n" for problem in problems),
+        f"\nThe only tables and their columns are:\n{schema}\n\n",
+        "Rewrite the query so it fixes these problems and still answers the question. It must be a single "
+        "SELECT statement that runs on Microsoft SQL Server; quote aliases with [square brackets]. "
+        "Respond with only the SQL query, ending in a semicolon.",
+    ])
+
+
+def validate_and_repair(question: str, sql: str, llm, extract_sql, catalogue: dict = None):
+    """
+    Returns (sql, problems). Dialect slips are fixed locally; anything else gets
+    one repair round with the LLM. `problems` is empty if the final query is valid.
+    """
+    catalogue = catalogue if catalogue is not None else get_schema_catalogue()
+    sql = fix_dialect(sql)
+    problems = validate_sql(sql, catalogue)
+    if not problems:
+        return sql, []
+    print(f"Generated SQL failed validation, asking for a repair: {problems}")
+    repaired = fix_dialect(extract_sql(llm.submit_prompt(get_repair_prompt(question, sql, problems, catalogue))))
+    return repaired, validate_sql(repaired, catalogue)
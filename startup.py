@@ -0,0 +1,36 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# name -> seconds, in the order the steps finished
+TIMINGS = {}
+_lock = threading.Lock()
+
+
+def record(name, seconds):
+    with _lock:
+        TIMINGS[name] = seconds
+
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def report():
+    """
+    Returns a printable summary of how long each startup step took.
+    """
+    with _lock:
+        items = list(TIMINGS.items())
+    if not items:
+        return "Startup timings: nothing recorded"
+    width = max(len(name) for name, _ in items)
+    lines = ["Startup timings:"]
+    for name, seconds in items:
+        lines.append(f"  {name.ljust(width)}  {seconds * 1000:8.1f} ms")
+    return "\n".join(lines)
@@ -5,15 +5,16 @@ from helper import (
     run_sql_cached,
     generate_plotly_code_cached,
     generate_plot_cached,
+    label_partial_chart,
     should_generate_chart_cached,
     is_sql_valid_cached,
-    generate_summary_cached
+    generate_summary_cached,
+    evict_sql_results
 )
 from datetime import datetime
 
 if 'session_id' not in st.session_state:
     st.session_state['session_id'] = datetime.now().timestamp()
-    st.cache_data.clear()
 
 USER_AVATAR = "🧑‍💻"
 BOT_AVATAR = "🤖"
@@ -79,6 +80,7 @@ if my_question := st.chat_input(
         user_message = st.chat_message("user", avatar=USER_AVATAR)
         user_message.write(f"{my_question}")
         temp = {}
+        sql = None
         try:
             sql = generate_sql_cached(question=my_question)
             if sql:
@@ -96,6 +98,10 @@ if my_question := st.chat_input(
                     st.stop()
                 temp["sql"] = sql
                 df = run_sql_cached(sql=sql)
+                if isinstance(df, str):
+                    # run_sql reports database errors as text
+                    st.chat_message("assistant", avatar=BOT_AVATAR).error(df)
+                    st.stop()
                 if df is not None:
                     st.session_state["df"] = df
                 if st.session_state.get("df") is not None:
@@ -126,7 +132,7 @@ if my_question := st.chat_input(
                                     "assistant",
                                     avatar=BOT_AVATAR,
                                 )
-                                fig = generate_plot_cached(code=code, df=df)
+                                fig = label_partial_chart(generate_plot_cached(code=code, df=df), df)
                                 if fig is not None:
                                     assistant_message_chart.plotly_chart(fig)
                                     temp["chart"] = fig
@@ -150,5 +156,7 @@ if my_question := st.chat_input(
                 assistant_message_error.error("Unable to generate response for that question")
         except Exception as ex:
             print(f'An error occurred while processing the request. Error - {ex}')
-            st.cache_data.clear()
+            # Only drop the cached results of this question's SQL; other sessions' results stay cached
+            if sql:
+                evict_sql_results(sql)
             st.error("An error occurred while processing the request. Please try again. If the issue persists, contact the support team")
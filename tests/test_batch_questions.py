@@ -0,0 +1,102 @@
+import sys
+import types
+import pandas as pd
+import pytest
+from batch_questions import BatchRunner, PermanentError, with_retry, load_questions
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = 0
+
+    def submit_prompt(self, prompt):
+        self.prompts += 1
+        return "SELECT category FROM customer_shopping_data;"
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """
+    Replaces the retrieval, prompt and SQL functions BatchRunner imports, and
+    counts the calls to each of them.
+    """
+    calls = {"finish": 0, "run": 0}
+    results = []
+
+    def sql_from_response(question, columns, question_sql_list, text, llm):
+        calls["finish"] += 1
+        return "Error: generated SQL failed validation: bad" if "invalid" in question else text
+
+    def run_sql(sql):
+        calls["run"] += 1
+        return results.pop(0)
+
+    sql_generation = types.ModuleType("sql_generation")
+    sql_generation.build_sql_prompt = lambda question, columns, question_sql_list: question
+    sql_generation.sql_from_response = sql_from_response
+    sql_generation.run_sql = run_sql
+    open_search = types.ModuleType("open_search")
+    open_search.get_columns = lambda question: []
+    monkeypatch.setitem(sys.modules, "sql_generation", sql_generation)
+    monkeypatch.setitem(sys.modules, "open_search", open_search)
+
+    runner = BatchRunner(attempts=3, backoff=0)
+    runner._llm = FakeLLM()
+    return runner, calls, results
+
+
+def page(rows, total_rows):
+    df = pd.DataFrame({"category": ["Shoes"] * rows})
+    df.attrs.update(page=0, page_size=rows, total_rows=total_rows)
+    return df
+
+
+def test_database_errors_are_retried(pipeline):
+    runner, calls, results = pipeline
+    results.extend(["SQL Server error: deadlock", page(3, 3)])
+    row = runner.answer("shoes")
+    assert row["status"] == "ok" and row["rows"] == 3 and row["is_partial"] is False
+    assert calls == {"finish": 1, "run": 2}
+
+
+def test_partial_results_are_recorded(pipeline):
+    runner, calls, results = pipeline
+    results.append(page(1000, 2500))
+    row = runner.answer("all invoices")
+    assert row["rows"] == 1000 and row["total_rows"] == 2500 and row["is_partial"] is True
+
+
+def test_validation_failures_are_not_retried(pipeline):
+    runner, calls, results = pipeline
+    row = runner.answer("invalid question")
+    assert row["status"] == "error" and "failed validation" in row["error"]
+    assert calls == {"finish": 1, "run": 0} and runner._llm.prompts == 1
+
+    results.extend(["SQL validation error: more than one statement"])
+    row = runner.answer("shoes")
+    assert row["status"] == "error" and calls["run"] == 1
+
+
+def test_with_retry_gives_up_after_the_last_attempt():
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        raise RuntimeError("down")
+    with pytest.raises(RuntimeError):
+        with_retry(flaky, attempts=3, backoff=0)
+    assert len(attempts) == 3
+
+    def invalid():
+        attempts.append(1)
+        raise PermanentError("invalid")
+    with pytest.raises(PermanentError):
+        with_retry(invalid, attempts=3, backoff=0)
+    assert len(attempts) == 4
+
+
+def test_load_questions_formats(tmp_path):
+    (tmp_path / "q.txt").write_text("first\n\nsecond\n")
+    (tmp_path / "q.json").write_text('["first", {"question": "second"}]')
+    (tmp_path / "q.csv").write_text("question\nfirst\nsecond\n")
+    for name in ("q.txt", "q.json", "q.csv"):
+        assert load_questions(str(tmp_path / name)) == ["first", "second"]
@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+import cache_policy
+from cache_policy import cached, register_external, invalidate, stats
+
+
+def row(namespace):
+    return next(r for r in stats() if r["namespace"] == namespace)
+
+
+def test_every_namespace_has_a_policy():
+    for policy in cache_policy.CACHE_POLICIES.values():
+        assert policy["ttl"] > 0 and policy["max_entries"] > 0
+
+
+def test_hits_and_misses_are_counted():
+    calls = []
+
+    @cached("plots")
+    def double(x):
+        calls.append(x)
+        return x * 2
+
+    before = row("plots")
+    assert [double(1), double(1), double(2)] == [2, 2, 4]
+    after = row("plots")
+    assert calls == [1, 2]
+    assert after["calls"] - before["calls"] == 3
+    assert after["misses"] - before["misses"] == 2
+    double.clear()
+
+
+def test_frames_with_the_same_content_share_an_entry():
+    calls = []
+
+    @cached("summaries")
+    def total(df):
+        calls.append(1)
+        return int(df["price"].sum())
+
+    assert total(pd.DataFrame({"price": [1, 2]})) == 3
+    assert total(pd.DataFrame({"price": [1, 2]})) == 3
+    assert total(pd.DataFrame({"price": [1, 5]})) == 6
+    assert len(calls) == 2
+    total.clear()
+
+
+def test_invalidate_clears_only_that_namespace():
+    cleared = []
+    sql_calls, plot_calls = [], []
+
+    @cached("sql_gen", on_clear=lambda: cleared.append("sql_gen"))
+    def sql(question):
+        sql_calls.append(question)
+        return question.upper()
+
+    @cached("plot_code")
+    def code(question):
+        plot_calls.append(question)
+        return question
+
+    sql("q")
+    code("q")
+    invalidate("sql_gen")
+    sql("q")
+    code("q")
+    assert cleared == ["sql_gen"]
+    assert sql_calls == ["q", "q"]
+    assert plot_calls == ["q"]
+    sql.clear()
+    code.clear()
+
+
+def test_external_caches_join_the_namespace():
+    counts = {"hits": 3, "misses": 1}
+    cleared = []
+    before = row("sql_results")
+    register_external("sql_results", lambda: cleared.append(1), lambda: (counts["hits"], counts["misses"]))
+    after = row("sql_results")
+    assert after["functions"] == before["functions"] + 1
+    assert after["calls"] - before["calls"] == 4
+    assert after["hits"] - before["hits"] == 3
+    invalidate("sql_results")
+    assert cleared == [1]
@@ -0,0 +1,78 @@
+import pandas as pd
+from chart_code_cache import ChartCodeCache, normalise_chart_query, result_schema
+
+CODE = "fig = px.bar(df, x='category', y='total')"
+
+
+def sales(totals):
+    return pd.DataFrame({"category": ["Books", "Toys"][:len(totals)], "total": totals})
+
+
+def test_normalise_chart_query():
+    assert normalise_chart_query("  Bar  chart of\tSales!") == "bar chart of sales"
+    assert normalise_chart_query(None) == ""
+
+
+def test_schema_ignores_the_data():
+    assert result_schema(sales([1.0, 2.0])) == result_schema(sales([5.0]))
+    assert result_schema(sales([1.0])) != result_schema(sales([1]))
+
+
+def test_code_is_reused_for_a_refreshed_result():
+    cache = ChartCodeCache()
+    calls = []
+    generate = lambda: calls.append(1) or CODE
+    assert cache.get_or_generate("Bar chart of sales", sales([1.0, 2.0]), generate) == CODE
+    assert cache.get_or_generate("bar chart of sales.", sales([9.0]), generate) == CODE
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_other_schema_generates_again():
+    cache = ChartCodeCache()
+    calls = []
+    generate = lambda: calls.append(1) or CODE
+    cache.get_or_generate("bar chart of sales", sales([1.0]), generate)
+    cache.get_or_generate("bar chart of sales", sales([1]), generate)
+    assert len(calls) == 2
+
+
+def test_code_that_does_not_compile_is_not_cached():
+    cache = ChartCodeCache()
+    assert cache.get_or_generate("q", sales([1.0]), lambda: "fig = (") == "fig = ("
+    assert cache.get("q", sales([1.0])) is None
+    assert cache.rejected == 1
+
+
+def test_compiled_code_comes_from_the_entry():
+    cache = ChartCodeCache()
+    entry = cache.put("q", sales([1.0]), CODE)
+    assert cache.compiled(CODE) is entry["compiled"]
+
+
+def test_failing_code_is_dropped():
+    cache = ChartCodeCache(max_failures=2)
+    cache.put("q", sales([1.0]), CODE)
+    cache.record(CODE, ok=False, error="KeyError")
+    assert cache.entry_stats()[0]["last_error"] == "KeyError"
+    cache.record(CODE, ok=False, error="KeyError")
+    assert cache.get("q", sales([1.0])) is None
+
+
+def test_code_that_worked_is_kept_after_failures():
+    cache = ChartCodeCache(max_failures=1)
+    cache.put("q", sales([1.0]), CODE)
+    cache.record(CODE, ok=True)
+    cache.record(CODE, ok=False, error="KeyError")
+    assert cache.stats()["successes"] == 1 and cache.stats()["failures"] == 1
+    assert cache.get("q", sales([1.0])) is not None
+
+
+def test_least_recently_used_is_evicted():
+    cache = ChartCodeCache(max_entries=2)
+    for query in ("a", "b"):
+        cache.put(query, sales([1.0]), CODE + f"  # {query}")
+    cache.get("a", sales([1.0]))
+    cache.put("c", sales([1.0]), CODE + "  # c")
+    assert cache.get("b", sales([1.0])) is None
+    assert cache.get("a", sales([1.0])) is not None
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from chart_data import (lttb_indices, top_n_other, histogram_bins, downsample_series, bucket_categories,
+                        reduce_figure, OTHER_LABEL, MAX_BARS)
+
+
+def test_lttb_keeps_ends_and_peaks():
+    x = np.arange(10000, dtype=np.float64)
+    y = np.sin(x / 500)
+    y[4321] = 50.0  # a spike must survive
+    keep = lttb_indices(x, y, 500)
+    assert len(keep) == 500
+    assert keep[0] == 0 and keep[-1] == 9999
+    assert np.all(np.diff(keep) > 0)
+    assert 4321 in keep
+
+
+def test_lttb_returns_everything_for_short_series():
+    assert list(lttb_indices(np.arange(5), np.arange(5), 10)) == [0, 1, 2, 3, 4]
+
+
+def test_top_n_other_folds_the_rest():
+    labels, totals = top_n_other(["a", "b", "c", "a", "d"], [1, 5, 2, 1, 1], n=2)
+    assert list(labels) == ["b", "a", OTHER_LABEL]
+    assert list(totals) == [5, 2, 3]
+    labels, totals = top_n_other(["a", "b", "c"], [1, 5, 2], keep=["c"])
+    assert list(labels) == ["c", OTHER_LABEL] and list(totals) == [2, 6]
+
+
+def test_histogram_bins_ignore_non_finite_values():
+    centres, counts, widths = histogram_bins([0.0, 1.0, 2.0, np.nan, np.inf], bins=2)
+    assert counts.sum() == 3 and len(centres) == 2 and np.allclose(widths, 1.0)
+
+
+def test_downsample_series_orders_by_x():
+    df = pd.DataFrame({"day": pd.date_range("2022-01-01", periods=5000, freq="h")[::-1], "sales": np.arange(5000.0)})
+    reduced = downsample_series(df, "day", "sales", max_points=300)
+    assert len(reduced) == 300 and reduced["day"].is_monotonic_increasing
+
+
+def test_bucket_categories_counts_rows_without_a_value():
+    df = pd.DataFrame({"mall": ["A"] * 5 + ["B"] * 3 + ["C", "D"]})
+    assert bucket_categories(df, "mall", n=2).values.tolist() == [["A", 5.0], ["B", 3.0], [OTHER_LABEL, 2.0]]
+
+
+def test_reduce_figure_downsamples_lines_and_buckets_bars():
+    line = px.line(x=np.arange(50000), y=np.random.default_rng(0).normal(size=50000))
+    assert len(reduce_figure(line).data[0].x) <= 2000
+
+    labels = [f"c{i}" for i in range(MAX_BARS + 50)]
+    bars = reduce_figure(go.Figure(go.Bar(x=labels, y=np.arange(len(labels), dtype=float))))
+    assert len(bars.data[0].x) == 16 and bars.data[0].x[-1] == OTHER_LABEL
+
+
+def test_reduce_figure_keeps_date_bars():
+    days = pd.date_range("2022-01-01", periods=MAX_BARS + 50).strftime("%Y-%m-%d")
+    bars = reduce_figure(go.Figure(go.Bar(x=list(days), y=np.ones(len(days)))))
+    assert len(bars.data[0].x) == len(days)
+
+
+def test_stacked_bars_share_their_categories():
+    labels = [f"c{i}" for i in range(MAX_BARS + 50)]
+    fig = go.Figure([go.Bar(x=labels, y=np.arange(len(labels), dtype=float)),
+                     go.Bar(x=labels, y=np.arange(len(labels), dtype=float)[::-1])])
+    reduced = reduce_figure(fig)
+    assert list(reduced.data[0].x) == list(reduced.data[1].x)
@@ -0,0 +1,47 @@
+import pytest
+from chart_code_cache import compile_chart_code
+from chart_sandbox import chart_globals
+
+
+def run(code):
+    ldict = {}
+    exec(compile_chart_code(code), chart_globals(), ldict)
+    return ldict
+
+
+def test_plotting_imports_still_work():
+    ldict = run("import plotly.express as px\nfrom plotly.subplots import make_subplots\nimport numpy as np\n"
+                "fig = px.bar(x=['a', 'b'], y=np.array([1, 2]))")
+    assert ldict["fig"].data[0].type == "bar"
+
+
+@pytest.mark.parametrize("code", [
+    "import os",
+    "import subprocess",
+    "from os import path",
+    "open('/etc/passwd')",
+    "eval('1 + 1')",
+    "getattr(px, 'bar')",
+    "__import__('os')",
+])
+def test_other_modules_and_builtins_are_refused(code):
+    with pytest.raises((ImportError, NameError)):
+        run(code)
+
+
+@pytest.fixture(scope="module")
+def sandbox():
+    pytest.importorskip("pyarrow")
+    from chart_sandbox import ChartSandbox
+    sandbox = ChartSandbox(workers=1, wall_limit=60)
+    yield sandbox
+    sandbox._reset_pool()
+
+
+def test_sandbox_returns_the_figure(sandbox):
+    import pandas as pd
+    df = pd.DataFrame({"category": ["Shoes", "Books"], "price": [10.0, 20.0]})
+    figure_json = sandbox.run("import plotly.express as px\nfig = px.bar(df, x='category', y='price')", df)
+    assert '"type":"bar"' in figure_json
+    with pytest.raises(RuntimeError, match="ImportError"):
+        sandbox.run("import os\nfig = None", df)
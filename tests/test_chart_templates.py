@@ -0,0 +1,47 @@
+import pandas as pd
+from chart_templates import match_chart_template, render_chart_spec
+
+SALES = pd.DataFrame({
+    "category": ["Clothing", "Shoes", "Books", "Toys", "Clothing", "Shoes"],
+    "price": [50.0, 30.0, 5.0, 20.0, 40.0, 10.0],
+})
+
+
+def bar_spec(x, y, limit=None, ascending=False):
+    return {"type": "bar", "x": x, "y": y, "color": None, "agg": "sum", "title": "t",
+            "limit": limit, "ascending": ascending}
+
+
+def test_month_bars_stay_in_time_order():
+    df = pd.DataFrame({"month": ["2022-01", "2022-03", "2022-02"], "sales": [10.0, 30.0, 20.0]})
+    fig = render_chart_spec(bar_spec("month", "sales"), df)
+    assert list(fig.data[0].x) == ["2022-01", "2022-02", "2022-03"]
+    assert list(fig.data[0].y) == [10.0, 20.0, 30.0]
+
+
+def test_datetime_bars_stay_in_time_order():
+    df = pd.DataFrame({"invoice_date": pd.to_datetime(["2022-03-01", "2022-01-01", "2022-02-01"]),
+                       "sales": [1.0, 3.0, 2.0]})
+    fig = render_chart_spec(bar_spec("invoice_date", "sales"), df)
+    assert list(pd.to_datetime(fig.data[0].x).month) == [1, 2, 3]
+
+
+def test_category_bars_sorted_by_value():
+    fig = render_chart_spec(bar_spec("category", "price"), SALES)
+    assert list(fig.data[0].x) == ["Clothing", "Shoes", "Toys", "Books"]
+
+
+def test_top_n_limits_categories():
+    spec = match_chart_template("bar chart of price for the top 2 categories", SALES, embed=False)
+    assert spec["type"] == "bar" and spec["limit"] == 2 and not spec["ascending"]
+    fig = render_chart_spec(spec, SALES)
+    assert list(fig.data[0].x) == ["Clothing", "Shoes"]
+
+    spec = match_chart_template("bar chart of price for the bottom 1 category", SALES, embed=False)
+    assert list(render_chart_spec(spec, SALES).data[0].x) == ["Books"]
+
+
+def test_complex_or_unmatched_requests_go_to_llm():
+    assert match_chart_template("heatmap of price by category", SALES, embed=False) is None
+    assert match_chart_template("bar chart by payment method", SALES, embed=False) is None
+    assert match_chart_template("show me something nice", SALES, embed=False) is None
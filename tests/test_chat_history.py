@@ -0,0 +1,78 @@
+import os
+import time
+import pandas as pd
+from chat_history import ChatHistory, sweep_history
+
+
+def frame(n):
+    return pd.DataFrame({"value": range(n)})
+
+
+def test_messages_hold_references_not_frames(tmp_path):
+    history = ChatHistory("s1", base_dir=str(tmp_path))
+    history.add_user("how many sales?")
+    index = history.add_assistant(sql="SELECT 1", df=frame(3))
+    content = history.messages[index]["content"]
+    assert content["df_ref"].startswith("df-")
+    assert not any(isinstance(v, pd.DataFrame) for v in content.values())
+    assert history.get_frame(history.messages[index]).equals(frame(3))
+
+
+def test_error_text_is_kept_inline(tmp_path):
+    history = ChatHistory("s1", base_dir=str(tmp_path))
+    index = history.add_assistant(sql="SELECT x", df="Error: invalid column x")
+    content = history.messages[index]["content"]
+    assert content["df_ref"] is None
+    assert content["error"] == "Error: invalid column x"
+
+
+def test_frames_over_the_budget_are_spilled_and_reloaded(tmp_path):
+    history = ChatHistory("s1", memory_budget=int(frame(1000).memory_usage(deep=True).sum() * 1.5),
+                          base_dir=str(tmp_path))
+    first = history.add_assistant(df=frame(1000))
+    second = history.add_assistant(df=frame(1000))
+    assert history.memory_used() <= history.memory_budget
+    assert len(os.listdir(history.directory)) == 1
+    assert history.get_frame(history.messages[first]).equals(frame(1000))
+    # Loading the first back spills the second
+    assert history.memory_used() <= history.memory_budget
+    assert history.get_frame(history.messages[second]).equals(frame(1000))
+
+
+def test_replaced_frame_is_dropped(tmp_path):
+    history = ChatHistory("s1", memory_budget=0, base_dir=str(tmp_path))
+    index = history.add_assistant(df=frame(5))
+    history.add_assistant(df=frame(5))  # spills the first to disk
+    history.set_frame(index, frame(2), caption="page 2")
+    assert len(os.listdir(history.directory)) == 1
+    assert len(history.get_frame(history.messages[index])) == 2
+    assert history.messages[index]["content"]["caption"] == "page 2"
+
+
+def test_recent_indices(tmp_path):
+    history = ChatHistory("s1", base_dir=str(tmp_path))
+    indices = []
+    for _ in range(3):
+        history.add_user("q")
+        indices.append(history.add_assistant(df=frame(1)))
+    assert history.recent_indices() == set(indices[-2:])
+    assert history.last_assistant_index() == indices[-1]
+
+
+def test_clear_removes_the_directory(tmp_path):
+    history = ChatHistory("s1", memory_budget=0, base_dir=str(tmp_path))
+    history.add_assistant(df=frame(5))
+    history.add_assistant(df=frame(5))
+    history.clear()
+    assert history.messages == [] and history.memory_used() == 0
+    assert not os.path.exists(history.directory)
+
+
+def test_sweep_removes_only_old_directories(tmp_path):
+    old, new = tmp_path / "old", tmp_path / "new"
+    old.mkdir()
+    new.mkdir()
+    stale = time.time() - 3600
+    os.utime(old, (stale, stale))
+    assert sweep_history(str(tmp_path), max_age=60) == 1
+    assert sorted(os.listdir(tmp_path)) == ["new"]
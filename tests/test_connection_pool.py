@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+import time
+import pytest
+from connection_pool import ConnectionPool, PoolTimeout
+
+
+def sqlite_factory():
+    return sqlite3.connect(":memory:", check_same_thread=False)
+
+
+def test_connections_are_reused():
+    pool = ConnectionPool(sqlite_factory)
+    first = pool.acquire()
+    raw = first._conn
+    first.close()
+    second = pool.acquire()
+    assert second._conn is raw
+    second.close()
+    metrics = pool.metrics()
+    assert metrics["created"] == 1
+    assert metrics["reused"] == 1
+    assert metrics["in_use"] == 0
+
+
+def test_close_twice_releases_once():
+    pool = ConnectionPool(sqlite_factory, max_size=1)
+    conn = pool.acquire()
+    conn.close()
+    conn.close()
+    assert pool.metrics()["in_use"] == 0
+    assert pool.metrics()["idle"] == 1
+
+
+def test_checkout_times_out_when_exhausted():
+    pool = ConnectionPool(sqlite_factory, max_size=1)
+    held = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.05)
+    assert pool.metrics()["checkout_timeouts"] == 1
+    held.close()
+
+
+def test_waiter_gets_released_connection():
+    pool = ConnectionPool(sqlite_factory, max_size=1)
+    held = pool.acquire()
+    threading.Timer(0.05, held.close).start()
+    conn = pool.acquire(timeout=2)
+    conn.close()
+    assert pool.metrics()["created"] == 1
+
+
+def test_recent_connections_skip_the_health_check():
+    pool = ConnectionPool(sqlite_factory, health_check_idle=60)
+    pool.acquire().close()
+    pool.acquire().close()
+    assert pool.metrics()["health_checks"] == 0
+
+
+def test_idle_connections_are_health_checked_and_replaced():
+    pool = ConnectionPool(sqlite_factory, health_check_idle=0)
+    conn = pool.acquire()
+    conn.close()
+    conn._conn.close()  # the server dropped it while it sat in the pool
+    time.sleep(0.01)
+    replacement = pool.acquire()
+    replacement.execute("SELECT 1")
+    replacement.close()
+    metrics = pool.metrics()
+    assert metrics["health_checks"] == 1
+    assert metrics["failed_health_check"] == 1
+    assert metrics["created"] == 2
+
+
+def test_discarded_connection_is_not_pooled():
+    pool = ConnectionPool(sqlite_factory)
+    with pytest.raises(RuntimeError):
+        with pool.acquire():
+            raise RuntimeError("query failed")
+    assert pool.metrics()["idle"] == 0
+    assert pool.metrics()["in_use"] == 0
+
+
+def test_idle_connections_are_evicted():
+    pool = ConnectionPool(sqlite_factory, idle_timeout=0)
+    pool.acquire().close()
+    time.sleep(0.01)
+    pool.acquire().close()
+    assert pool.metrics()["evicted_idle"] == 1
+
+
+def test_open_transaction_is_rolled_back_on_release(tmp_path):
+    path = str(tmp_path / "pool.db")
+    pool = ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), max_size=1)
+    with pool.acquire() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pool.acquire() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_error_inside_with_discards_the_connection():
+    pool = ConnectionPool(sqlite_factory, max_size=1)
+    with pytest.raises(ValueError):
+        with pool.acquire():
+            raise ValueError("query failed")
+    assert pool.metrics()["idle"] == 0 and pool.metrics()["in_use"] == 0
+
+
+def test_concurrent_checkouts_stay_within_max_size():
+    pool = ConnectionPool(sqlite_factory, max_size=3, checkout_timeout=5)
+    peak, lock = [0], threading.Lock()
+
+    def work():
+        with pool.acquire():
+            with lock:
+                peak[0] = max(peak[0], pool.metrics()["in_use"])
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=work) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] <= 3 and pool.metrics()["created"] <= 3
@@ -0,0 +1,39 @@
+from example_selector import dedupe_examples, fit_token_budget
+from result_profiler import estimate_tokens
+
+
+def example(question, sql):
+    return {"question": question, "sql": sql}
+
+
+def test_repeated_questions_are_dropped():
+    examples = [
+        example("Total sales by mall?", "SELECT shopping_mall, SUM(price) FROM customer_shopping_data GROUP BY shopping_mall"),
+        example("total  sales by MALL", "SELECT shopping_mall, SUM(price * quantity) FROM customer_shopping_data GROUP BY shopping_mall"),
+    ]
+    assert dedupe_examples(examples) == examples[:1]
+
+
+def test_repeated_sql_is_dropped():
+    examples = [
+        example("How many customers are there?", "SELECT COUNT(*) FROM customer_shopping_data;"),
+        example("Number of customers", "select count(*)\n  from customer_shopping_data"),
+    ]
+    assert dedupe_examples(examples) == examples[:1]
+
+
+def test_incomplete_examples_are_skipped():
+    kept = example("Sales by category", "SELECT category, SUM(price) FROM customer_shopping_data GROUP BY category")
+    assert dedupe_examples([None, {"question": "no sql"}, kept]) == [kept]
+
+
+def test_budget_keeps_examples_in_order():
+    examples = [example(f"question {i}", f"SELECT {i}") for i in range(5)]
+    cost = estimate_tokens(f"\nQuestion: {examples[0]['question']}, Sql: {examples[0]['sql']}\n")
+    assert fit_token_budget(examples, cost * 3) == examples[:3]
+    assert fit_token_budget(examples, cost - 1) == []
+
+
+def test_budget_stops_at_the_first_example_that_does_not_fit():
+    examples = [example("short", "SELECT 1"), example("long " * 200, "SELECT 2"), example("short too", "SELECT 3")]
+    assert fit_token_budget(examples, 50) == examples[:1]
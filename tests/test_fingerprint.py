@@ -0,0 +1,60 @@
+import importlib
+import sys
+import types
+import pandas as pd
+import pytest
+import sql_backends
+from result_cache import fingerprint_frame, dataframe_fingerprint
+from sql_backends import TableSnapshot, LocalSnapshotBackend
+
+SQL = "SELECT category, SUM(price) AS total FROM customer_shopping_data GROUP BY category"
+
+
+def frame():
+    return pd.DataFrame({"category": ["Shoes", "Books", "Toys"], "total": [10.0, 20.0, 30.0]})
+
+
+def test_stamp_is_used_until_the_frame_changes():
+    df = frame()
+    stamp = fingerprint_frame(df, SQL, "v1")
+    assert dataframe_fingerprint(df) == stamp
+    assert fingerprint_frame(frame(), SQL, "v2") != stamp
+    df.loc[0, "total"] = 99.0
+    assert dataframe_fingerprint(df) != stamp
+
+
+def test_derived_frames_are_hashed_by_content():
+    df = frame()
+    stamp = fingerprint_frame(df, SQL, "v1")
+    head = df.head(2)
+    assert head.attrs.get("fingerprint") == stamp  # attrs are copied ...
+    assert dataframe_fingerprint(head) != stamp  # ... but the stamp is not trusted
+    assert dataframe_fingerprint(head) == dataframe_fingerprint(frame().head(2))
+
+
+@pytest.fixture
+def run_sql(tmp_path, monkeypatch):
+    # run_sql on the local DuckDB backend; open_search (OpenSearch) is only needed for retrieval
+    pytest.importorskip("duckdb")
+    open_search = types.ModuleType("open_search")
+    open_search.get_columns = lambda question: []
+    monkeypatch.setitem(sys.modules, "open_search", open_search)
+    monkeypatch.delitem(sys.modules, "sql_generation", raising=False)
+    sql_generation = importlib.import_module("sql_generation")
+    monkeypatch.delitem(sys.modules, "sql_generation")
+
+    snapshot = TableSnapshot(connect=lambda: None, path=str(tmp_path))
+    snapshot.write(pd.DataFrame({"category": ["Shoes", "Books", "Shoes"], "price": [1.0, 2.0, 3.0]}))
+    monkeypatch.setitem(sql_backends._backends, "local", LocalSnapshotBackend(snapshot))
+    return lambda sql: sql_generation.run_sql(sql, backend="local"), snapshot
+
+
+def test_local_results_are_stamped(run_sql):
+    run, snapshot = run_sql
+    first, second = run(SQL), run(SQL)
+    assert isinstance(first, pd.DataFrame)
+    assert first.attrs["fingerprint"] == second.attrs["fingerprint"] == dataframe_fingerprint(first)
+
+    # A new snapshot is a new version, even where the result happens to be the same
+    snapshot.write(pd.DataFrame({"category": ["Shoes", "Books", "Shoes"], "price": [1.0, 2.0, 3.0]}))
+    assert run(SQL).attrs["fingerprint"] != first.attrs["fingerprint"]
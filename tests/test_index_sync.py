@@ -0,0 +1,89 @@
+import json
+import pytest
+from langchain_core.documents import Document
+
+pytest.importorskip("opensearchpy")
+import open_search
+from open_search import sync_index, document_id, document_hash, ensure_index
+
+
+def column(name, description):
+    return Document(page_content=json.dumps({"dataset_name": "projectdb", "table_name": "customer_shopping_data",
+                                             "column_name": name, "description": description}), metadata={})
+
+
+class FakeIndices:
+    def __init__(self, exists=True, kb_hash=None):
+        self._exists = exists
+        self.kb_hash = kb_hash
+        self.deleted = False
+
+    def exists(self, index):
+        return self._exists
+
+    def get_mapping(self, index):
+        return {index: {"mappings": {"_meta": {"kb_hash": self.kb_hash}}}}
+
+    def delete(self, index):
+        self.deleted = True
+        self._exists = False
+
+    def refresh(self, index):
+        pass
+
+
+class FakeClient:
+    def __init__(self, **kwargs):
+        self.indices = FakeIndices(**kwargs)
+
+
+class FakeDocsearch:
+    def __init__(self):
+        self.added = []
+
+    def add_embeddings(self, text_embeddings, metadatas, ids, engine):
+        self.added.extend(ids)
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[1.0, 0.0] for _ in texts]
+
+
+@pytest.fixture
+def indexed(monkeypatch):
+    # Stands in for the records already in OpenSearch: {id: content hash}; deletes go through helpers.bulk
+    from opensearchpy import helpers
+    records = {}
+    deleted = []
+    monkeypatch.setattr(open_search, "get_indexed_hashes", lambda client, index_name: dict(records))
+    monkeypatch.setattr(helpers, "bulk", lambda client, actions: deleted.extend(a["_id"] for a in actions))
+    return records, deleted
+
+
+def test_only_changed_columns_are_embedded(indexed):
+    records, deleted = indexed
+    gender, price, old = column("gender", "Female or Male"), column("price", "Unit price"), column("old", "gone")
+    records.update({document_id(gender): document_hash(gender), document_id(price): "stale", document_id(old): "x"})
+    embeddings, docsearch = CountingEmbeddings(), FakeDocsearch()
+
+    counts = sync_index(docsearch, FakeClient(), [gender, price], embeddings, batch_size=1)
+
+    assert counts == {"upserted": 1, "deleted": 1, "unchanged": 1}
+    assert embeddings.texts == [price.page_content]
+    assert docsearch.added == [document_id(price)] and deleted == [document_id(old)]
+
+
+def test_document_ids_are_stable():
+    assert document_id(column("gender", "a")) == document_id(column("gender", "b"))
+    assert document_hash(column("gender", "a")) != document_hash(column("gender", "b"))
+
+
+def test_index_is_kept_for_the_same_knowledge_base():
+    client = FakeClient(kb_hash="v1")
+    assert not ensure_index(client, "statspeak", kb_hash="v1") and not client.indices.deleted
+    assert ensure_index(client, "statspeak", kb_hash="v2") and client.indices.deleted
@@ -0,0 +1,91 @@
+import threading
+import time
+import pytest
+from llm_response_generator import (LLMClient, LLMResponseGenerator, FakeGenerativeModel, FakeContextCache,
+                                    set_llm_client, get_llm_client)
+from prompt_assembly import AssembledPrompt
+
+
+def fake_client(model, **kwargs):
+    return LLMClient(model_factory=lambda *_: model, **kwargs)
+
+
+def test_submit_returns_matching_reply():
+    model = FakeGenerativeModel(responses={"sales": "SELECT 1;"}, default="no")
+    client = fake_client(model)
+    assert client.submit("total sales") == "SELECT 1;"
+    assert client.submit("something else") == "no"
+    assert client.metrics()["calls"] == 2
+
+
+def test_identical_prompts_in_flight_are_coalesced():
+    model = FakeGenerativeModel(default="reply", delay=0.2)
+    client = fake_client(model)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.submit("same prompt"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["reply"] * 5
+    assert len(model.calls) == 1
+    assert client.metrics()["coalesced"] == 4
+
+
+def test_finished_prompts_are_not_coalesced():
+    model = FakeGenerativeModel(default="reply")
+    client = fake_client(model)
+    client.submit("prompt")
+    client.submit("prompt")
+    assert len(model.calls) == 2
+
+
+def test_submit_times_out():
+    client = fake_client(FakeGenerativeModel(default="late", delay=0.5))
+    with pytest.raises(TimeoutError):
+        client.submit("slow", timeout=0.05)
+    assert client.metrics()["timeouts"] == 1
+
+
+def test_stream_yields_the_whole_reply():
+    client = fake_client(FakeGenerativeModel(default="SELECT gender FROM t;"))
+    assert "".join(client.stream("prompt")) == "SELECT gender FROM t;"
+
+
+def test_stream_times_out():
+    client = fake_client(FakeGenerativeModel(default="late", delay=0.5))
+    with pytest.raises(TimeoutError):
+        list(client.stream("slow", timeout=0.05))
+
+
+def test_streams_count_against_max_concurrency():
+    model = FakeGenerativeModel(default="a b", delay=0.1)
+    client = fake_client(model, max_concurrency=1)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=lambda: list(client.stream("p"))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.perf_counter() - start >= 0.3
+
+
+def test_prefix_goes_through_the_context_cache():
+    model = FakeGenerativeModel(default="ok")
+    cache = FakeContextCache(lambda *_: model)
+    client = LLMClient(model_factory=lambda *_: model, context_cache=cache)
+    client.submit(AssembledPrompt("static prefix ", "question one"))
+    client.submit(AssembledPrompt("static prefix ", "question two"))
+    assert cache.created == ["static prefix "]
+    assert cache.hits == 1
+    assert model.calls == ["static prefix question one", "static prefix question two"]
+
+
+def test_generator_uses_the_process_client():
+    previous = get_llm_client()
+    model = FakeGenerativeModel(default="hello")
+    set_llm_client(fake_client(model))
+    try:
+        assert LLMResponseGenerator().submit_prompt("hi") == "hello"
+    finally:
+        set_llm_client(previous)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from local_vector_index import LocalVectorIndex
+
+WORDS = ["gender", "price", "mall", "date", "payment", "category", "quantity", "age"]
+
+
+class WordEmbeddings:
+    """
+    Embeds text as counts of a few column words; enough to tell the test columns apart.
+    """
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(text.lower().count(word)) for word in WORDS]
+
+
+def documents():
+    return [Document(page_content=f"The {word} column", metadata={"column": word}) for word in WORDS]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return LocalVectorIndex.build(documents(), WordEmbeddings(), str(tmp_path / "index"), kb_hash="v1", batch_size=3)
+
+
+def test_nearest_documents_come_first(index):
+    results = index.similarity_search("total price per shopping mall", k=2)
+    assert sorted(d.metadata["column"] for d in results) == ["mall", "price"]
+    assert index.similarity_search("payment method", k=1)[0].metadata["column"] == "payment"
+
+
+def test_scores_are_cosine_similarities(index):
+    (best, score), *_ = index.search_by_vector([0, 0, 0, 0, 0, 0, 0, 3.0], k=3)
+    assert index.documents[best].metadata["column"] == "age"
+    assert score == pytest.approx(1.0)
+    assert len(index.search_by_vector(np.ones(len(WORDS)), k=50)) == len(WORDS)
+
+
+def test_saved_index_is_memory_mapped(index, tmp_path):
+    embeddings = WordEmbeddings()
+    loaded = LocalVectorIndex.load(str(tmp_path / "index"), embeddings)
+    assert isinstance(loaded.matrix, np.memmap) and loaded.kb_hash == "v1"
+    assert [d.metadata for d in loaded.documents] == [d.metadata for d in index.documents]
+    assert loaded.similarity_search("gender", k=1)[0].metadata["column"] == "gender"
+    assert embeddings.embedded == 0  # loading does not re-embed the documents
+
+
+def test_missing_index_loads_as_none(tmp_path):
+    assert LocalVectorIndex.load(str(tmp_path / "none"), WordEmbeddings()) is None
+
+
+def test_empty_index_returns_nothing(tmp_path):
+    empty = LocalVectorIndex.build([], WordEmbeddings(), str(tmp_path / "empty"))
+    assert empty.similarity_search("price") == []
@@ -0,0 +1,78 @@
+import json
+import os
+import pytest
+from prompt_assembly import (PromptAssembler, AssembledPrompt, WatchedFile, INSTRUCTIONS, RESPONSE_GUIDELINES,
+                             DOC_LIST)
+
+EXAMPLES = [
+    {"question": "How many customers are female?", "sql": "SELECT COUNT(*) FROM customer_shopping_data WHERE gender = 'Female';"},
+    {"question": "Total quantity sold", "sql": "SELECT SUM(quantity) FROM customer_shopping_data;"},
+]
+
+
+@pytest.fixture
+def sample_file(tmp_path):
+    path = tmp_path / "sample_sql_query.json"
+    path.write_text(json.dumps(EXAMPLES))
+    return path
+
+
+def test_sections_are_in_order(sample_file):
+    prompt = PromptAssembler(sample_sql_path=str(sample_file)).build("Sales by mall?", ["col_a", "col_b"])
+    positions = [prompt.index(part) for part in (
+        INSTRUCTIONS, "===Table", "===Columns", "===Sample questions", "Question: Sales by mall?", RESPONSE_GUIDELINES,
+    )]
+    assert positions == sorted(positions)
+    assert "col_a\ncol_b\n" in prompt
+
+
+def test_prefix_is_static(sample_file):
+    assembler = PromptAssembler(sample_sql_path=str(sample_file))
+    first, second = assembler.build("one?", []), assembler.build("two?", [])
+    assert isinstance(first, AssembledPrompt)
+    assert first.prefix == second.prefix == assembler.static_prefix()
+    assert first == first.prefix + first.suffix
+    assert "one?" in first.suffix
+
+
+def test_doc_list_only_when_asked(sample_file):
+    assembler = PromptAssembler(sample_sql_path=str(sample_file))
+    assert DOC_LIST[0] not in assembler.build("q?", [])
+    prompt = assembler.build("q?", [], extra_docs=DOC_LIST)
+    assert prompt.index(DOC_LIST[0]) > prompt.index("===Sample questions")
+
+
+def test_explicit_examples_replace_the_file(sample_file):
+    prompt = PromptAssembler(sample_sql_path=str(sample_file)).build(
+        "q?", [], question_sql_list=[{"question": "Only this", "sql": "SELECT 2;"}])
+    assert "Only this" in prompt
+    assert EXAMPLES[0]["question"] not in prompt
+
+
+def test_examples_reload_when_the_file_changes(sample_file):
+    assembler = PromptAssembler(sample_sql_path=str(sample_file))
+    assert "New example" not in assembler.build("q?", [])
+    sample_file.write_text(json.dumps(EXAMPLES + [{"question": "New example", "sql": "SELECT 3;"}]))
+    os.utime(sample_file, ns=(0, 10 ** 18))
+    assert "New example" in assembler.build("q?", [])
+
+
+def test_watched_file_parses_once_per_content(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("[1]")
+    parses = []
+    watched = WatchedFile(str(path), parse=lambda raw: parses.append(raw) or json.loads(raw))
+    assert watched.get() == [1]
+    assert watched.get() == [1]
+    os.utime(path, ns=(0, 10 ** 18))  # touched but unchanged
+    assert watched.get() == [1]
+    assert len(parses) == 1
+
+
+def test_context_caching_only_when_the_prefix_is_large_enough():
+    # Vertex rejects cached contents below the minimum, so caching a shorter prefix does nothing
+    from llm_response_generator import CONTEXT_CACHING, CONTEXT_CACHE_MIN_TOKENS, VertexContextCache
+    prefix = PromptAssembler().static_prefix()
+    if len(prefix) // 4 < CONTEXT_CACHE_MIN_TOKENS:
+        assert not CONTEXT_CACHING
+        assert VertexContextCache().get_model("model", None, prefix) is None
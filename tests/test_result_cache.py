@@ -0,0 +1,116 @@
+import sqlite3
+import time
+import pandas as pd
+from result_cache import TableVersionProbe, ResultCache, normalise_sql
+
+
+def sqlite_connect(path):
+    return lambda: sqlite3.connect(str(path), check_same_thread=False)
+
+
+def make_table(path, rows):
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE IF NOT EXISTS t (x INTEGER)")
+    conn.execute("DELETE FROM t")
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class FixedProbe:
+    def __init__(self, version):
+        self._version = version
+
+    def version(self, force=False):
+        return self._version
+
+
+def test_probe_runs_in_the_background(tmp_path):
+    db = tmp_path / "db.sqlite"
+    make_table(db, 3)
+    probe = TableVersionProbe(sqlite_connect(db), probe_sql="SELECT COUNT(*) FROM t", interval=0.05)
+    assert probe.version() is None  # first probe started, nothing known yet
+    assert wait_for(lambda: probe.version() == "(3,)")
+    make_table(db, 5)
+    assert probe.version() == "(3,)" or probe.version() == "(5,)"  # last token served while re-probing
+    time.sleep(0.06)
+    probe.version()
+    assert wait_for(lambda: probe.version() == "(5,)")
+
+
+def test_probe_uses_the_fallback(tmp_path):
+    db = tmp_path / "db.sqlite"
+    make_table(db, 2)
+    probe = TableVersionProbe(sqlite_connect(db), probe_sql="SELECT nope FROM missing",
+                              fallback_sql="SELECT COUNT(*) FROM t")
+    assert probe.version(force=True) == "(2,)"
+
+
+def test_failed_probe_is_unknown(tmp_path):
+    probe = TableVersionProbe(sqlite_connect(tmp_path / "db.sqlite"), probe_sql="SELECT nope FROM missing",
+                              fallback_sql=None)
+    assert probe.version(force=True) is None
+
+
+def test_results_are_cached_per_version():
+    probe = FixedProbe("v1")
+    cache = ResultCache(probe)
+    runs = []
+
+    def run(sql, page):
+        runs.append((sql, page))
+        return pd.DataFrame({"a": [page]})
+    cache.get_or_run("SELECT a FROM t", run)
+    cache.get_or_run("select  a\nfrom t;", run)
+    assert len(runs) == 1
+    probe._version = "v2"
+    cache.get_or_run("SELECT a FROM t", run)
+    assert len(runs) == 2
+    assert cache.stats()["stale_evictions"] == 1
+
+
+def test_unknown_version_bypasses_the_cache():
+    cache = ResultCache(FixedProbe(None))
+    runs = []
+    run = lambda sql, page: runs.append(1) or pd.DataFrame({"a": [1]})
+    cache.get_or_run("SELECT a FROM t", run)
+    cache.get_or_run("SELECT a FROM t", run)
+    assert len(runs) == 2
+
+
+def test_errors_are_not_cached():
+    cache = ResultCache(FixedProbe("v1"))
+    assert cache.get_or_run("SELECT a FROM t", lambda sql, page: "SQL Server error: boom") == "SQL Server error: boom"
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_expire_after_the_ttl():
+    cache = ResultCache(FixedProbe("v1"), ttl=0.01)
+    runs = []
+    run = lambda sql, page: runs.append(1) or pd.DataFrame({"a": [1]})
+    cache.get_or_run("SELECT a FROM t", run)
+    time.sleep(0.02)
+    cache.get_or_run("SELECT a FROM t", run)
+    assert len(runs) == 2
+
+
+def test_evict_drops_every_page_of_one_query():
+    cache = ResultCache(FixedProbe("v1"))
+    run = lambda sql, page: pd.DataFrame({"a": [page]})
+    cache.get_or_run("SELECT a FROM t", run)
+    cache.get_or_run("SELECT a FROM t", run, page=1)
+    cache.get_or_run("SELECT b FROM t", run)
+    cache.evict("select a from t")
+    assert cache.stats()["entries"] == 1
+
+
+def test_normalise_sql():
+    assert normalise_sql("select  x -- note\nfrom t where y = 1.50;") == "SELECT x FROM t WHERE y = 1.5"
+    assert normalise_sql("SELECT 'A  b' FROM t") == "SELECT 'A  b' FROM t"
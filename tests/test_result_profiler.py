@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from result_profiler import profile_dataframe, partial_result_note, estimate_tokens
+
+
+def sales(rows):
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({
+        "category": rng.choice(["Shoes", "Books", "Toys", "Clothing", "Cosmetics", "Technology", "Food"], rows),
+        "price": rng.uniform(5, 500, rows).round(2),
+        "quantity": rng.integers(1, 6, rows),
+    })
+
+
+def test_small_results_are_sent_in_full():
+    df = sales(10)
+    assert profile_dataframe(df) == df.to_markdown()
+
+
+def test_large_results_are_summarised_within_budget():
+    df = sales(50000)
+    digest = profile_dataframe(df, token_budget=500)
+    assert estimate_tokens(digest) <= 500 + 10
+    assert digest.startswith("50000 rows x 3 columns")
+    assert "Numeric columns:" in digest and "- category:" in digest
+
+
+def test_detail_is_dropped_before_truncating():
+    df = sales(5000)
+    roomy, tight = profile_dataframe(df, token_budget=2000), profile_dataframe(df, token_budget=250)
+    assert "First 5 rows" in roomy
+    assert "First 5 rows" not in tight and "(truncated)" not in tight
+    assert "Numeric columns:" in tight and estimate_tokens(tight) <= 250
+
+
+def test_partial_results_are_flagged():
+    df = sales(1000)
+    df.attrs.update(page=0, page_size=1000, total_rows=2500)
+    assert "only part of the query result" in partial_result_note(df)
+    assert profile_dataframe(df).startswith("Note: this is only part")
+    assert partial_result_note(sales(5)) == ""
@@ -0,0 +1,40 @@
+import sqlite3
+import pandas as pd
+import pytest
+from result_reader import read_frame
+
+
+@pytest.fixture
+def cursor():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (category TEXT, quantity INTEGER, price REAL)")
+    categories = ["Shoes", "Books", "Toys", "Clothing"]
+    conn.executemany("INSERT INTO t VALUES (?, ?, ?)",
+                     [(categories[i // 5 % 4], i % 3, i * 1.26) for i in range(20)])
+    yield conn.execute("SELECT category, quantity, price FROM t ORDER BY rowid")
+    conn.close()
+
+
+def test_reads_in_chunks_and_types_columns(cursor):
+    df, truncated, peak_bytes = read_frame(cursor, 100, chunk_size=3)
+    assert len(df) == 20 and not truncated and peak_bytes is None
+    # Chunks saw different categories, but the column stays categorical
+    assert isinstance(df["category"].dtype, pd.CategoricalDtype)
+    assert list(df["category"].iloc[[0, 5, 10, 15]]) == ["Shoes", "Books", "Toys", "Clothing"]
+    assert df["quantity"].dtype == "int8"
+    assert df["price"].tolist()[:3] == [0.0, 1.3, 2.5]
+
+
+def test_stops_at_max_rows(cursor):
+    df, truncated, _ = read_frame(cursor, 7, chunk_size=5)
+    assert len(df) == 7 and truncated
+
+
+def test_nothing_fetched_for_zero_rows(cursor):
+    df, truncated, _ = read_frame(cursor, 0)
+    assert df.empty and list(df.columns) == ["category", "quantity", "price"] and not truncated
+
+
+def test_memory_is_measured_only_when_profiling(cursor):
+    df, _, peak_bytes = read_frame(cursor, 100, chunk_size=4, profile=True)
+    assert peak_bytes >= df.memory_usage(deep=True).sum()
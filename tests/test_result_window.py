@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+from result_window import page_sql, count_sql, is_pageable
+from sql_backends import translate_tsql
+
+GROUPED = "SELECT category, SUM(price) FROM customer_shopping_data GROUP BY category"
+
+
+def test_grouped_query_is_ordered_by_its_key():
+    assert page_sql(GROUPED, offset=10, limit=5) == (
+        GROUPED + " ORDER BY category OFFSET 10 ROWS FETCH NEXT 5 ROWS ONLY"
+    )
+
+
+def test_own_order_gets_tiebreak_only_when_missing():
+    sql = "SELECT category, SUM(price) AS s FROM customer_shopping_data GROUP BY category ORDER BY s DESC;"
+    assert page_sql(sql).startswith(sql.rstrip(";") + ", category OFFSET 0 ROWS")
+    sql = "SELECT category, SUM(price) AS s FROM customer_shopping_data GROUP BY category ORDER BY category"
+    assert page_sql(sql).startswith(sql + " OFFSET 0 ROWS")
+    sql = "SELECT gender, price FROM customer_shopping_data AS c ORDER BY price DESC"
+    assert page_sql(sql).startswith(sql + ", c.invoice_no OFFSET 0 ROWS")
+
+
+def test_row_query_is_ordered_by_table_key():
+    sql = "SELECT gender, price FROM customer_shopping_data WHERE price > 10"
+    assert page_sql(sql).startswith(sql + " ORDER BY invoice_no OFFSET")
+
+
+def test_unknown_order_is_left_to_the_server():
+    for sql in ("SELECT SUM(price) FROM customer_shopping_data",
+                "SELECT x FROM (SELECT price AS x FROM customer_shopping_data) AS q",
+                "SELECT a FROM t GROUP BY ROLLUP(a)"):
+        assert " ORDER BY (SELECT NULL) OFFSET " in page_sql(sql)
+
+
+def test_top_and_non_select_are_not_paged():
+    sql = "SELECT TOP 5 category FROM customer_shopping_data ORDER BY price DESC"
+    assert not is_pageable(sql) and page_sql(sql) == sql
+    assert page_sql("DELETE FROM customer_shopping_data") == "DELETE FROM customer_shopping_data"
+
+
+def test_count_names_unnamed_columns():
+    assert count_sql(GROUPED + " ORDER BY 2 DESC") == (
+        f"SELECT COUNT_BIG(*) AS total_rows FROM ({GROUPED}) AS counted(c1, c2)"
+    )
+    sql = "WITH c AS (SELECT category FROM t) SELECT category, COUNT(*) FROM c GROUP BY category"
+    assert count_sql(sql).startswith("WITH c AS (SELECT category FROM t) SELECT COUNT_BIG(*)")
+    assert count_sql("DROP TABLE t") is None
+
+
+@pytest.fixture
+def duck():
+    duckdb = pytest.importorskip("duckdb")
+    pytest.importorskip("sqlglot")
+    connection = duckdb.connect()
+    frame = pd.DataFrame({
+        "invoice_no": [f"I{i:03d}" for i in range(50)],
+        "category": [["Shoes", "Books", "Toys"][i % 3] for i in range(50)],
+        "price": [float(i % 7) for i in range(50)],
+    })
+    connection.register("customer_shopping_data", frame)
+    yield connection
+    connection.close()
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT category, price FROM customer_shopping_data ORDER BY price DESC",
+    "SELECT invoice_no, price FROM customer_shopping_data",
+    "SELECT category, price, SUM(price) FROM customer_shopping_data GROUP BY category, price",
+])
+def test_pages_cover_the_result_once(duck, sql):
+    full = duck.execute(translate_tsql(sql)).fetchall()
+    pages = []
+    for offset in range(0, len(full), 8):
+        pages += duck.execute(translate_tsql(page_sql(sql, offset=offset, limit=8))).fetchall()
+    assert sorted(pages) == sorted(full)
+    assert duck.execute(translate_tsql(count_sql(sql))).fetchone()[0] == len(full)
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+import pytest
+from rollups import plan_query, execute_plan, build_cubes, RollupStore, ROLLUP_SQL
+from sql_backends import translate_tsql
+
+
+def shopping_frame(rows=300):
+    rng = np.random.default_rng(7)
+    return pd.DataFrame({
+        "invoice_no": [f"I{i:04d}" for i in range(rows)],
+        "gender": rng.choice(["Female", "Male"], rows),
+        "age": rng.integers(18, 70, rows),
+        "category": rng.choice(["Clothing", "Shoes", "Books", "Toys"], rows),
+        "quantity": rng.integers(1, 6, rows),
+        "price": rng.uniform(5, 500, rows).round(2),
+        "payment_method": rng.choice(["Cash", "Credit Card", "Debit Card"], rows),
+        "invoice_date": pd.Timestamp("2022-01-01") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D"),
+        "shopping_mall": rng.choice(["Kanyon", "Metrocity", "Forum Istanbul"], rows),
+    })
+
+
+@pytest.fixture(scope="module")
+def duck():
+    duckdb = pytest.importorskip("duckdb")
+    pytest.importorskip("sqlglot")
+    connection = duckdb.connect()
+    connection.register("customer_shopping_data", shopping_frame())
+    yield connection
+    connection.close()
+
+
+@pytest.fixture(scope="module")
+def cubes(duck):
+    return build_cubes(duck.execute(translate_tsql(ROLLUP_SQL)).df())
+
+
+def direct(duck, sql):
+    df = duck.execute(translate_tsql(sql)).df()
+    # DuckDB returns DATE columns as datetime64; SQL Server through pyodbc returns datetime.date
+    for column in df.select_dtypes(include=["datetime"]).columns:
+        df[column] = df[column].dt.date
+    return df
+
+
+def assert_same(routed, expected, ordered):
+    routed = routed.astype(object).set_axis(range(routed.shape[1]), axis=1)
+    expected = expected.astype(object).set_axis(range(expected.shape[1]), axis=1)
+    if not ordered:
+        routed = routed.sort_values(list(routed.columns)).reset_index(drop=True)
+        expected = expected.sort_values(list(expected.columns)).reset_index(drop=True)
+    # Routed numbers are rounded to one decimal place like run_sql's
+    expected = expected.apply(lambda column: column.map(lambda v: round(v, 1) if isinstance(v, float) else v))
+    pd.testing.assert_frame_equal(routed.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False, check_exact=False, atol=0.051)
+
+
+@pytest.mark.parametrize("sql, ordered", [
+    ("SELECT category, SUM(price) AS revenue FROM customer_shopping_data GROUP BY category", False),
+    ("SELECT shopping_mall, COUNT(*) FROM customer_shopping_data "
+     "WHERE gender = 'Female' AND category IN ('Shoes', 'Books') GROUP BY shopping_mall", False),
+    ("SELECT YEAR(invoice_date) AS yr, MAX(price), MIN(quantity) FROM customer_shopping_data "
+     "WHERE payment_method <> 'Cash' GROUP BY YEAR(invoice_date)", False),
+    ("SELECT TOP 2 category, SUM(quantity) AS units FROM customer_shopping_data "
+     "GROUP BY category ORDER BY units DESC", True),
+    ("SELECT FORMAT(invoice_date, 'yyyy-MM') AS month, SUM(price * quantity) FROM customer_shopping_data "
+     "WHERE FORMAT(invoice_date, 'yyyy-MM') BETWEEN '2022-03' AND '2022-08' GROUP BY FORMAT(invoice_date, 'yyyy-MM') ORDER BY 1", True),
+    ("SELECT AVG(price) FROM customer_shopping_data WHERE YEAR(invoice_date) = 2023", True),
+    ("SELECT CAST(invoice_date AS DATE) AS d, COUNT(*) FROM customer_shopping_data "
+     "WHERE CAST(invoice_date AS DATE) >= '2023-12-01' GROUP BY CAST(invoice_date AS DATE)", False),
+])
+def test_routed_answer_matches_direct_query(duck, cubes, sql, ordered):
+    plan = plan_query(sql)
+    assert plan is not None
+    assert_same(execute_plan(plan, cubes), direct(duck, sql), ordered)
+
+
+def test_integer_average_is_truncated_like_sql_server(duck, cubes):
+    routed = execute_plan(plan_query("SELECT gender, AVG(age) FROM customer_shopping_data GROUP BY gender"), cubes)
+    expected = direct(duck, "SELECT gender, CAST(FLOOR(AVG(age)) AS INT) FROM customer_shopping_data GROUP BY gender")
+    assert_same(routed, expected, ordered=False)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT category, COUNT(DISTINCT gender) FROM customer_shopping_data GROUP BY category",
+    "SELECT category, STDEV(price) FROM customer_shopping_data GROUP BY category",
+    "SELECT category, SUM(price) FROM customer_shopping_data GROUP BY category HAVING SUM(price) > 10",
+    "SELECT category, SUM(price) FROM customer_shopping_data WHERE price > 100 GROUP BY category",
+    "SELECT category, SUM(price) FROM customer_shopping_data WHERE category LIKE 'Sh%' GROUP BY category",
+    "SELECT TOP 10 PERCENT category, SUM(price) FROM customer_shopping_data GROUP BY category",
+    "SELECT invoice_no, price FROM customer_shopping_data",
+    # A bare datetime compared with a date is not the same filter as on the day cube
+    "SELECT category, COUNT(*) FROM customer_shopping_data WHERE invoice_date < '2023-01-01' GROUP BY category",
+    "SELECT c.category, SUM(c.price) FROM customer_shopping_data c JOIN other o ON 1 = 1 GROUP BY c.category",
+])
+def test_unsupported_queries_fall_through(sql):
+    assert plan_query(sql) is None
+
+
+class FakeProbe:
+    def __init__(self, version):
+        self.current = version
+
+    def version(self, force=False):
+        return self.current
+
+
+def test_stale_cubes_are_not_used(tmp_path, cubes, monkeypatch):
+    probe = FakeProbe("v1")
+    store = RollupStore(probe, connect=lambda: None, path=str(tmp_path))
+    store.cubes, store.version = cubes, "v1"
+    refreshes = []
+    monkeypatch.setattr(store, "refresh_async", lambda: refreshes.append(True))
+    sql = "SELECT category, COUNT(*) FROM customer_shopping_data GROUP BY category"
+
+    df = store.answer(sql)
+    assert df is not None and df.attrs["source"] == "rollup" and df.attrs["total_rows"] == 4
+
+    probe.current = "v2"
+    assert store.answer(sql) is None
+    assert refreshes and store.stats()["stale"] == 1
+    assert store.answer("SELECT invoice_no FROM customer_shopping_data") is None
+    assert store.stats()["not_routable"] == 1
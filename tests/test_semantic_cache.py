@@ -0,0 +1,86 @@
+import time
+from semantic_cache import SemanticCache, literals_match, question_literals
+
+SUM_SQL = "SELECT category, SUM(quantity) FROM customer_shopping_data GROUP BY category;"
+
+
+def same_vector_cache(**kwargs):
+    # Every question embeds identically, so only the literal guard tells them apart
+    return SemanticCache(embed_fn=lambda question: [1.0, 0.0], path=None, **kwargs)
+
+
+def test_paraphrase_is_a_hit():
+    cache = same_vector_cache()
+    cache.store("What were total sales in 2022?", "SQL 2022")
+    assert cache.lookup("Total sales in 2022") == "SQL 2022"
+    assert cache.lookup("what is the sum of sales in 2022") == "SQL 2022"
+
+
+def test_different_numbers_miss():
+    cache = same_vector_cache()
+    cache.store("Sales in 2022", "SQL 2022")
+    cache.store("top 5 malls by revenue", "SQL top 5")
+    assert cache.lookup("sales in 2023") is None
+    assert cache.lookup("top 10 malls by revenue") is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_different_aggregate_misses():
+    assert not literals_match("What is the average quantity sold per category?",
+                              "What is the total quantity sold per category?", SUM_SQL)
+    cache = same_vector_cache()
+    cache.store("What is the total quantity sold per category?", SUM_SQL)
+    assert cache.lookup("What is the average quantity sold per category?") is None
+    assert cache.lookup("What is the mean quantity sold per category?") is None
+
+
+def test_different_measure_or_grouping_misses():
+    assert not literals_match("total price per category", "total quantity per category")
+    assert not literals_match("total quantity per mall", "total quantity per category")
+    assert literals_match("total quantity per categories", "Total quantity for each category")
+
+
+def test_names_and_sql_values_must_match():
+    assert not literals_match("total sales in Metrocity", "total sales in Kanyon")
+    kanyon_sql = "SELECT SUM(price) FROM customer_shopping_data WHERE shopping_mall = 'Kanyon';"
+    assert not literals_match("total sales in metrocity", "total sales in kanyon", kanyon_sql)
+    assert literals_match("How much was spent with credit cards", "How much was spent using credit card",
+                          "SELECT SUM(price) FROM t WHERE payment_method = 'Credit Card';")
+
+
+def test_gender_and_months_must_match():
+    assert not literals_match("Spending by female customers", "spending by male customers")
+    assert not literals_match("sales in March", "sales in April")
+    assert question_literals("Sales by 'Credit Card'")[0] == {"credit card"}
+
+
+def test_next_best_candidate_is_used():
+    cache = same_vector_cache()
+    cache.store("sales in 2022", "SQL 2022")
+    cache.store("sales in 2023", "SQL 2023")
+    assert cache.lookup("Sales in 2023?") == "SQL 2023"
+
+
+def test_entries_expire_and_are_evicted():
+    cache = same_vector_cache(max_entries=2, ttl=0.05)
+    for year in (2020, 2021, 2022):
+        cache.store(f"sales in {year}", f"SQL {year}")
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup("sales in 2020") is None
+    time.sleep(0.06)
+    assert cache.lookup("sales in 2022") is None
+
+
+def test_get_or_compute_stores_only_accepted_values():
+    cache = same_vector_cache()
+    calls = []
+    compute = lambda question: calls.append(question) or "Error: nope"
+    cache.get_or_compute("q1", compute, should_store=lambda v: not v.startswith("Error"))
+    cache.get_or_compute("q1", compute, should_store=lambda v: not v.startswith("Error"))
+    assert len(calls) == 2
+
+
+def test_persists_to_disk(tmp_path):
+    path = str(tmp_path / "cache.json")
+    SemanticCache(embed_fn=lambda q: [1.0, 0.0], path=path).store("sales in 2022", "SQL 2022")
+    assert SemanticCache(embed_fn=lambda q: [1.0, 0.0], path=path).lookup("sales in 2022") == "SQL 2022"
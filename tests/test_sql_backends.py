@@ -0,0 +1,106 @@
+import sys
+import threading
+import time
+import pandas as pd
+import pytest
+import sql_backends
+from sql_backends import TableSnapshot, LocalSnapshotBackend, translate_tsql, _rewrite_tsql
+
+
+@pytest.fixture
+def without_sqlglot(monkeypatch):
+    # translate_tsql falls back to the built-in rewrites when sqlglot cannot be imported
+    monkeypatch.setitem(sys.modules, "sqlglot", None)
+
+
+def sample_frame():
+    return pd.DataFrame({
+        "invoice_no": ["I1", "I2", "I3", "I4"],
+        "gender": ["Female", "Male", "Female", "Male"],
+        "category": ["Shoes", "Books", "Shoes", "Clothing"],
+        "quantity": [1, 2, 3, 4],
+        "price": [10.5, 20.0, 30.0, 40.0],
+        "shopping_mall": ["Kanyon", "Metrocity", "Kanyon", "Kanyon"],
+        "invoice_date": pd.to_datetime(["2022-01-05", "2022-02-10", "2023-01-07", "2023-03-01"]),
+    })
+
+
+def test_rewrite_top_and_brackets():
+    sql = "SELECT TOP 5 [category], COUNT_BIG(*) AS n FROM customer_shopping_data GROUP BY [category] ORDER BY n DESC"
+    assert _rewrite_tsql(sql) == (
+        'SELECT "category", COUNT(*) AS n FROM customer_shopping_data GROUP BY "category" ORDER BY n DESC LIMIT 5'
+    )
+
+
+def test_rewrite_offset_fetch():
+    sql = "SELECT * FROM t ORDER BY 1 OFFSET 1000 ROWS FETCH NEXT 1000 ROWS ONLY"
+    assert _rewrite_tsql(sql) == "SELECT * FROM t ORDER BY 1 LIMIT 1000 OFFSET 1000"
+
+
+def test_rewrite_float_is_double():
+    assert _rewrite_tsql("SELECT CAST(price AS FLOAT) FROM t") == "SELECT CAST(price AS DOUBLE PRECISION) FROM t"
+    assert _rewrite_tsql("SELECT CAST(price AS FLOAT(53)) FROM t") == "SELECT CAST(price AS DOUBLE PRECISION) FROM t"
+    assert _rewrite_tsql("SELECT CAST(price AS FLOAT(24)) FROM t") == "SELECT CAST(price AS REAL) FROM t"
+
+
+def test_rewrite_keeps_literals():
+    sql = "SELECT * FROM t WHERE category = N'float [x] TOP 1'"
+    assert _rewrite_tsql(sql) == "SELECT * FROM t WHERE category = 'float [x] TOP 1'"
+
+
+def test_rewrite_date_functions():
+    sql = "SELECT DATEPART(year, invoice_date), DATENAME(month, invoice_date) FROM t"
+    assert _rewrite_tsql(sql) == "SELECT date_part('year', invoice_date), monthname(invoice_date) FROM t"
+
+
+def test_translate_drops_unstable_order(without_sqlglot):
+    sql = "SELECT * FROM t ORDER BY (SELECT NULL) OFFSET 0 ROWS FETCH NEXT 10 ROWS ONLY;"
+    assert translate_tsql(sql) == "SELECT * FROM t LIMIT 10 OFFSET 0"
+
+
+def test_translate_float_with_sqlglot():
+    pytest.importorskip("sqlglot")
+    assert "DOUBLE" in translate_tsql("SELECT CAST(price AS FLOAT) FROM t")
+
+
+def test_snapshot_write(tmp_path):
+    snapshot = TableSnapshot(connect=lambda: None, path=str(tmp_path))
+    assert snapshot.built_at() is None
+    snapshot.write(sample_frame())
+    assert snapshot.built_at() is not None
+    assert pd.read_parquet(snapshot.parquet_path).equals(sample_frame())
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["customer_shopping_data.parquet", "meta.json"]
+
+
+def test_snapshot_first_build_runs_once(tmp_path, monkeypatch):
+    snapshot = TableSnapshot(connect=lambda: None, path=str(tmp_path))
+    builds = []
+
+    def slow_refresh():
+        builds.append(1)
+        time.sleep(0.1)
+        snapshot.write(sample_frame())
+    monkeypatch.setattr(snapshot, "refresh", slow_refresh)
+
+    threads = [threading.Thread(target=snapshot.ensure) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+
+
+def test_local_backend_runs_translated_tsql(tmp_path, without_sqlglot):
+    pytest.importorskip("duckdb")
+    snapshot = TableSnapshot(connect=lambda: None, path=str(tmp_path))
+    snapshot.write(sample_frame())
+    backend = LocalSnapshotBackend(snapshot)
+    conn = backend.connect()
+    assert conn is not None
+    sql = (
+        "SELECT TOP 1 [shopping_mall], SUM(CAST(quantity AS FLOAT) / 3) AS q FROM dbo.customer_shopping_data "
+        "WHERE gender = 'female' AND DATEPART(year, invoice_date) = 2022 GROUP BY [shopping_mall] ORDER BY q DESC"
+    )
+    rows = conn.execute(backend.translate(sql)).fetchall()
+    conn.close()
+    assert rows == [("Kanyon", pytest.approx(1 / 3))]
@@ -0,0 +1,96 @@
+from sql_validation import validate_sql, fix_dialect, validate_and_repair, get_schema_catalogue
+
+CATALOGUE = {"customer_shopping_data": {"invoice_no", "gender", "category", "quantity", "price", "invoice_date",
+                                        "shopping_mall", "payment_method", "age", "customer_id"}}
+
+
+def extract_sql(text):
+    return text
+
+
+class FakeLLM:
+    def __init__(self, reply):
+        self.reply = reply
+        self.prompts = []
+
+    def submit_prompt(self, prompt):
+        self.prompts.append(prompt)
+        return self.reply
+
+
+def test_valid_select_passes():
+    sql = ("SELECT TOP 5 shopping_mall, SUM(quantity * price) AS [revenue] FROM customer_shopping_data "
+           "WHERE YEAR(CAST(invoice_date AS DATE)) = 2022 GROUP BY shopping_mall ORDER BY [revenue] DESC;")
+    assert validate_sql(sql, CATALOGUE) == []
+
+
+def test_cte_and_aliases_are_known():
+    sql = ("WITH totals AS (SELECT gender, COUNT(*) AS n FROM customer_shopping_data c GROUP BY gender) "
+           "SELECT t.gender, t.n FROM totals t;")
+    assert validate_sql(sql, CATALOGUE) == []
+
+
+def test_empty_and_multiple_statements():
+    assert validate_sql("  ") == ["The query is empty."]
+    assert validate_sql("SELECT 1; SELECT 2;")[0].startswith("Expected exactly one SQL statement")
+
+
+def test_writes_are_rejected():
+    problems = validate_sql("DELETE FROM customer_shopping_data;")
+    assert any("Only SELECT" in p for p in problems)
+    assert any("DELETE is not allowed" in p for p in problems)
+
+
+def test_mysql_syntax_is_reported():
+    problems = validate_sql("SELECT `gender` FROM customer_shopping_data LIMIT 5;")
+    assert any("LIMIT" in p for p in problems)
+    assert any("Backtick" in p for p in problems)
+
+
+def test_unknown_names_are_reported():
+    problems = validate_sql("SELECT revenue FROM sales;", CATALOGUE)
+    assert "Unknown table sales." in problems
+    assert "Unknown column revenue." in problems
+
+
+def test_fix_dialect():
+    assert fix_dialect("SELECT `gender` FROM t;;  ") == "SELECT [gender] FROM t;"
+
+
+def test_repair_is_skipped_for_valid_sql():
+    llm = FakeLLM("unused")
+    sql, problems = validate_and_repair("q", "SELECT gender FROM customer_shopping_data;", llm, extract_sql, CATALOGUE)
+    assert problems == []
+    assert llm.prompts == []
+
+
+def test_one_repair_round():
+    llm = FakeLLM("SELECT gender FROM customer_shopping_data;")
+    sql, problems = validate_and_repair("q", "SELECT sex FROM customer_shopping_data;", llm, extract_sql, CATALOGUE)
+    assert (sql, problems) == ("SELECT gender FROM customer_shopping_data;", [])
+    assert len(llm.prompts) == 1
+    assert "Unknown column sex." in llm.prompts[0]
+
+
+def test_knowledge_base_catalogue_has_the_table():
+    catalogue = get_schema_catalogue()
+    assert "gender" in catalogue["customer_shopping_data"]
+
+
+def test_dialect_slips_are_fixed_without_the_llm():
+    llm = FakeLLM("unused")
+    sql, problems = validate_and_repair("q", "SELECT `gender` FROM customer_shopping_data;;", llm, extract_sql, CATALOGUE)
+    assert (sql, problems) == ("SELECT [gender] FROM customer_shopping_data;", [])
+    assert llm.prompts == []
+
+
+def test_failed_repair_is_not_retried():
+    llm = FakeLLM("SELECT still_wrong FROM customer_shopping_data;")
+    sql, problems = validate_and_repair("q", "SELECT sex FROM customer_shopping_data;", llm, extract_sql, CATALOGUE)
+    assert problems == ["Unknown column still_wrong."]
+    assert len(llm.prompts) == 1
+
+
+def test_literals_are_not_checked_as_names():
+    sql = "SELECT COUNT(*) FROM customer_shopping_data WHERE category = 'LIMIT delete `x`';"
+    assert validate_sql(sql, CATALOGUE) == []
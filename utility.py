@@ -1,22 +1,43 @@
 import pyodbc
 import json
-import os
+import threading
 from pathlib import Path
 from langchain_core.documents import Document
-def create_sql_connection():
+from connection_pool import ConnectionPool
+
+SQL_CONN_STR = (
+    r'DRIVER={ODBC Driver 17 for SQL Server};'
+    r'SERVER=IN-MANISH-KUMAR\SQLEXPRESS;'
+    r'DATABASE=CustomerShopping;'
+    r'Trusted_Connection=yes;'
+)
+
+_sql_pool = None
+_sql_pool_lock = threading.Lock()
+
+def _connect_sql_server():
+    return pyodbc.connect(SQL_CONN_STR)
+
+def get_sql_pool(factory=None):
     """
-    Connects to the SQL Server database and returns the connection object.
+    Returns the process-wide SQL connection pool, creating it on first use.
+    Pass `factory` (e.g. lambda: sqlite3.connect(path)) to back the pool with another database.
+    """
+    global _sql_pool
+    with _sql_pool_lock:
+        if _sql_pool is None or factory is not None:
+            if _sql_pool is not None:
+                _sql_pool.close_all()
+            _sql_pool = ConnectionPool(factory or _connect_sql_server)
+        return _sql_pool
+
+def create_sql_connection(timeout=None):
+    """
+    Checks out a pooled connection to the SQL Server database and returns it.
+    Calling close() on the returned connection hands it back to the pool.
     """
     try:
-        conn_str = (
-            r'DRIVER={ODBC Driver 17 for SQL Server};'
-            r'SERVER=IN-MANISH-KUMAR\SQLEXPRESS;'
-            r'DATABASE=CustomerShopping;'
-            r'Trusted_Connection=yes;'
-        )
-        # Return the connection object, not the cursor
-        conn = pyodbc.connect(conn_str)
-        return conn
+        return get_sql_pool().acquire(timeout=timeout)
     except Exception as e:
         print("Error connecting to database:", e)
         return None
@@ -46,8 +67,6 @@ def create_opensearch_client():
     except Exception as e:
         print(f"Error connecting to OpenSearch: {e}")
         return None
-    
-create_opensearch_client()
 
 def apply_jq_schema(json_data, jq_schema='.'): 
     data = json.loads(json_data)